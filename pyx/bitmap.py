@@ -20,7 +20,7 @@
 # along with PyX; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
 
-import binascii, logging, struct, io
+import base64, binascii, hashlib, logging, math, struct, io
 try:
     import zlib
     haszlib = True
@@ -40,57 +40,127 @@ decodestrings = {"L": "[0 1]",
                  "P": "[0 255]"}
 
 
+# number of bytes encoded in a single line
+_ascii85linelength = 60
+_asciihexlinelength = 32
+
+# number of bytes passed to the encoders at once by the stream functions
+_blocksize = 1 << 20
+
+# number of most recently used image data kept in the imagedatacache of a
+# writer, keyed by the digest of the image and the interleavealpha argument
+# of bitmap_trafo.imagedata
+_imagedatacachesize = 16
+
+# number of most recently resampled images kept in the resampledcache of a
+# writer, keyed by the digest of the original image, the target size, and
+# the filter
+_resampledcachesize = 16
+
+
+def _lrucached(cache, size, key, function):
+    """return the result of function cached in the dictionary cache
+
+    The size most recently used results are kept in the cache."""
+    try:
+        result = cache.pop(key)
+    except KeyError:
+        result = function()
+        if len(cache) >= size:
+            del cache[next(iter(cache))]
+    cache[key] = result
+    return result
+
+
 def ascii85lines(datalen):
     if datalen < 4:
         return 1
-    return (datalen + 56)/60
+    return (datalen + _ascii85linelength - 4)//_ascii85linelength
+
+
+class ascii85encoder:
+
+    """streaming ASCII85 encoder
+
+    The data passed to the write method is encoded in bulk and written
+    to the stream file in lines of 75 characters (60 bytes of input data).
+    Groups of four zero bytes are not abbreviated by "z", so that the
+    number of lines written is known just from the length of the data by
+    means of the ascii85lines function. Note that the close method does not
+    add the tailing newline character of the last line, but it is taken into
+    account in the ascii85lines function."""
+
+    def __init__(self, file):
+        self.file = file
+        self.pending = b""
+        self.lines = 0
+
+    def write(self, data):
+        data = self.pending + bytes(data)
+        full = len(data) - len(data) % _ascii85linelength
+        if full:
+            encoded = base64.a85encode(data[:full]).replace(b"z", b"!!!!!")
+            if self.lines:
+                self.file.write("\n")
+            linelength = _ascii85linelength//4*5
+            self.file.write_bytes(b"\n".join([encoded[i:i+linelength] for i in range(0, len(encoded), linelength)]))
+            self.lines += full//_ascii85linelength
+        self.pending = data[full:]
+
+    def close(self):
+        if self.pending:
+            # a final incomplete group is appended to the last line
+            if self.lines and len(self.pending) >= 4:
+                self.file.write("\n")
+            self.file.write_bytes(base64.a85encode(self.pending).replace(b"z", b"!!!!!"))
+            self.pending = b""
+
 
 def ascii85stream(file, data):
     """Encodes the string data in ASCII85 and writes it to
-    the stream file. The number of lines written to the stream
-    is known just from the length of the data by means of the
-    ascii85lines function. Note that the tailing newline character
-    of the last line is not added by this function, but it is taken
-    into account in the ascii85lines function."""
-    i = 3 # go on smoothly in case of data length equals zero
-    l = 0
-    l = [None, None, None, None]
-    for i in range(len(data)):
-        c = data[i]
-        l[i%4] = c
-        if i%4 == 3:
-            if i%60 == 3 and i != 3:
-                file.write("\n")
-            if l:
-                # instead of
-                # l[3], c5 = divmod(256*256*256*l[0]+256*256*l[1]+256*l[2]+l[3], 85)
-                # l[2], c4 = divmod(l[3], 85)
-                # we have to avoid number > 2**31 by
-                l[3], c5 = divmod(256*256*l[0]+256*256*l[1]+256*l[2]+l[3], 85)
-                l[2], c4 = divmod(256*256*3*l[0]+l[3], 85)
-                l[1], c3 = divmod(l[2], 85)
-                c1  , c2 = divmod(l[1], 85)
-                file.write_bytes(struct.pack("BBBBB", c1+33, c2+33, c3+33, c4+33, c5+33))
-            else:
-                file.write("z")
-    if i%4 != 3:
-        for j in range((i%4) + 1, 4):
-            l[j] = 0
-        l[3], c5 = divmod(256*256*l[0]+256*256*l[1]+256*l[2]+l[3], 85)
-        l[2], c4 = divmod(256*256*3*l[0]+l[3], 85)
-        l[1], c3 = divmod(l[2], 85)
-        c1  , c2 = divmod(l[1], 85)
-        file.write_bytes(struct.pack("BBBB", c1+33, c2+33, c3+33, c4+33)[:(i%4)+2])
-
-_asciihexlinelength = 64
+    the stream file (see ascii85encoder)."""
+    data = memoryview(data)
+    encoder = ascii85encoder(file)
+    for i in range(0, len(data), _blocksize):
+        encoder.write(data[i:i+_blocksize])
+    encoder.close()
+
+
 def asciihexlines(datalen):
-    return (datalen*2 + _asciihexlinelength - 1) / _asciihexlinelength
+    return (datalen + _asciihexlinelength - 1)//_asciihexlinelength
+
+
+class asciihexencoder:
+
+    """streaming ASCIIHex encoder
+
+    The data passed to the write method is encoded in bulk and written
+    to the stream file in lines of 64 characters (32 bytes of input data),
+    each being terminated by a newline character."""
+
+    def __init__(self, file):
+        self.file = file
+        self.pending = b""
+
+    def write(self, data):
+        data = self.pending + bytes(data)
+        full = len(data) - len(data) % _asciihexlinelength
+        if full:
+            self.file.write_bytes(binascii.b2a_hex(data[:full], b"\n", -_asciihexlinelength) + b"\n")
+        self.pending = data[full:]
+
+    def close(self):
+        if self.pending:
+            self.file.write_bytes(binascii.b2a_hex(self.pending) + b"\n")
+            self.pending = b""
+
 
 def asciihexstream(file, data):
-    hexdata = binascii.b2a_hex(data)
-    for i in range((len(hexdata)-1)/_asciihexlinelength + 1):
-        file.write(hexdata[i*_asciihexlinelength: i*_asciihexlinelength+_asciihexlinelength])
-        file.write("\n")
+    data = memoryview(data)
+    encoder = asciihexencoder(file)
+    for i in range(0, len(data), _blocksize):
+        encoder.write(data[i:i+_blocksize])
+    encoder.close()
 
 
 class palette:
@@ -103,14 +173,43 @@ class palette:
         return self.mode, self.data
 
 
+def _buffer(data):
+    """return data as a flat memoryview of bytes without copying
+
+    data can be any object supporting the buffer protocol like bytes,
+    bytearray, memoryview, array.array or a C-contiguous NumPy array."""
+    view = memoryview(data)
+    if view.ndim != 1 or view.format != "B":
+        view = view.cast("B")
+    return view
+
+
+def interleave(bands):
+    """return the pixel data of the bands (given as buffers of equal size) interleaved
+
+    The interleaving is done by strided slice assignments, i.e. without
+    looping over the pixels in Python."""
+    bands = [_buffer(band) for band in bands]
+    data = bytearray(len(bands)*len(bands[0]))
+    for i, band in enumerate(bands):
+        data[i::len(bands)] = band
+    return bytes(data)
+
+
 class image:
 
+    """image data of 8 bits per component
+
+    The uncompressed data can be given by any object supporting the buffer
+    protocol. The bands of the image are accessed by strided slicing without
+    copying the data."""
+
     def __init__(self, width, height, mode, data, compressed=None, palette=None):
         if width <= 0 or height <= 0:
             raise ValueError("valid image size")
         if mode not in ["L", "RGB", "CMYK", "LA", "RGBA", "CMYKA", "AL", "ARGB", "ACMYK", "P"]:
             raise ValueError("invalid mode")
-        if compressed is None and len(mode)*width*height != len(data):
+        if compressed is None and len(mode)*width*height != _buffer(data).nbytes:
             raise ValueError("wrong size of uncompressed data")
         self.size = width, height
         self.mode = mode
@@ -118,17 +217,26 @@ class image:
         self.compressed = compressed
         self.palette = palette
 
-    def split(self):
+    def buffer(self):
+        """return the image data as a flat memoryview of bytes"""
+        return _buffer(self.data)
+
+    def band(self, band):
+        """return the data of the band with index band as a (strided) memoryview"""
         if self.compressed is not None:
             raise RuntimeError("cannot extract bands from compressed image")
-        bands = len(self.mode)
+        return self.buffer()[band::len(self.mode)]
+
+    def split(self):
         width, height = self.size
-        return [image(width, height, "L", bytes(self.data[band::bands])) for band in range(bands)]
+        return [image(width, height, "L", self.band(band)) for band in range(len(self.mode))]
 
     def tobytes(self, *args):
         if len(args):
             raise RuntimeError("encoding not supported in this implementation")
-        return self.data
+        if isinstance(self.data, bytes):
+            return self.data
+        return self.buffer().tobytes()
 
     def convert(self, model):
         raise RuntimeError("color model conversion not supported in this implementation")
@@ -143,9 +251,10 @@ class image:
         except KeyError:
             raise RuntimeError("Unsupported mode '%s' for PNG output." % self.mode)
         width, height = self.size
-        assert len(self.data) == width*height*bytesperpixel
+        pixels = self.buffer()
+        assert len(pixels) == width*height*bytesperpixel
         # inject filter byte to each scanline
-        data = b"".join(b"\x00" + self.data[bytesperpixel*width*pos:bytesperpixel*width*(pos+1)] for pos in range(0, height))
+        data = b"".join(b"\x00" + pixels[bytesperpixel*width*pos:bytesperpixel*width*(pos+1)] for pos in range(0, height))
         chunk=lambda name, data=b"": struct.pack("!I", len(data)) + name + data + struct.pack("!I", 0xFFFFFFFF & zlib.crc32(name + data))
         file.write(b"\x89PNG\r\n\x1a\n")
         file.write(chunk(b"IHDR", struct.pack("!2I5B", width, height, 8, pngmode, 0, 0, 0)))
@@ -214,6 +323,184 @@ class jpegimage(image):
         file.write(self.data)
 
 
+def _unfilterpng(data, rowlength, height, bpp):
+    """return the pixel data of the decompressed PNG image data by reverting the row filters
+
+    rowlength is the number of bytes per row (without the filter type byte)
+    and bpp is the number of bytes per pixel."""
+    mask7f = int.from_bytes(b"\x7f"*rowlength, "big")
+    mask80 = int.from_bytes(b"\x80"*rowlength, "big")
+    rows = []
+    previous = bytes(rowlength)
+    for y in range(height):
+        start = y*(rowlength+1)
+        filter = data[start]
+        row = data[start+1:start+1+rowlength]
+        if filter == 2:
+            # up: bytewise addition of the previous row by integer arithmetic on the whole row
+            a = int.from_bytes(row, "big")
+            b = int.from_bytes(previous, "big")
+            row = (((a & mask7f) + (b & mask7f)) ^ ((a ^ b) & mask80)).to_bytes(rowlength, "big")
+        elif filter:
+            row = bytearray(row)
+            if filter == 1:
+                # sub
+                for i in range(bpp, rowlength):
+                    row[i] = (row[i] + row[i-bpp]) & 255
+            elif filter == 3:
+                # average
+                for i in range(rowlength):
+                    row[i] = (row[i] + ((row[i-bpp] if i >= bpp else 0) + previous[i]) // 2) & 255
+            elif filter == 4:
+                # paeth
+                for i in range(rowlength):
+                    if i >= bpp:
+                        a = row[i-bpp]
+                        c = previous[i-bpp]
+                    else:
+                        a = c = 0
+                    b = previous[i]
+                    pa = abs(b - c)
+                    pb = abs(a - c)
+                    pc = abs(a + b - 2*c)
+                    if pa <= pb and pa <= pc:
+                        row[i] = (row[i] + a) & 255
+                    elif pb <= pc:
+                        row[i] = (row[i] + b) & 255
+                    else:
+                        row[i] = (row[i] + c) & 255
+            else:
+                raise ValueError("invalid PNG filter type")
+            row = bytes(row)
+        rows.append(row)
+        previous = row
+    return b"".join(rows)
+
+
+def _decodepng(pngdata, idat, width, height, mode):
+    """return the pixel data of the PNG image pngdata
+
+    idat is the list of the contents of its IDAT chunks. The image is decoded
+    by the Python Image Library, when it is available. Otherwise the data is
+    decompressed and the row filters are reverted by _unfilterpng."""
+    try:
+        from PIL import Image
+    except ImportError:
+        pass
+    else:
+        decoded = Image.open(io.BytesIO(pngdata))
+        if decoded.mode == mode and decoded.size == (width, height):
+            return decoded.tobytes()
+    return _unfilterpng(zlib.decompress(b"".join(idat)), width*len(mode), height, len(mode))
+
+
+class pngimage(image):
+
+    def __init__(self, file):
+        try:
+            data = file.read()
+        except:
+            with open(file, "rb") as f:
+                data = f.read()
+        if data[:8] != b"\x89PNG\r\n\x1a\n":
+            raise ValueError("PNG signature expected")
+        self.pngdata = data
+        pos = 8
+        idat = []
+        palettedata = None
+        header = None
+        while pos < len(data):
+            length, name = struct.unpack(">I4s", data[pos:pos+8])
+            chunk = data[pos+8:pos+8+length]
+            pos += length + 12
+            if name == b"IHDR":
+                header = struct.unpack(">IIBBBBB", chunk)
+            elif name == b"PLTE":
+                palettedata = chunk
+            elif name == b"IDAT":
+                idat.append(chunk)
+            elif name == b"pHYs":
+                xppu, yppu, unit = struct.unpack(">IIB", chunk)
+                if unit == 1:
+                    self.info = {"dpi": (xppu*0.0254, yppu*0.0254)}
+                # else do not provide dpi information
+            elif name == b"tRNS":
+                logger.warning("transparency of PNG image without alpha channel ignored")
+            elif name == b"IEND":
+                break
+        if header is None:
+            raise ValueError("PNG header expected")
+        width, height, bits, colortype, compression, filter, interlace = header
+        if bits != 8:
+            raise ValueError("implementation limited to 8 bit per component only")
+        if interlace:
+            raise ValueError("interlaced PNG images not supported")
+        try:
+            mode = {0: "L", 2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}[colortype]
+        except KeyError:
+            raise ValueError("invalid color type")
+        if mode == "P":
+            if palettedata is None:
+                raise ValueError("palette expected")
+            imagepalette = palette("RGB", palettedata)
+        else:
+            imagepalette = None
+        if mode.endswith("A"):
+            # the alpha channel needs to be separated, which requires the uncompressed pixel data
+            self.decodeparms = None
+            image.__init__(self, width, height, mode, _decodepng(data, idat, width, height, mode))
+        else:
+            # the compressed data is used by the PNG predictors of the FlateDecode filter
+            self.decodeparms = "<< /Predictor 15 /Colors %d /BitsPerComponent 8 /Columns %d >>" % (len(mode), width)
+            image.__init__(self, width, height, mode, b"".join(idat), compressed="Flate", palette=imagepalette)
+
+    def save(self, file, format=None, **attrs):
+        if self.compressed is None:
+            return image.save(self, file, format, **attrs)
+        if format != "png":
+            raise RuntimeError("PNG image can be output as PNG only.")
+        file.write(self.pngdata)
+
+
+def _resamplenearest(img, width, height):
+    """resample the uncompressed image img to width times height pixels by the nearest neighbour filter"""
+    imagewidth, imageheight = img.size
+    bands = len(img.mode)
+    pixels = img.buffer()
+    rowlength = bands*imagewidth
+    columns = [int((x+0.5)*imagewidth/width)*bands + band for x in range(width) for band in range(bands)]
+    rows = []
+    for y in range(height):
+        row = pixels[int((y+0.5)*imageheight/height)*rowlength:][:rowlength]
+        rows.append(bytes(map(row.__getitem__, columns)))
+    return image(width, height, img.mode, b"".join(rows), palette=img.palette)
+
+
+def resample(img, width, height, filter="lanczos"):
+    """return the image img resampled to width times height pixels
+
+    filter is the name of a resampling filter of the Python Image Library
+    ("nearest", "box", "bilinear", "hamming", "bicubic", or "lanczos"). Images
+    of the Python Image Library are resampled by their resize method. The
+    uncompressed data of image instances is converted to an image of the
+    Python Image Library for the resampling, when it is available and it
+    supports the mode. Otherwise the nearest neighbour filter is used."""
+    if isinstance(img, image) and (img.mode not in ["L", "RGB", "CMYK", "LA", "RGBA"] or filter == "nearest"):
+        return _resamplenearest(img, width, height)
+    try:
+        from PIL import Image
+    except ImportError:
+        if not isinstance(img, image):
+            raise
+        logger.warning("resampling image by the nearest neighbour filter due to missing Python Image Library")
+        return _resamplenearest(img, width, height)
+    resamplefilter = getattr(getattr(Image, "Resampling", Image), filter.upper())
+    if isinstance(img, image):
+        resampled = Image.frombytes(img.mode, img.size, img.tobytes()).resize((width, height), resamplefilter)
+        return image(width, height, img.mode, resampled.tobytes())
+    return img.resize((width, height), resamplefilter)
+
+
 class PSimagedata(pswriter.PSresource):
 
     def __init__(self, name, data, singlestring, maxstrlen):
@@ -231,19 +518,20 @@ class PSimagedata(pswriter.PSresource):
             file.write("~>\n"
                          "%%EndData\n")
         else:
-            datalen = len(self.data)
+            data = memoryview(self.data)
+            datalen = len(data)
             tailpos = datalen - datalen % self.maxstrlen
             file.write("%%%%BeginData: %i ASCII Lines\n" %
-                       ((tailpos/self.maxstrlen) * ascii85lines(self.maxstrlen) +
+                       ((tailpos//self.maxstrlen) * ascii85lines(self.maxstrlen) +
                         ascii85lines(datalen-tailpos)))
             file.write("[ ")
             for i in range(0, tailpos, self.maxstrlen):
                 file.write("<~")
-                ascii85stream(file, self.data[i: i+self.maxstrlen])
+                ascii85stream(file, data[i: i+self.maxstrlen])
                 file.write("~>\n")
             if datalen != tailpos:
                 file.write("<~")
-                ascii85stream(file, self.data[tailpos:])
+                ascii85stream(file, data[tailpos:])
                 file.write("~>")
             file.write("]\n"
                        "%%EndData\n")
@@ -262,7 +550,7 @@ class PDFimagepalettedata(pdfwriter.PDFobject):
                    "/Length %d\n" % len(self.data))
         file.write(">>\n"
                    "stream\n")
-        file.write(self.data)
+        file.write_bytes(self.data)
         file.write("\n"
                    "endstream\n")
 
@@ -270,7 +558,7 @@ class PDFimagepalettedata(pdfwriter.PDFobject):
 class PDFimage(pdfwriter.PDFobject):
 
     def __init__(self, name, width, height, palettemode, palettedata, mode,
-                       bitspercomponent, compressmode, data, smask, registry, addresource=True):
+                       bitspercomponent, compressmode, data, smask, registry, addresource=True, decodeparms=None):
         pdfwriter.PDFobject.__init__(self, "image", name)
 
         if addresource:
@@ -296,6 +584,7 @@ class PDFimage(pdfwriter.PDFobject):
         self.compressmode = compressmode
         self.data = data
         self.smask = smask
+        self.decodeparms = decodeparms
 
     def write(self, file, writer, registry):
         file.write("<<\n"
@@ -315,6 +604,8 @@ class PDFimage(pdfwriter.PDFobject):
         file.write("/Length %d\n" % len(self.data))
         if self.compressmode:
             file.write("/Filter /%sDecode\n" % self.compressmode)
+        if self.decodeparms:
+            file.write("/DecodeParms %s\n" % self.decodeparms)
         file.write(">>\n"
                    "stream\n")
         file.write_bytes(self.data)
@@ -355,8 +646,54 @@ class bitmap_trafo(baseclasses.canvasitem):
         if not haszlib and self.compressmode == "Flate":
             logger.warning("zlib module not available, disable compression")
             self.compressmode = None
+        self._digest = None
+
+    def resampled(self, writer, context):
+        """ Returns the bitmap with the image resampled to the max_image_dpi of the writer.
 
-    def imagedata(self, interleavealpha):
+        The resolution of the image is calculated from the size of the bitmap
+        on the page as given by its trafo and the trafo of the context. The
+        bitmap itself is returned when the resolution does not exceed
+        max_image_dpi (or it is None) and for compressed images.
+        """
+        if writer.max_image_dpi is None or self.imagecompressed is not None:
+            return self
+        (a, b), (c, d) = (context.trafo * self.pdftrafo).matrix
+        width = min(self.imagewidth, max(1, int(math.ceil(math.hypot(a, c)/72*writer.max_image_dpi))))
+        height = min(self.imageheight, max(1, int(math.ceil(math.hypot(b, d)/72*writer.max_image_dpi))))
+        if width == self.imagewidth and height == self.imageheight:
+            return self
+        resampledimage = _lrucached(writer.resampledcache, _resampledcachesize,
+                                    (self.digest(), width, height, writer.image_resample),
+                                    lambda: resample(self.image, width, height, writer.image_resample))
+        return bitmap_trafo(self.pdftrafo, resampledimage,
+                            PSstoreimage=self.PSstoreimage, PSmaxstrlen=self.PSmaxstrlen, PSbinexpand=self.PSbinexpand,
+                            compressmode=self.compressmode, flatecompresslevel=self.flatecompresslevel,
+                            dctquality=self.dctquality, dctoptimize=self.dctoptimize, dctprogression=self.dctprogression)
+
+    def digest(self):
+        """ Returns a hex digest of the image data and the compression settings.
+
+        The digest is used to name the image resources, i.e. identical
+        images are embedded only once in the output. It is calculated once
+        per bitmap, i.e. the image must not be modified afterwards.
+        """
+        if self._digest is not None:
+            return self._digest
+        hash = hashlib.sha1()
+        hash.update(("%r" % ((self.image.mode, self.image.size, self.imagecompressed,
+                              self.compressmode, self.flatecompresslevel,
+                              self.dctquality, self.dctoptimize, self.dctprogression),)).encode("ascii"))
+        palette = getattr(self.image, "palette", None)
+        if palette is not None:
+            palettemode, palettedata = palette.getdata()
+            hash.update(palettemode.encode("ascii"))
+            hash.update(palettedata)
+        hash.update(self.image.tobytes())
+        self._digest = hash.hexdigest()
+        return self._digest
+
+    def imagedata(self, interleavealpha, cache=None):
         """ Returns a tuple (mode, data, alpha, palettemode, palettedata)
         where mode does not contain the alpha channel anymore.
 
@@ -364,38 +701,46 @@ class bitmap_trafo(baseclasses.canvasitem):
         returned as a band in alpha itself. For interleavealpha == True
         alpha will be True and the channel is interleaved in front of each
         pixel in data.
+
+        When a dictionary cache is given (like the imagedatacache of the
+        writer), the result is cached for the most recently used images by
+        means of the digest, so that identical images are compressed only
+        once.
         """
+        if cache is None:
+            return self._imagedata(interleavealpha)
+        return _lrucached(cache, _imagedatacachesize, (self.digest(), interleavealpha),
+                          lambda: self._imagedata(interleavealpha))
+
+    def _imagedata(self, interleavealpha):
 
         alpha = palettemode = palettedata = None
         data = self.image
         mode = data.mode
-        if mode.startswith("A"):
-            mode = mode[1:]
-            if interleavealpha:
-                alpha = True
+        if mode.startswith("A") or mode.endswith("A"):
+            # the bands are extracted from the interleaved pixel data by strided slicing
+            if isinstance(data, image):
+                pixels = data.buffer()
             else:
-                bands = data.split()
-                alpha = bands[0]
-                data = image(self.imagewidth, self.imageheight, mode,
-                             b"".join([bytes(values)
-                                       for values in zip(*[band.tobytes()
-                                                           for band in bands[1:]])]), palette=data.palette)
-        if mode.endswith("A"):
-            bands = data.split()
-            mode = mode[:-1]
+                pixels = memoryview(data.tobytes())
+            bands = len(mode)
+            if mode.startswith("A"):
+                mode = mode[1:]
+                alphaband = 0
+                colorbands = list(range(1, bands))
+            else:
+                mode = mode[:-1]
+                alphaband = bands - 1
+                colorbands = list(range(bands - 1))
             if interleavealpha:
                 alpha = True
-                bands = list(bands[-1:]) + list(bands[:-1])
-                data = image(self.imagewidth, self.imageheight, "A%s" % mode,
-                             b"".join([bytes(values)
-                                       for values in zip(*[band.tobytes()
-                                                           for band in bands])]), palette=data.palette)
+                if alphaband:
+                    data = image(self.imagewidth, self.imageheight, "A%s" % mode,
+                                 interleave([pixels[band::bands] for band in [alphaband] + colorbands]), palette=data.palette)
             else:
-                alpha = bands[-1]
+                alpha = image(self.imagewidth, self.imageheight, "L", pixels[alphaband::bands])
                 data = image(self.imagewidth, self.imageheight, mode,
-                             b"".join([bytes(values)
-                                       for values in zip(*[band.tobytes()
-                                                           for band in bands[:-1]])]), palette=data.palette)
+                             interleave([pixels[band::bands] for band in colorbands]), palette=data.palette)
 
         if mode == "P":
             palettemode, palettedata = data.palette.getdata()
@@ -441,14 +786,18 @@ class bitmap_trafo(baseclasses.canvasitem):
         return bb
 
     def processPS(self, file, writer, context, registry, bbox):
-        mode, data, alpha, palettemode, palettedata = self.imagedata(True)
+        resampled = self.resampled(writer, context)
+        if resampled is not self:
+            return resampled.processPS(file, writer, context, registry, bbox)
+        digest = self.digest()
+        mode, data, alpha, palettemode, palettedata = self.imagedata(True, writer.imagedatacache)
         pstrafo = trafo.translate_pt(0, -1.0).scaled(self.imagewidth, -self.imageheight)*self.pdftrafo.inverse()
 
         PSsinglestring = self.PSstoreimage and len(data) < self.PSmaxstrlen
         if PSsinglestring:
-            PSimagename = "image-%d-%s-singlestring" % (id(self.image), self.compressmode)
+            PSimagename = "image-%s-singlestring" % digest
         else:
-            PSimagename = "image-%d-%s-stringarray" % (id(self.image), self.compressmode)
+            PSimagename = "image-%s-stringarray" % digest
 
         if self.PSstoreimage and not PSsinglestring:
             registry.add(pswriter.PSdefinition("imagedataaccess",
@@ -499,6 +848,8 @@ class bitmap_trafo(baseclasses.canvasitem):
             else:
                 file.write("currentfile /ASCII85Decode filter")
         if self.compressmode or self.imagecompressed:
+            if self.imagecompressed and getattr(self.image, "decodeparms", None):
+                file.write(" %s" % self.image.decodeparms)
             file.write(" /%sDecode filter" % (self.compressmode or self.imagecompressed))
         file.write("\n")
 
@@ -536,9 +887,13 @@ class bitmap_trafo(baseclasses.canvasitem):
         file.write("grestore\n")
 
     def processPDF(self, file, writer, context, registry, bbox):
-        mode, data, alpha, palettemode, palettedata = self.imagedata(False)
+        resampled = self.resampled(writer, context)
+        if resampled is not self:
+            return resampled.processPDF(file, writer, context, registry, bbox)
+        digest = self.digest()
+        mode, data, alpha, palettemode, palettedata = self.imagedata(False, writer.imagedatacache)
 
-        name = "image-%d-%s" % (id(self.image), self.compressmode or self.imagecompressed)
+        name = "image-%s" % digest
         if alpha:
             alpha = PDFimage("%s-smask" % name, self.imagewidth, self.imageheight,
                              None, None, "L", 8,
@@ -546,7 +901,8 @@ class bitmap_trafo(baseclasses.canvasitem):
             registry.add(alpha)
         registry.add(PDFimage(name, self.imagewidth, self.imageheight,
                               palettemode, palettedata, mode, 8,
-                              self.compressmode or self.imagecompressed, data, alpha, registry))
+                              self.compressmode or self.imagecompressed, data, alpha, registry,
+                              decodeparms=getattr(self.image, "decodeparms", None) if self.imagecompressed else None))
 
         bbox += self.bbox()
 
@@ -556,6 +912,9 @@ class bitmap_trafo(baseclasses.canvasitem):
         file.write("Q\n")
 
     def processSVG(self, xml, writer, context, registry, bbox):
+        resampled = self.resampled(writer, context)
+        if resampled is not self:
+            return resampled.processSVG(xml, writer, context, registry, bbox)
         if self.compressmode == "Flate":
             f = io.BytesIO()
             self.image.save(f, "png")
@@ -564,6 +923,10 @@ class bitmap_trafo(baseclasses.canvasitem):
             f = io.BytesIO()
             self.image.save(f, "jpeg")
             inlinedata = "data:image/jpeg;base64," + binascii.b2a_base64(f.getvalue()).decode('ascii').replace("\n", "")
+        elif isinstance(self.image, pngimage):
+            f = io.BytesIO()
+            self.image.save(f, "png")
+            inlinedata = "data:image/png;base64," + binascii.b2a_base64(f.getvalue()).decode('ascii').replace("\n", "")
         else:
             raise ValueError("SVG cannot store uncompressed image data.")
         attrs = {"preserveAspectRatio": "none", "x": "0", "y": "-1", "width": "1", "height": "1", "xlink:href": inlinedata}
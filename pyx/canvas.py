@@ -64,7 +64,7 @@ class SVGclippath(svgwriter.SVGresource):
     def output(self, xml, writer, registry):
         xml.startSVGElement("clipPath", {"id": self.svgid})
         # TODO: clip-rule missing (defaults to nonzero)
-        xml.startSVGElement("path", {"d": self.path.returnSVGdata()})
+        xml.startSVGElement("path", {"d": self.path.returnSVGdata(precision=writer.precision, compact=writer.compact, simplify=writer.simplify)})
         xml.endSVGElement("path")
         xml.endSVGElement("clipPath")
 
@@ -188,6 +188,7 @@ class canvas(baseclasses.canvasitem):
 
     def processPS(self, file, writer, context, registry, bbox):
         context = context()
+        context.trafo = context.trafo * self.trafo
         if self.items:
             if self.modifies_state:
                 file.write("gsave\n")
@@ -252,6 +253,7 @@ class canvas(baseclasses.canvasitem):
         if self.items:
             if self.modifies_state:
                 context = context()
+                context.trafo = context.trafo * self.trafo
                 attrs = {}
                 for attr in self.styles:
                     attr.processSVGattrs(attrs, writer, context, registry)
@@ -77,7 +77,7 @@ class gray(color):
         self.g = g
 
     def processPS(self, file, writer, context, registry):
-        file.write("%f setgray\n" % self.g)
+        file.write("%f %s\n" % (self.g, writer.operator("setgray")))
 
     def processPDF(self, file, writer, context, registry):
         if context.strokeattr:
@@ -126,7 +126,7 @@ class rgb(color):
         self.b = b
 
     def processPS(self, file, writer, context, registry):
-        file.write("%f %f %f setrgbcolor\n" % (self.r, self.g, self.b))
+        file.write("%f %f %f %s\n" % (self.r, self.g, self.b, writer.operator("setrgbcolor")))
 
     def processPDF(self, file, writer, context, registry):
         if context.strokeattr:
@@ -245,7 +245,7 @@ class cmyk(color):
         self.k = k
 
     def processPS(self, file, writer, context, registry):
-        file.write("%f %f %f %f setcmykcolor\n" % (self.c, self.m, self.y, self.k))
+        file.write("%f %f %f %f %s\n" % (self.c, self.m, self.y, self.k, writer.operator("setcmykcolor")))
 
     def processPDF(self, file, writer, context, registry):
         if context.strokeattr:
@@ -324,7 +324,7 @@ class decoratedpath(baseclasses.canvasitem):
 
         if strokepath is not fillpath:
             if self.strokestyles is not None:
-                attrs = {"d": strokepath.returnSVGdata()}
+                attrs = {"d": strokepath.returnSVGdata(precision=writer.precision, compact=writer.compact, simplify=writer.simplify)}
                 _writestrokestyles(attrs, acontext)
                 attrs["stroke"] = acontext.strokecolor
                 if acontext.strokeopacity != 1:
@@ -333,7 +333,7 @@ class decoratedpath(baseclasses.canvasitem):
                 xml.endSVGElement("path")
                 bbox += strokepath.bbox().enlarged_pt(0.5*acontext.linewidth_pt)
             if self.fillstyles is not None:
-                attrs = {"d": fillpath.returnSVGdata()}
+                attrs = {"d": fillpath.returnSVGdata(precision=writer.precision, compact=writer.compact, simplify=writer.simplify)}
                 _writefillstyles(attrs, acontext)
                 attrs["fill"] = acontext.fillcolor
                 if acontext.fillopacity != 1:
@@ -342,7 +342,7 @@ class decoratedpath(baseclasses.canvasitem):
                 xml.endSVGElement("path")
                 bbox += fillpath.bbox()
         else:
-            attrs = {"d": fillpath.returnSVGdata()}
+            attrs = {"d": fillpath.returnSVGdata(precision=writer.precision, compact=writer.compact, simplify=writer.simplify)}
             _writestrokestyles(attrs, acontext)
             _writefillstyles(attrs, acontext)
             if self.strokestyles is not None:
@@ -1498,7 +1498,7 @@ class parallel(baseclasses.deformer): # <<<
             if add_nsp:
                 if ((parampairs[-1][-1] in forwardpairs and forwardpairs[parampairs[-1][-1]] is parampairs[0][0]) or
                     (parampairs[-1][-1] in endparams and parampairs[0][0] in beginparams and parampairs[0][0] is nextp[parampairs[-1][-1]])):
-                    add_nsp.normsubpathitems[-1] = add_nsp.normsubpathitems[-1].modifiedend_pt(*add_nsp.atbegin_pt())
+                    add_nsp[-1] = add_nsp[-1].modifiedend_pt(*add_nsp.atbegin_pt())
                     add_nsp.close()
 
             result.extend([add_nsp])
@@ -1795,4 +1795,29 @@ class linesmoothed(baseclasses.deformer): # <<<
 linesmoothed.clear = attr.clearclass(linesmoothed)
 
 
+class simplified(baseclasses.deformer): # <<<
+
+    """Removes vertices between straight lines as long as the path deviates less than tolerance.
+
+    The vertices are removed in the order of the deviation caused by their
+    removal (see normpath.simplified). Curves are kept unless they deviate
+    less than tolerance from a straight line. The begin and end points of
+    the subpaths and their closedness are kept.
+    """
+
+    def __init__(self, tolerance=0.1*unit.t_pt):
+        self.tolerance = tolerance
+
+    def __call__(self, tolerance=None):
+        if tolerance is None:
+            tolerance = self.tolerance
+        return simplified(tolerance=tolerance)
+
+    def deform(self, basepath):
+        return basepath.normpath().simplified(self.tolerance)
+# >>>
+
+simplified.clear = attr.clearclass(simplified)
+
+
 # vim:foldmethod=marker:foldmarker=<<<,>>>
@@ -150,19 +150,19 @@ class _noclose:
         pass
 
 
-def _outputstream(file, suffix):
+def _outputstream(file, suffix, mode="wb"):
     if file is None:
         if not sys.argv[0].endswith(".py"):
             raise RuntimeError("could not auto-guess filename")
-        return open("%s.%s" % (sys.argv[0][:-3], suffix), "wb")
+        return open("%s.%s" % (sys.argv[0][:-3], suffix), mode)
     if file == "-":
         return _noclose(sys.stdout.buffer)
     try:
         file.write(b"")
     except:
         if not file.endswith(".%s" % suffix):
-            return open("%s.%s" % (file, suffix), "wb")
-        return open(file, "wb")
+            return open("%s.%s" % (file, suffix), mode)
+        return open(file, mode)
     else:
         return _noclose(file)
 
@@ -189,7 +189,8 @@ class document:
             pswriter.PSwriter(self, f, **kwargs)
 
     def writePDFfile(self, file=None, **kwargs):
-        with _outputstream(file, "pdf") as f:
+        # appending requires to read the existing file
+        with _outputstream(file, "pdf", kwargs.get("append") and "r+b" or "wb") as f:
             pdfwriter.PDFwriter(self, f, **kwargs)
 
     def writeSVGfile(self, file=None, **kwargs):
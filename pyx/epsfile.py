@@ -20,11 +20,14 @@
 # along with PyX; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
 
-import logging, os, string, tempfile
-from . import baseclasses, bbox, config, unit, trafo, pswriter
+import functools, hashlib, io, logging, os, re, string, tempfile, zlib
+from . import baseclasses, bbox, config, unit, trafo, pdfwriter, pswriter
 
 logger = logging.getLogger("pyx")
 
+# block size used to copy EPS files to the output
+_blocksize = 1 << 20
+
 # PostScript-procedure definitions (cf. 5002.EPSF_Spec_v3.0.pdf)
 # with important correction in EndEPSF:
 #   end operator is missing in the spec!
@@ -135,24 +138,34 @@ class linefilereader:
                 return result
 
 
+_trailerpattern = re.compile(br"[\r\n]%%Trailer[ \t]*(?=[\r\n]|$)")
+_bboxpattern = re.compile(br"[\r\n]%%BoundingBox:([^\r\n]*)")
+
 def _readbbox(file):
-    """returns bounding box of EPS file filename"""
+    """returns bounding box of EPS file filename
 
-    file = linefilereader(file)
+    The bounding box is taken from the header comments. When it is deferred
+    to the trailer by (atend), the last bounding box of the trailer is used.
+    The trailer is located by searching the end of the file for the last
+    %%Trailer comment (which belongs to the outermost document) in blocks
+    of increasing size, i.e. the body of the file is not parsed.
+    """
+
+    lines = linefilereader(file)
 
     # check the %! header comment
-    if not file.readline().startswith(b"%!"):
+    if not lines.readline().startswith(b"%!"):
         raise IOError("file doesn't start with a '%!' header comment")
 
     bboxatend = 0
     # parse the header (use the first BoundingBox)
     while True:
-        line = file.readline()
+        line = lines.readline(EOFmsg=None)
         if not line:
             break
         if line.startswith(b"%%BoundingBox:") and not bboxatend:
             values = line.split(b":", 1)[1].split()
-            if values == ["(atend)"]:
+            if values == [b"(atend)"]:
                 bboxatend = 1
             else:
                 if len(values) != 4:
@@ -165,60 +178,70 @@ def _readbbox(file):
     if not bboxatend:
         raise IOError("no bounding box information found")
 
-    # parse the body
-    nesting = 0 # allow for nested documents
+    # search the trailer (use the last BoundingBox)
+    file.seek(0, io.SEEK_END)
+    size = file.tell()
+    blocksize = 65536
     while True:
-        line = file.readline()
-        if line.startswith(b"%%BeginData:"):
-            values = line.split(":", 1)[1].split()
-            if len(values) > 3:
-                raise IOError("invalid number of arguments")
-            if len(values) == 3:
-                if values[2] == b"Lines":
-                    for i in range(int(values[0])):
-                        file.readline()
-                elif values[2] != b"Bytes":
-                    raise IOError("invalid bytesorlines-value")
-                else:
-                    file.read(int(values[0]))
-            else:
-                file.read(int(values[0]))
-            line = file.readline()
-            # ignore tailing whitespace/newline for binary data
-            if (len(values) < 3 or values[2] != "Lines") and not len(line.strip()):
-                line = file.readline()
-            if line.rstrip() != b"%%EndData":
-                raise IOError("missing EndData")
-        elif line.startswith(b"%%BeginBinary:"):
-            file.read(int(line.split(":", 1)[1]))
-            line = file.readline()
-            # ignore tailing whitespace/newline
-            if not len(line.strip()):
-                line = file.readline()
-            if line.rstrip() != b"%%EndBinary":
-                raise IOError("missing EndBinary")
-        elif line.startswith(b"%%BeginDocument:"):
-            nesting += 1
-        elif line.rstrip() == b"%%EndDocument":
-            if nesting < 1:
-                raise IOError("unmatched EndDocument")
-            nesting -= 1
-        elif not nesting and line.rstrip() == b"%%Trailer":
+        start = max(0, size - blocksize)
+        file.seek(start)
+        data = file.read()
+        trailer = None
+        for trailer in _trailerpattern.finditer(data):
+            pass
+        if trailer is not None:
             break
-
-    usebbox = None
-    # parse the trailer (use the last BoundingBox)
-    line = True
-    while line:
-        line = file.readline(EOFmsg=None)
-        if line.startswith("%%BoundingBox:"):
-            values = line.split(b":", 1)[1].split()
-            if len(values) != 4:
-                raise IOError("invalid number of bounding box values")
-            usebbox = bbox.bbox_pt(*list(map(int, values)))
-    if not usebbox:
+        if not start:
+            raise IOError("missing document trailer")
+        blocksize *= 4
+    values = None
+    for values in _bboxpattern.findall(data, trailer.end()):
+        pass
+    if values is None:
         raise IOError("missing bounding box information in document trailer")
-    return usebbox
+    values = values.split()
+    if len(values) != 4:
+        raise IOError("invalid number of bounding box values")
+    return bbox.bbox_pt(*list(map(int, values)))
+
+
+@functools.lru_cache(maxsize=128)
+def _cachedbbox(filename, mtime):
+    # the mtime argument is part of the cache key only
+    with open(filename, "rb") as file:
+        return _readbbox(file).highrestuple_pt()
+
+
+def _filebbox(filename):
+    """returns the bounding box of the EPS file filename
+
+    The result is cached per absolute filename and modification time."""
+    return bbox.bbox_pt(*_cachedbbox(os.path.abspath(filename), os.stat(filename).st_mtime_ns))
+
+
+def _cachedir():
+    """return the directory to cache EPS files converted to PDF
+
+    The directory is given by the option cachedir of the section epsfile in
+    the PyX configuration and defaults to pyx/epscache in the cache
+    directory of the user. It is created with access restricted to the
+    user. None is returned when the directory is owned by another user or
+    writable by others, as planted cache entries would be embedded in the
+    output unchecked.
+    """
+    cachedir = config.get("epsfile", "cachedir", None)
+    if cachedir is None:
+        if os.name == "nt":
+            cachedir = os.path.join(os.environ.get("LOCALAPPDATA") or tempfile.gettempdir(), "pyx", "epscache")
+        else:
+            cachedir = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "pyx", "epscache")
+    os.makedirs(cachedir, mode=0o700, exist_ok=True)
+    if os.name == "posix":
+        stat = os.stat(cachedir)
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+            logger.warning("EPS cache directory %s is not private to the user and thus not used" % cachedir)
+            return None
+    return cachedir
 
 
 class epsfile(baseclasses.canvasitem):
@@ -247,9 +270,11 @@ class epsfile(baseclasses.canvasitem):
         self.kpsearch = kpsearch
         if bbox:
             self.mybbox = bbox
-        else:
+        elif kpsearch:
             with self.open() as epsfile:
                 self.mybbox = _readbbox(epsfile)
+        else:
+            self.mybbox = _filebbox(filename)
 
         # determine scaling in x and y direction
         self.scalex = self.scaley = scale
@@ -333,22 +358,182 @@ class epsfile(baseclasses.canvasitem):
         file.write("%%%%BeginDocument: %s\n" % self.filename)
 
         with self.open() as epsfile:
-            file.write_bytes(epsfile.read())
+            for block in iter(functools.partial(epsfile.read, _blocksize), b""):
+                file.write_bytes(block)
 
         file.write("%%EndDocument\n")
         file.write("EndEPSF\n")
 
+    def convertPDF(self, filename):
+        """convert the EPS file by Ghostscript into the PDF file filename
+
+        The result is written to a temporary file in the directory of
+        filename first and moved to filename atomically afterwards."""
+        logger.info("converting EPS file %s to PDF using Ghostscript" % self.filename)
+        llx_pt, lly_pt, urx_pt, ury_pt = self.mybbox.highrestuple_pt()
+        dirname = os.path.dirname(filename)
+        epsfd, epsfilename = tempfile.mkstemp(suffix=".eps", dir=dirname)
+        pdffd, pdffilename = tempfile.mkstemp(suffix=".pdf", dir=dirname)
+        os.close(pdffd)
+        try:
+            with os.fdopen(epsfd, "wb") as tmpfile, self.open() as epsfile:
+                for block in iter(functools.partial(epsfile.read, _blocksize), b""):
+                    tmpfile.write(block)
+            cmd = [config.get("epsfile", "gs", "gs"), "-dNOPAUSE", "-dQUIET", "-dBATCH", "-dSAFER",
+                   "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.4", "-sOutputFile=%s" % pdffilename,
+                   "-c", "<< /PageSize [%g %g] >> setpagedevice %g %g translate /showpage { } def" % (urx_pt-llx_pt, ury_pt-lly_pt, -llx_pt, -lly_pt),
+                   "-f", epsfilename,
+                   "-c", "systemdict /showpage get exec"]
+            p = config.Popen(cmd)
+            if p.wait():
+                raise RuntimeError("Ghostscript failed to convert EPS file %s to PDF" % self.filename)
+            os.replace(pdffilename, filename)
+        finally:
+            os.remove(epsfilename)
+            if os.path.exists(pdffilename):
+                os.remove(pdffilename)
+
+    def readconvertedPDF(self):
+        """return the form XObject and its objects of the EPS file converted by Ghostscript
+
+        The conversion result is cached in the directory returned by
+        _cachedir. The cache entries are identified by the hash of the EPS
+        file content and its bounding box, and are reused across documents
+        and runs. When the cache directory is not safe to use, the EPS file
+        is converted in a temporary directory without caching.
+        """
+        hash = hashlib.sha1()
+        with self.open() as epsfile:
+            for block in iter(functools.partial(epsfile.read, _blocksize), b""):
+                hash.update(block)
+        hash.update(("%r" % (self.mybbox.highrestuple_pt(),)).encode("ascii"))
+        key = hash.hexdigest()
+        cachedir = _cachedir()
+        if cachedir is None:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                filename = os.path.join(tmpdir, key + ".pdf")
+                self.convertPDF(filename)
+                return _readconvertedPDF(filename, self.mybbox.llx_pt, self.mybbox.lly_pt)
+        filename = os.path.join(cachedir, key + ".pdf")
+        if not os.path.exists(filename):
+            self.convertPDF(filename)
+        return _readconvertedPDF(filename, self.mybbox.llx_pt, self.mybbox.lly_pt)
+
     def processPDF(self, file, writer, context, registry, bbox):
-        logger.warning("EPS file is included as a bitmap created using pipeGS")
-        from pyx import bitmap, canvas
-        from PIL import Image
-        c = canvas.canvas()
-        c.insert(self)
-        i = Image.open(c.pipeGS(device="pngalpha", resolution=600))
-        i.load()
-        b = bitmap.bitmap_pt(self.bbox().llx_pt, self.bbox().lly_pt, i)
-        # we slightly shift the bitmap to re-center it, as the bitmap might contain some additional border
-        # unfortunately we need to construct another bitmap instance for that ...
-        b = bitmap.bitmap_pt(self.bbox().llx_pt + 0.5*(self.bbox().width_pt()-b.bbox().width_pt()),
-                             self.bbox().lly_pt + 0.5*(self.bbox().height_pt()-b.bbox().height_pt()), i)
-        b.processPDF(file, writer, context, registry, bbox)
+        if writer.eps_as_bitmap:
+            logger.warning("EPS file is included as a bitmap created using pipeGS")
+            from pyx import bitmap, canvas
+            from PIL import Image
+            c = canvas.canvas()
+            c.insert(self)
+            i = Image.open(c.pipeGS(device="pngalpha", resolution=600))
+            i.load()
+            b = bitmap.bitmap_pt(self.bbox().llx_pt, self.bbox().lly_pt, i)
+            # we slightly shift the bitmap to re-center it, as the bitmap might contain some additional border
+            # unfortunately we need to construct another bitmap instance for that ...
+            b = bitmap.bitmap_pt(self.bbox().llx_pt + 0.5*(self.bbox().width_pt()-b.bbox().width_pt()),
+                                 self.bbox().lly_pt + 0.5*(self.bbox().height_pt()-b.bbox().height_pt()), i)
+            b.processPDF(file, writer, context, registry, bbox)
+            return
+
+        form, objects = self.readconvertedPDF()
+        registry.add(form)
+        for object in objects:
+            registry.add(object)
+        name = "EPS%s" % form.key[:16]
+        registry.addresource("XObject", name, form)
+        bbox += self.bbox()
+
+        file.write("q\n")
+        self.trafo.processPDF(file, writer, context, registry)
+        file.write("/%s Do\n" % name)
+        file.write("Q\n")
+
+
+class PDFepsform(pdfwriter.PDFobject):
+
+    """form XObject containing the page of an EPS file converted to PDF"""
+
+    def __init__(self, key, mediabox, llx_pt, lly_pt, resources, content):
+        pdfwriter.PDFobject.__init__(self, "epsform", key)
+        self.key = key
+        self.mediabox = mediabox
+        self.llx_pt = llx_pt
+        self.lly_pt = lly_pt
+        self.resources = resources
+        self.content = content
+
+    def write(self, file, writer, registry):
+        if writer.compress:
+            content = zlib.compress(self.content)
+        else:
+            content = self.content
+        file.write("<<\n"
+                   "/Type /XObject\n"
+                   "/Subtype /Form\n"
+                   "/BBox [%g %g %g %g]\n" % self.mediabox)
+        file.write("/Matrix [1 0 0 1 %g %g]\n" % (self.llx_pt, self.lly_pt))
+        if self.resources is not None:
+            file.write("/Resources ")
+            file.write_bytes(pdfwriter.importedrefs(self.resources, self.key, registry))
+            file.write("\n")
+        file.write("/Length %i\n" % len(content))
+        if writer.compress:
+            file.write("/Filter /FlateDecode\n")
+        file.write(">>\n"
+                   "stream\n")
+        file.write_bytes(content)
+        file.write("\nendstream\n")
+
+
+@functools.lru_cache(maxsize=128)
+def _readconvertedPDF(filename, llx_pt, lly_pt):
+    """return the form XObject and the objects it references for the first page of a PDF file
+
+    Only the features used by the pdfwrite device of Ghostscript are
+    supported."""
+    with open(filename, "rb") as f:
+        reader = pdfwriter.PDFreader(io.BytesIO(f.read()))
+    key = os.path.splitext(os.path.basename(filename))[0]
+
+    # descend the page tree to the first page, taking inherited attributes into account
+    catalog = reader.readobject(reader.getref(reader.trailer, b"Root"))
+    node = reader.readrawobject(reader.getref(catalog, b"Pages"))[0]
+    resources = mediabox = None
+    while True:
+        resources = reader.getvalue(node, b"Resources") or resources
+        mediabox = reader.getvalue(node, b"MediaBox") or mediabox
+        kids = reader.getvalue(node, b"Kids")
+        if kids is None:
+            break
+        node = reader.readrawobject(int(kids[1:].split()[0]))[0]
+    if mediabox is None:
+        raise ValueError("media box missing in PDF file %s" % filename)
+    if mediabox.endswith(b"R"):
+        mediabox = reader.readrawobject(int(mediabox.split()[0]))[0]
+    mediabox = tuple(float(x) for x in mediabox.strip(b"[]").split())
+
+    # collect the content streams
+    contents = reader.getvalue(node, b"Contents")
+    if contents is None:
+        contents = b""
+    if contents.endswith(b"R") and not contents.startswith(b"["):
+        dict, stream = reader.readrawobject(int(contents.split()[0]))
+        if stream is None:
+            # an indirect array of content streams
+            contents = dict
+    content = []
+    for refno in re.findall(br"(\d+)\s+\d+\s+R", contents):
+        dict, stream = reader.readrawobject(int(refno))
+        filter = reader.getvalue(dict, b"Filter")
+        if filter in (b"/FlateDecode", b"[/FlateDecode]", b"[ /FlateDecode ]"):
+            stream = zlib.decompress(stream)
+        elif filter is not None:
+            raise ValueError("unsupported content stream filter %s in PDF file %s" % (filter.decode("ascii"), filename))
+        content.append(stream)
+
+    if resources is not None:
+        objects = pdfwriter.importobjects(reader, resources, key)
+    else:
+        objects = []
+    return PDFepsform(key, mediabox, llx_pt, lly_pt, resources, b"\n".join(content)), objects
@@ -21,7 +21,7 @@
 # along with PyX; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
 
-import logging
+import functools, logging, re
 from pyx import bbox, baseclasses, deco, path, pswriter, pdfwriter, svgwriter, trafo, unit
 from . import t1file, afmfile
 
@@ -393,6 +393,43 @@ class SVGT1file(svgwriter.SVGresource, SVGT1mapping):
         xml.endSVGElement("font")
 
 
+@functools.lru_cache(maxsize=1024)
+def _unitglyph(t1file, glyph, convertcharcode):
+    """return the glyph path at the origin for size 1000 and its bbox"""
+    glyphpath = t1file.getglyphpath_pt(0, 0, glyph, 1000, convertcharcode=convertcharcode)
+    return glyphpath, glyphpath.path.bbox()
+
+_symbolidchars = re.compile(r"[^A-Za-z0-9._-]")
+
+def _glyphsymbolid(t1file, glyph):
+    return _symbolidchars.sub("_", "glyph-%s-%s" % (t1file.name, glyph))
+
+
+class SVGT1glyphs(svgwriter.SVGresource):
+
+    """ glyph outlines of a type 1 font defined once as symbols to be used by text output """
+
+    def __init__(self, t1file, glyphnames, charcodes):
+        self.t1file = t1file
+        svgwriter.SVGresource.__init__(self, "t1glyphs", t1file.name)
+        # dicts are used as ordered sets
+        self.glyphnames = dict.fromkeys(glyphnames)
+        self.charcodes = dict.fromkeys(charcodes)
+
+    def merge(self, other):
+        self.glyphnames.update(other.glyphnames)
+        self.charcodes.update(other.charcodes)
+
+    def output(self, xml, writer, registry):
+        for glyphs, convertcharcode in [(self.glyphnames, False), (self.charcodes, True)]:
+            for glyph in glyphs:
+                glyphpath, glyphbbox = _unitglyph(self.t1file, glyph, convertcharcode)
+                xml.startSVGElement("symbol", {"id": _glyphsymbolid(self.t1file, glyph), "overflow": "visible"})
+                xml.startSVGElement("path", {"d": glyphpath.path.returnSVGdata(precision=writer.precision, compact=writer.compact)})
+                xml.endSVGElement("path")
+                xml.endSVGElement("symbol")
+
+
 ##############################################################################
 # basic PyX text output
 ##############################################################################
@@ -574,7 +611,9 @@ class T1text_pt(text_pt):
                 context.selectedfont = sf
                 sf.outputPS(file, writer)
 
-            file.write("%f %f moveto (" % (self.x_pt, self.y_pt))
+            show = writer.operator("show")
+            rmoveto = writer.operator("rmoveto")
+            file.write("%f %f %s (" % (self.x_pt, self.y_pt, writer.operator("moveto")))
             if self.decode:
                 if self.kerning:
                     data = self.font.metric.resolvekernings(self.glyphnames, self.size_pt)
@@ -585,19 +624,19 @@ class T1text_pt(text_pt):
             for i, value in enumerate(data):
                 if self.kerning and i % 2:
                     if value is not None:
-                        file.write(") show\n%f 0 rmoveto (" % (value+self.spaced_pt))
+                        file.write(") %s\n%f 0 %s (" % (show, value+self.spaced_pt, rmoveto))
                     elif self.spaced_pt:
-                        file.write(") show\n%f 0 rmoveto (" % self.spaced_pt)
+                        file.write(") %s\n%f 0 %s (" % (show, self.spaced_pt, rmoveto))
                 else:
                     if i and not self.kerning and self.spaced_pt:
-                        file.write(") show\n%f 0 rmoveto (" % self.spaced_pt)
+                        file.write(") %s\n%f 0 %s (" % (show, self.spaced_pt, rmoveto))
                     if self.decode:
                         value = encoding[value]
                     if 32 < value < 127 and chr(value) not in "()[]<>\\":
                         file.write("%s" % chr(value))
                     else:
                         file.write("\\%03o" % value)
-            file.write(") show\n")
+            file.write(") %s\n" % show)
 
     def processPDF(self, file, writer, context, registry, bbox):
         if not self.ignorebbox:
@@ -699,7 +738,9 @@ class T1text_pt(text_pt):
         # if writer.text_as_path and not self.font.t1file:
         #     logger.warning("Cannot output text as path when font not given by a font file (like for builtin fonts).")
 
-        if writer.text_as_path and self.font.t1file:
+        if writer.text_as_path and self.font.t1file and writer.glyph_symbols:
+            self.processSVGglyphsymbols(xml, writer, context, registry, bbox)
+        elif writer.text_as_path and self.font.t1file:
             deco.decoratedpath(self.textpath(), fillstyles=[]).processSVG(xml, writer, context, registry, bbox)
         else:
             if self.font.t1file is not None:
@@ -759,3 +800,43 @@ class T1text_pt(text_pt):
             if tspan:
                 xml.endSVGElement("tspan")
             xml.endSVGElement("text")
+
+    def processSVGglyphsymbols(self, xml, writer, context, registry, bbox):
+        # text as path, where the glyph outlines are defined as symbols and
+        # referenced at each occurrence (see SVGT1glyphs)
+        if self.decode:
+            if self.kerning:
+                data = self.font.metric.resolvekernings(self.glyphnames, self.size_pt)
+            else:
+                data = self.glyphnames
+        else:
+            data = self.charcodes
+        attrs = {"fill": context.fillcolor}
+        if context.fillopacity != 1:
+            attrs["opacity"] = "%f" % context.fillopacity
+        xml.startSVGElement("g", attrs)
+        scale = self.size_pt / 1000
+        x_pt = self.x_pt
+        y_pt = self.y_pt
+        glyphs = []
+        for i, value in enumerate(data):
+            if self.kerning and i % 2:
+                if value is not None:
+                    x_pt += value
+            else:
+                if i:
+                    x_pt += self.spaced_pt
+                glyphpath, glyphbbox = _unitglyph(self.font.t1file, value, not self.decode)
+                if glyphpath.path.pathitems:
+                    glyphs.append(value)
+                    xml.startSVGElement("use", {"xlink:href": "#%s" % _glyphsymbolid(self.font.t1file, value),
+                                                "transform": "matrix(%f,0,0,%f,%f,%f)" % (scale, scale, x_pt, -y_pt)})
+                    xml.endSVGElement("use")
+                    bbox += glyphbbox.transformed(trafo.trafo_pt(matrix=((scale, 0), (0, scale)), vector=(x_pt, y_pt)))
+                x_pt += scale * glyphpath.wx_pt
+                y_pt += scale * glyphpath.wy_pt
+        xml.endSVGElement("g")
+        if self.decode:
+            registry.add(SVGT1glyphs(self.font.t1file, glyphs, []))
+        else:
+            registry.add(SVGT1glyphs(self.font.t1file, [], glyphs))
@@ -36,7 +36,7 @@
 #      node2 *
 
 
-import struct, binascii, zlib, os, tempfile
+import struct, binascii, zlib, os, tempfile, math
 from . import bbox, baseclasses, color, pdfwriter, unit
 
 
@@ -64,6 +64,135 @@ def coords24bit_pt(coords_pt, min_pt, max_pt):
     return struct.pack(">I", int((coords_pt-min_pt)*16777215.0/(max_pt-min_pt)))[1:]
 
 
+def packnodes(xs_pt, ys_pt, colors, colorcomponents, bbox, flag=True):
+    """return the data of the nodes for a triangle mesh shading
+
+    xs_pt and ys_pt are the coordinates of the nodes, colors are the 8 bit
+    color components of the nodes (colorcomponents bytes per node). Each
+    node is packed into a zero flag byte (when flag is set), the 24 bit
+    coordinates (with respect to bbox), and the color components. Instead
+    of packing every node, the coordinates are packed into 32 bit words at
+    once and the bytes are distributed by strided slice assignments."""
+    count = len(xs_pt)
+    flaglength = 1 if flag else 0
+    recordlength = flaglength + 6 + colorcomponents
+    data = bytearray(count*recordlength)
+    for offset, coords_pt, min_pt, max_pt in [(flaglength, xs_pt, bbox.llx_pt, bbox.urx_pt),
+                                              (flaglength+3, ys_pt, bbox.lly_pt, bbox.ury_pt)]:
+        size_pt = max_pt - min_pt
+        words = struct.pack(">%dI" % count, *[int((coord_pt-min_pt)*16777215.0/size_pt) for coord_pt in coords_pt])
+        for i in range(3):
+            data[offset+i::recordlength] = words[i+1::4]
+    for i in range(colorcomponents):
+        data[flaglength+6+i::recordlength] = colors[i::colorcomponents]
+    return bytes(data)
+
+
+def _thirdrecord(triangle, record1, record2):
+    """return the record of triangle besides record1 and record2
+
+    None is returned unless the triangle consists of the distinct records
+    record1 and record2 and a single other record."""
+    if record1 == record2 or record1 not in triangle or record2 not in triangle:
+        return None
+    others = [record for record in triangle if record != record1 and record != record2]
+    if len(others) != 1:
+        return None
+    return others[0]
+
+
+def striprecords(records):
+    """return the data of a free-form triangle mesh shading from the records of the triangle nodes
+
+    records is a list of the packed nodes (with zero flag bytes) of the
+    triangles, three for each triangle. When a triangle shares an edge with
+    the previous triangle (as it is the case for triangles ordered in
+    strips), only its third node is written using the flag 1 or 2."""
+    data = []
+    a = b = c = None
+    for i in range(0, len(records), 3):
+        triangle = records[i:i+3]
+        d = _thirdrecord(triangle, b, c)
+        if d is not None:
+            a, b, c = b, c, d
+            data.append(b"\001" + d[1:])
+            continue
+        d = _thirdrecord(triangle, a, c)
+        if d is not None:
+            a, b, c = a, c, d
+            data.append(b"\002" + d[1:])
+            continue
+        a, b, c = triangle
+        data.extend(triangle)
+    return b"".join(data)
+
+
+def rasterize(xs_pt, ys_pt, colors, colorcomponents, triangles, bbox, resolution):
+    """return the bitmap data of a triangle mesh
+
+    xs_pt, ys_pt, colors, and colorcomponents describe the nodes as for
+    packnodes and triangles is a flat sequence of node indices, three for
+    each triangle. The area of bbox is rendered at the given resolution
+    in dots per inch. The colors are interpolated linearly within the
+    triangles (Gouraud shading). A pixel is painted by a triangle when its
+    center is inside of the triangle, where the top-left rule ensures that
+    pixels on the common edge of two triangles are painted only once.
+    Later triangles paint over earlier ones. The result is an image with
+    an additional alpha channel set for all painted pixels."""
+    from pyx import bitmap
+    width = max(1, int(math.ceil(bbox.width_pt()*resolution/72.0)))
+    height = max(1, int(math.ceil(bbox.height_pt()*resolution/72.0)))
+    xscale = width/bbox.width_pt() if bbox.width_pt() else 0
+    yscale = height/bbox.height_pt() if bbox.height_pt() else 0
+    # pixel coordinates with the first row at the top
+    xs = [(x_pt-bbox.llx_pt)*xscale for x_pt in xs_pt]
+    ys = [(bbox.ury_pt-y_pt)*yscale for y_pt in ys_pt]
+    pixellength = colorcomponents + 1
+    rowlength = width*pixellength
+    data = bytearray(height*rowlength)
+    for i in range(0, len(triangles), 3):
+        n0, n1, n2 = sorted(triangles[i:i+3], key=ys.__getitem__)
+        x0, y0 = xs[n0], ys[n0]
+        x1, y1 = xs[n1], ys[n1]
+        x2, y2 = xs[n2], ys[n2]
+        det = (x1-x0)*(y2-y0) - (x2-x0)*(y1-y0)
+        if not det:
+            continue
+        # the color components as affine functions of the pixel coordinates
+        planes = []
+        for k in range(colorcomponents):
+            c0 = colors[n0*colorcomponents+k]
+            dc1 = colors[n1*colorcomponents+k] - c0
+            dc2 = colors[n2*colorcomponents+k] - c0
+            a = (dc1*(y2-y0) - dc2*(y1-y0))/det
+            b = (dc2*(x1-x0) - dc1*(x2-x0))/det
+            planes.append((a, b, c0 + 0.5 - a*x0 - b*y0))
+        # the middle node is on the right side when det is positive
+        for row in range(max(0, int(math.ceil(y0-0.5))), min(height, int(math.ceil(y2-0.5)))):
+            y = row + 0.5
+            xlong = x0 + (x2-x0)*(y-y0)/(y2-y0)
+            if y < y1:
+                xshort = x0 + (x1-x0)*(y-y0)/(y1-y0)
+            else:
+                xshort = x1 + (x2-x1)*(y-y1)/(y2-y1)
+            if det > 0:
+                xleft, xright = xlong, xshort
+            else:
+                xleft, xright = xshort, xlong
+            start = max(0, int(math.ceil(xleft-0.5)))
+            stop = min(width, int(math.ceil(xright-0.5)))
+            if start >= stop:
+                continue
+            offset = row*rowlength + start*pixellength
+            end = row*rowlength + stop*pixellength
+            x = start + 0.5
+            for k, (a, b, c) in enumerate(planes):
+                c += a*x + b*y
+                data[offset+k:end:pixellength] = bytes([int(c + a*j) for j in range(stop-start)])
+            data[offset+colorcomponents:end:pixellength] = b"\377"*(stop-start)
+    return bitmap.image(width, height, {1: "LA", 3: "RGBA", 4: "CMYKA"}[colorcomponents], bytes(data))
+
+
 class PDFGenericResource(pdfwriter.PDFobject):
 
     def __init__(self, type, name, content):
@@ -94,63 +223,83 @@ class mesh(baseclasses.canvasitem):
                 for node in element.nodes:
                     if len(node.coords_pt) != 2:
                         raise ValueError("two dimensional coordinates expected")
+        self._bbox = None
 
     def bbox(self):
-        return bbox.bbox_pt(min([node.coords_pt[0] for element in self.elements for node in element.nodes]),
-                            min([node.coords_pt[1] for element in self.elements for node in element.nodes]),
-                            max([node.coords_pt[0] for element in self.elements for node in element.nodes]),
-                            max([node.coords_pt[1] for element in self.elements for node in element.nodes]))
+        # the bbox is calculated once and cached
+        if self._bbox is None:
+            xs_pt = [node.coords_pt[0] for element in self.elements for node in element.nodes]
+            ys_pt = [node.coords_pt[1] for element in self.elements for node in element.nodes]
+            self._bbox = bbox.bbox_pt(min(xs_pt), min(ys_pt), max(xs_pt), max(ys_pt))
+        return self._bbox.copy()
+
+    def colorspacestring(self):
+        return self.elements[0].nodes[0].value.colorspacestring()
+
+    def colorcomponents(self):
+        return len(self.elements[0].nodes[0].value.to8bitbytes())
+
+    def shadingdict(self, bbox):
+        return ("/ShadingType 4\n"
+                "/ColorSpace %s\n"
+                "/BitsPerCoordinate 24\n"
+                "/BitsPerComponent 8\n"
+                "/BitsPerFlag 8\n"
+                "/Decode [%f %f %f %f %s]\n" % (self.colorspacestring(),
+                                                bbox.llx_pt, bbox.urx_pt, bbox.lly_pt, bbox.ury_pt,
+                                                " ".join(["0 1"]*self.colorcomponents())))
+
+    def nodearrays(self):
+        """return the nodes and triangles of the mesh as flat sequences
+
+        The result is a tuple of the x and y coordinates of the nodes, the
+        8 bit color components of the nodes, and the node indices of the
+        triangles (three for each triangle)."""
+        nodes = [node for element in self.elements for node in element.nodes]
+        return ([node.coords_pt[0] for node in nodes],
+                [node.coords_pt[1] for node in nodes],
+                b"".join([node.value.to8bitbytes() for node in nodes]),
+                range(len(nodes)))
 
     def data(self, bbox):
-        return b"".join([b"\000" + coords24bit_pt(node.coords_pt[0], bbox.llx_pt, bbox.urx_pt) +
-                                   coords24bit_pt(node.coords_pt[1], bbox.lly_pt, bbox.ury_pt) +
-                                   node.value.to8bitbytes()
-                         for element in self.elements for node in element.nodes])
+        # pack every node once and collect the packed nodes of the triangles
+        xs_pt, ys_pt, colors, triangles = self.nodearrays()
+        recordlength = 7 + self.colorcomponents()
+        nodes = packnodes(xs_pt, ys_pt, colors, self.colorcomponents(), bbox)
+        records = [nodes[i:i+recordlength] for i in range(0, len(nodes), recordlength)]
+        return striprecords(list(map(records.__getitem__, triangles)))
+
+    def tobitmap(self, resolution, rgb=False):
+        """return the mesh rendered into a bitmap at the given resolution
+
+        The colors of cmyk meshs are converted to rgb when rgb is set."""
+        from pyx import bitmap
+        thisbbox = self.bbox()
+        xs_pt, ys_pt, colors, triangles = self.nodearrays()
+        colorcomponents = self.colorcomponents()
+        if rgb and colorcomponents == 4:
+            colors = b"".join([color.cmyk(*[value/255.0 for value in colors[i:i+4]]).rgb().to8bitbytes()
+                               for i in range(0, len(colors), 4)])
+            colorcomponents = 3
+        image = rasterize(xs_pt, ys_pt, colors, colorcomponents, triangles, thisbbox, resolution)
+        return bitmap.bitmap_pt(thisbbox.llx_pt, thisbbox.lly_pt, image,
+                                width_pt=thisbbox.width_pt(), height_pt=thisbbox.height_pt())
 
     def processPS(self, file, writer, context, registry, bbox):
         if writer.mesh_as_bitmap:
-            from pyx import bitmap, canvas
-            from PIL import Image
-            c = canvas.canvas()
-            c.insert(self)
-            i = Image.open(c.pipeGS("pngalpha", resolution=writer.mesh_as_bitmap_resolution))
-            i.load()
-            b = bitmap.bitmap_pt(self.bbox().llx_pt, self.bbox().lly_pt, i)
-            # we slightly shift the bitmap to re-center it, as the bitmap might contain some additional border
-            # unfortunately we need to construct another bitmap instance for that ...
-            b = bitmap.bitmap_pt(self.bbox().llx_pt + 0.5*(self.bbox().width_pt()-b.bbox().width_pt()),
-                                 self.bbox().lly_pt + 0.5*(self.bbox().height_pt()-b.bbox().height_pt()), i)
-            b.processPS(file, writer, context, registry, bbox)
+            self.tobitmap(writer.mesh_as_bitmap_resolution).processPS(file, writer, context, registry, bbox)
         else:
             thisbbox = self.bbox()
             bbox += thisbbox
-            file.write("""<< /ShadingType 4
-/ColorSpace %s
-/BitsPerCoordinate 24
-/BitsPerComponent 8
-/BitsPerFlag 8
-/Decode [%f %f %f %f %s]
-/DataSource currentfile /ASCIIHexDecode filter /FlateDecode filter
->> shfill\n""" % (self.elements[0].nodes[0].value.colorspacestring(),
-                  thisbbox.llx_pt, thisbbox.urx_pt, thisbbox.lly_pt, thisbbox.ury_pt,
-                  " ".join(["0 1" for value in self.elements[0].nodes[0].value.to8bitbytes()])))
+            file.write("<< %s"
+                       "/DataSource currentfile /ASCIIHexDecode filter /FlateDecode filter\n"
+                       ">> shfill\n" % self.shadingdict(thisbbox))
             file.write_bytes(binascii.b2a_hex(zlib.compress(self.data(thisbbox))))
             file.write(">\n")
 
     def processPDF(self, file, writer, context, registry, bbox):
         if writer.mesh_as_bitmap:
-            from pyx import bitmap, canvas
-            from PIL import Image
-            c = canvas.canvas()
-            c.insert(self)
-            i = Image.open(c.pipeGS("pngalpha", resolution=writer.mesh_as_bitmap_resolution))
-            i.load()
-            b = bitmap.bitmap_pt(self.bbox().llx_pt, self.bbox().lly_pt, i)
-            # we slightly shift the bitmap to re-center it, as the bitmap might contain some additional border
-            # unfortunately we need to construct another bitmap instance for that ...
-            b = bitmap.bitmap_pt(self.bbox().llx_pt + 0.5*(self.bbox().width_pt()-b.bbox().width_pt()),
-                                 self.bbox().lly_pt + 0.5*(self.bbox().height_pt()-b.bbox().height_pt()), i)
-            b.processPDF(file, writer, context, registry, bbox)
+            self.tobitmap(writer.mesh_as_bitmap_resolution).processPDF(file, writer, context, registry, bbox)
         else:
             thisbbox = self.bbox()
             bbox += thisbbox
@@ -162,33 +311,104 @@ class mesh(baseclasses.canvasitem):
                 filter = ""
             name = "shading-%s" % id(self)
             shading = PDFGenericResource("shading", name, ("""<<
-/ShadingType 4
-/ColorSpace %s
-/BitsPerCoordinate 24
-/BitsPerComponent 8
-/BitsPerFlag 8
-/Decode [%f %f %f %f %s]
-/Length %i
+%s/Length %i
 %s>>
 stream
-""" %            (self.elements[0].nodes[0].value.colorspacestring(),
-                  thisbbox.llx_pt, thisbbox.urx_pt, thisbbox.lly_pt, thisbbox.ury_pt,
-                  " ".join(["0 1" for value in self.elements[0].nodes[0].value.to8bitbytes()]),
-                  len(d), filter)).encode('ascii') + d + b"\nendstream\n")
+""" %            (self.shadingdict(thisbbox), len(d), filter)).encode('ascii') + d + b"\nendstream\n")
             registry.add(shading)
             registry.addresource("Shading", name, shading)
             file.write("/%s sh\n" % name)
 
     def processSVG(self, xml, writer, context, registry, bbox):
-        from pyx import bitmap, canvas
-        from PIL import Image
-        c = canvas.canvas()
-        c.insert(self)
-        i = Image.open(c.pipeGS("pngalpha", resolution=writer.mesh_as_bitmap_resolution))
-        i.load()
-        b = bitmap.bitmap_pt(self.bbox().llx_pt, self.bbox().lly_pt, i)
-        # we slightly shift the bitmap to re-center it, as the bitmap might contain some additional border
-        # unfortunately we need to construct another bitmap instance for that ...
-        b = bitmap.bitmap_pt(self.bbox().llx_pt + 0.5*(self.bbox().width_pt()-b.bbox().width_pt()),
-                             self.bbox().lly_pt + 0.5*(self.bbox().height_pt()-b.bbox().height_pt()), i)
-        b.processSVG(xml, writer, context, registry, bbox)
+        self.tobitmap(writer.mesh_as_bitmap_resolution, rgb=True).processSVG(xml, writer, context, registry, bbox)
+
+
+class arraymesh(mesh):
+
+    """triangular mesh given by arrays
+
+    This mesh avoids the creation of node and element instances for large
+    meshs. coords_pt is a flat sequence of the x and y coordinates of the
+    nodes, values is a flat sequence of the color components of the nodes
+    in the range 0 to 1, and triangles is a flat sequence of node indices,
+    three for each triangle. Any sequences like lists or instances of
+    array.array can be used. The color space is defined by colorclass
+    being color.gray, color.rgb or color.cmyk. All nodes are taken into
+    account for the bbox.
+    """
+
+    def __init__(self, coords_pt, values, triangles, colorclass=color.rgb, check=1):
+        self.coords_pt = coords_pt
+        self.values = values
+        self.triangles = triangles
+        self.colorclass = colorclass
+        self.nodecount = len(coords_pt)//2
+        if check:
+            if len(coords_pt) % 2:
+                raise ValueError("two dimensional coordinates expected")
+            if len(triangles) % 3:
+                raise ValueError("triangular mesh expected")
+            if len(values) != self.nodecount*self.colorcomponents():
+                raise ValueError("color values of all nodes expected")
+            if triangles and (min(triangles) < 0 or max(triangles) >= self.nodecount):
+                raise ValueError("node index out of range")
+        self._bbox = None
+
+    def bbox(self):
+        if self._bbox is None:
+            xs_pt = self.coords_pt[0::2]
+            ys_pt = self.coords_pt[1::2]
+            self._bbox = bbox.bbox_pt(min(xs_pt), min(ys_pt), max(xs_pt), max(ys_pt))
+        return self._bbox.copy()
+
+    def colorspacestring(self):
+        return self.colorclass().colorspacestring()
+
+    def colorcomponents(self):
+        return len(self.colorclass().to8bitbytes())
+
+    def nodearrays(self):
+        return (self.coords_pt[0::2], self.coords_pt[1::2],
+                bytes([int(value*255) for value in self.values]), self.triangles)
+
+
+class latticemesh(arraymesh):
+
+    """mesh of nodes arranged in a lattice
+
+    The nodes are given by the flat sequences coords_pt and values as for
+    arraymesh, where the nodes are ordered row by row with columns nodes
+    per row. Each quadrilateral of neighboring nodes is split into two
+    triangles. The mesh is written as a lattice-form shading, which
+    contains each node only once.
+    """
+
+    def __init__(self, coords_pt, values, columns, colorclass=color.rgb, check=1):
+        self.columns = columns
+        arraymesh.__init__(self, coords_pt, values, [], colorclass=colorclass, check=check)
+        if check:
+            if columns < 2 or self.nodecount % columns or self.nodecount < 2*columns:
+                raise ValueError("at least two rows of columns nodes expected")
+
+    def shadingdict(self, bbox):
+        return ("/ShadingType 5\n"
+                "/ColorSpace %s\n"
+                "/BitsPerCoordinate 24\n"
+                "/BitsPerComponent 8\n"
+                "/VerticesPerRow %d\n"
+                "/Decode [%f %f %f %f %s]\n" % (self.colorspacestring(), self.columns,
+                                                bbox.llx_pt, bbox.urx_pt, bbox.lly_pt, bbox.ury_pt,
+                                                " ".join(["0 1"]*self.colorcomponents())))
+
+    def nodearrays(self):
+        xs_pt, ys_pt, colors, triangles = arraymesh.nodearrays(self)
+        columns = self.columns
+        triangles = []
+        for i in range(self.nodecount - columns):
+            if (i+1) % columns:
+                triangles.extend([i, i+1, i+columns, i+1, i+columns+1, i+columns])
+        return xs_pt, ys_pt, colors, triangles
+
+    def data(self, bbox):
+        xs_pt, ys_pt, colors, triangles = arraymesh.nodearrays(self)
+        return packnodes(xs_pt, ys_pt, colors, self.colorcomponents(), bbox, flag=False)
@@ -21,7 +21,7 @@
 # along with PyX; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
 
-import math, functools
+import array, bisect, heapq, math, functools, re
 from . import mathutils, trafo, unit
 from . import bbox as bboxmodule
 
@@ -40,6 +40,71 @@ def set(epsilon=None):
         _epsilon = epsilon
 
 
+################################################################################
+# output helpers
+################################################################################
+
+# operator templates for the output of path data, where "#" is replaced by the
+# number format (moveto, lineto, curveto, closepath, and the relative lineto
+# and curveto, if available); "PScompact" uses the procedure aliases defined
+# by pswriter.PScompactaliases
+_outputoperators = {"PS": ("# # moveto\n", "# # lineto\n", "# # # # # # curveto\n", "closepath\n",
+                           "# # rlineto\n", "# # # # # # rcurveto\n"),
+                    "PScompact": ("# # m\n", "# # l\n", "# # # # # # c\n", "h\n",
+                                  "# # rl\n", "# # # # # # rc\n"),
+                    "PDF": ("# # m\n", "# # l\n", "# # # # # # c\n", "h\n"),
+                    "SVG": ("M# #", "L# #", "C# # # # # #", "Z", "l# #", "c# # # # # #")}
+_outputnumberformats = {"PS": "%g", "PScompact": "%g", "PDF": "%f", "SVG": "%g"}
+
+@functools.lru_cache(maxsize=None)
+def _outputtemplates(kind, precision):
+    """return templates for moveto, lineto, curveto, closepath, rlineto, and rcurveto
+
+    kind is one of "PS", "PScompact", "PDF", or "SVG" (PDF does not provide
+    relative operators). When precision is None, the traditional number
+    format of the kind is used, otherwise coordinates are written with
+    precision decimals (to be cleaned up by _stripzeros).
+    """
+    if precision is None:
+        numberformat = _outputnumberformats[kind]
+    else:
+        numberformat = "%%.%df" % precision
+    return tuple(operator.replace("#", numberformat) for operator in _outputoperators[kind])
+
+_trailingzeros = re.compile(r"(\.[0-9]*?[1-9])0+(?![0-9])|\.0+(?![0-9])")
+
+def _stripzeros(data, precision):
+    """remove trailing zeros of numbers in data written with the given precision"""
+    if precision is None:
+        return data
+    return _trailingzeros.sub(r"\1", data)
+
+_svgcommands = re.compile(r"([MLCZlc])")
+# leading zeros and the sign of negative zeros
+_svgzeros = re.compile(r"(?<![0-9.])0(?=\.)|(?<![0-9.])-(?=0(?![0-9.]))")
+# separators between a number containing a decimal point and a number starting with one
+_svgdotseparators = re.compile(r"(\.[0-9]+) (?=\.)")
+
+def _compactsvgdata(data):
+    """return compacted SVG path data
+
+    Repeated commands are omitted, leading zeros are removed from numbers,
+    and separators are written only when needed to delimit the numbers.
+    """
+    parts = _svgcommands.split(data)
+    result = [parts[0]]
+    command = None
+    for i in range(1, len(parts), 2):
+        if parts[i] == command and command not in "MZ":
+            result.append(" ")
+        else:
+            command = parts[i]
+            result.append(command)
+        result.append(parts[i+1])
+    data = _svgzeros.sub("", "".join(result)).replace(" -", "-")
+    return _svgdotseparators.sub(lambda match: match.group(1), data)
+
+
 ################################################################################
 # normsubpathitems
 ################################################################################
@@ -67,6 +132,16 @@ class normsubpathitem:
         """return a tuple of params and the total length arc length in pts"""
         pass
 
+    def _arclenpieces_pt(self, epsilon):
+        """return pieces for the tabulation of the arc length
+
+        Returns a list of tuples (t0, t1, arclen_pt, ls_pt), where the piece
+        reaches from param t0 to t1 and has the arc length arclen_pt. ls_pt
+        is None when the param is proportional to the arc length within the
+        piece, otherwise it is a tuple of the lengths of the three segments
+        of the control polygon of the piece, see _arclenpiecesparam."""
+        pass
+
     def arclentoparam_pt(self, lengths_pt, epsilon):
         """return a tuple of params"""
         pass
@@ -142,17 +217,37 @@ class normsubpathitem:
         """return transformed normsubpathitem according to trafo"""
         pass
 
+    def _outputcoords(self):
+        """return the coordinates to be written when outputting the normsubpathitem
+
+        The result is a tuple of 2 coordinates for a line, 6 coordinates for
+        a curve, and may be empty when nothing needs to be written.
+        """
+        pass
+
+    def _outputdata(self, templates, inverse_y):
+        """return path data for the templates as returned by _outputtemplates"""
+        coords = self._outputcoords()
+        if inverse_y:
+            coords = tuple(-coord if i % 2 else coord for i, coord in enumerate(coords))
+        if len(coords) == 2:
+            return templates[1] % coords
+        elif coords:
+            return templates[2] % coords
+        return ""
+
     def outputPS(self, file, writer):
         """write PS code corresponding to normsubpathitem to file"""
-        pass
+        kind = "PScompact" if writer.compact else "PS"
+        file.write(_stripzeros(self._outputdata(_outputtemplates(kind, writer.precision), False), writer.precision))
 
     def outputPDF(self, file, writer):
         """write PDF code corresponding to normsubpathitem to file"""
-        pass
+        file.write(_stripzeros(self._outputdata(_outputtemplates("PDF", writer.precision), False), writer.precision))
 
-    def returnSVGdata(self, inverse_y):
+    def returnSVGdata(self, inverse_y, precision=None):
         """return SVG code corresponding to normsubpathitem"""
-        pass
+        return _stripzeros(self._outputdata(_outputtemplates("SVG", precision), inverse_y), precision)
 
 
 class normline_pt(normsubpathitem):
@@ -179,6 +274,9 @@ class normline_pt(normsubpathitem):
         """return a tuple of params"""
         return self._arclentoparam_pt(lengths_pt, epsilon)[0]
 
+    def _arclenpieces_pt(self, epsilon):
+        return [(0, 1, math.hypot(self.x0_pt-self.x1_pt, self.y0_pt-self.y1_pt), None)]
+
     def arclen_pt(self,  epsilon, upper=False):
         return math.hypot(self.x0_pt-self.x1_pt, self.y0_pt-self.y1_pt)
 
@@ -203,6 +301,14 @@ class normline_pt(normsubpathitem):
 
     def intersect(self, other, epsilon):
         if isinstance(other, normline_pt):
+            # There can be no intersection point if the bounding boxes
+            # (enlarged by epsilon) do not overlap.
+            if (max(self.x0_pt, self.x1_pt) + epsilon < min(other.x0_pt, other.x1_pt) or
+                max(other.x0_pt, other.x1_pt) + epsilon < min(self.x0_pt, self.x1_pt) or
+                max(self.y0_pt, self.y1_pt) + epsilon < min(other.y0_pt, other.y1_pt) or
+                max(other.y0_pt, other.y1_pt) + epsilon < min(self.y0_pt, self.y1_pt)):
+                return []
+
             a_deltax_pt = self.x1_pt - self.x0_pt
             a_deltay_pt = self.y1_pt - self.y0_pt
 
@@ -225,7 +331,7 @@ class normline_pt(normsubpathitem):
                 # account.
                 if short_self:
                     sx_pt = 0.5*(self.x0_pt + self.x1_pt)
-                    sy_pt = 0.5*(self.y0_pt + self.x1_pt)
+                    sy_pt = 0.5*(self.y0_pt + self.y1_pt)
                 if short_other:
                     ox_pt = 0.5*(other.x0_pt + other.x1_pt)
                     oy_pt = 0.5*(other.y0_pt + other.y1_pt)
@@ -350,16 +456,8 @@ class normline_pt(normsubpathitem):
     def transformed(self, trafo):
         return normline_pt(*(trafo.apply_pt(self.x0_pt, self.y0_pt) + trafo.apply_pt(self.x1_pt, self.y1_pt)))
 
-    def outputPS(self, file, writer):
-        file.write("%g %g lineto\n" % (self.x1_pt, self.y1_pt))
-
-    def outputPDF(self, file, writer):
-        file.write("%f %f l\n" % (self.x1_pt, self.y1_pt))
-
-    def returnSVGdata(self, inverse_y):
-        if inverse_y:
-            return "L%g %g" % (self.x1_pt, -self.y1_pt)
-        return "L%g %g" % (self.x1_pt, self.y1_pt)
+    def _outputcoords(self):
+        return self.x1_pt, self.y1_pt
 
 
 class normcurve_pt(normsubpathitem):
@@ -497,6 +595,19 @@ class normcurve_pt(normsubpathitem):
                 params.append(a.subparamtoparam(param_a))
         return params, arclen_a_pt + arclen_b_pt
 
+    def _arclenpieces_pt(self, epsilon, t0=0, t1=1):
+        # split the curve as in _arclentoparam_pt, where the normlines
+        # approximating the curve become the pieces
+        tm = 0.5*(t0+t1)
+        pieces = []
+        for subcurve, s0, s1 in zip(self._split(epsilon=epsilon), [t0, tm], [tm, t1]):
+            if isinstance(subcurve, normcurve_pt):
+                pieces.extend(subcurve._arclenpieces_pt(0.5*epsilon, s0, s1))
+            else:
+                pieces.append((s0, s1, subcurve.arclen_pt(0.5*epsilon),
+                               (subcurve.l1_pt, subcurve.l2_pt, subcurve.l3_pt)))
+        return pieces
+
     def arclentoparam_pt(self, lengths_pt, epsilon):
         """return a tuple of params"""
         return self._arclentoparam_pt(lengths_pt, epsilon)[0]
@@ -563,11 +674,148 @@ class normcurve_pt(normsubpathitem):
         # Bezier curves.
         if not self.cbox().enlarged_pt(epsilon).intersects(other.cbox()):
             return []
-        a, b = self._split(epsilon=epsilon, intersect=True)
-        # To improve the performance in the general case we alternate the
-        # splitting process between the two normsubpathitems
-        return ( [(a.subparamtoparam(a_t), o_t) for o_t, a_t in other.intersect(a, epsilon)] +
-                 [(b.subparamtoparam(b_t), o_t) for o_t, b_t in other.intersect(b, epsilon)] )
+        # We first try to solve the problem directly, i.e. by the roots of a
+        # cubic for a line and by Bezier clipping for a curve. The recursive
+        # subdivision below is used when they fail for degenerate cases.
+        if isinstance(other, normline_pt):
+            result = self._intersectline(other, epsilon)
+        else:
+            result = self._intersectcurve(other, epsilon)
+        if result is not None:
+            return result
+        return _intersectsplit(self, other, epsilon)
+
+    def _intersectline(self, other, epsilon):
+        """return the intersections with the normline_pt other
+
+        The intersections are the roots of the cubic polynomial describing
+        the distance of the curve from the line. In addition, the extrema of
+        the distance closer than epsilon to the line are taken into account
+        to find touching points. As for two lines, parameters out of range
+        are corrected only when the corrected points on the curve and on the
+        line are still closer than epsilon. None is returned for short lines
+        and curves lying on the line.
+        """
+        dx_pt = other.x1_pt - other.x0_pt
+        dy_pt = other.y1_pt - other.y0_pt
+        l_pt = math.hypot(dx_pt, dy_pt)
+        if l_pt < epsilon:
+            return None
+        # signed distances of the control points from the line
+        d0_pt, d1_pt, d2_pt, d3_pt = [((x_pt-other.x0_pt)*dy_pt - (y_pt-other.y0_pt)*dx_pt)/l_pt
+                                      for x_pt, y_pt in [(self.x0_pt, self.y0_pt), (self.x1_pt, self.y1_pt),
+                                                         (self.x2_pt, self.y2_pt), (self.x3_pt, self.y3_pt)]]
+        if max(abs(d0_pt), abs(d1_pt), abs(d2_pt), abs(d3_pt)) < epsilon:
+            return None
+        # the distance in power basis, where tiny leading coefficients are
+        # skipped for the numerical stability of the root finding
+        cs = [-d0_pt+3*d1_pt-3*d2_pt+d3_pt, 3*d0_pt-6*d1_pt+3*d2_pt, 3*d1_pt-3*d0_pt, d0_pt]
+        scale = max(abs(c) for c in cs)
+        while abs(cs[0]) < 1e-12*scale:
+            cs.pop(0)
+        params = mathutils.realpolyroots(*cs)
+        # improve the roots by a Newton step
+        dcs = [(len(cs)-1-i)*c for i, c in enumerate(cs[:-1])]
+        for i, t in enumerate(params):
+            dd_pt = sum(c*t**(len(dcs)-1-j) for j, c in enumerate(dcs))
+            if dd_pt:
+                params[i] = t - sum(c*t**(len(cs)-1-j) for j, c in enumerate(cs))/dd_pt
+        params.extend(t for t in mathutils.realpolyroots(*dcs)
+                      if abs(sum(c*t**(len(cs)-1-j) for j, c in enumerate(cs))) < epsilon)
+
+        result = []
+        points_pt = []
+        for t in sorted(params):
+            # the parameter on the line is taken from the point on the
+            # (possibly extended) curve before both are corrected
+            (x_pt, y_pt), = self.at_pt([t])
+            u = ((x_pt-other.x0_pt)*dx_pt + (y_pt-other.y0_pt)*dy_pt)/(l_pt*l_pt)
+            if not (0 <= t <= 1 and 0 <= u <= 1):
+                t = min(1, max(0, t))
+                u = min(1, max(0, u))
+                (x_pt, y_pt), = self.at_pt([t])
+            if math.hypot(other.x0_pt + u*dx_pt - x_pt, other.y0_pt + u*dy_pt - y_pt) >= epsilon:
+                continue
+            # skip the same intersection found by a root and an extremum
+            if points_pt and math.hypot(x_pt-points_pt[-1][0], y_pt-points_pt[-1][1]) < epsilon:
+                continue
+            result.append((t, u))
+            points_pt.append((x_pt, y_pt))
+        return result
+
+    def _intersectcurve(self, other, epsilon):
+        """return the intersections with the normcurve_pt other by Bezier clipping
+
+        Alternately, the parameter range of one curve is reduced to the range
+        where its control polygon overlaps with the fat line of the other curve,
+        i.e. the band around the chord containing the other curve (widened by
+        epsilon). When the range is not reduced by at least 20%, the larger
+        curve is split in halves instead. None is returned when the number of
+        clipping steps grows too large, which happens for overlapping curves.
+        """
+        result = []
+        # stack of tuples (coords_a, a0, a1, coords_b, b0, b1, swapped), where
+        # coords_a and coords_b are the control points of the ranges a0 to a1
+        # and b0 to b1 of self and other (being swapped when swapped is set)
+        stack = [(self._coords(), 0, 1, other._coords(), 0, 1, False)]
+        steps = 0
+        while stack:
+            steps += 1
+            if steps > 500:
+                return None
+            coords_a, a0, a1, coords_b, b0, b1, swapped = stack.pop()
+            size_a = _coordssize_pt(coords_a)
+            size_b = _coordssize_pt(coords_b)
+            if size_a < epsilon and size_b < epsilon:
+                if swapped:
+                    result.append((0.5*(b0+b1), 0.5*(a0+a1)))
+                else:
+                    result.append((0.5*(a0+a1), 0.5*(b0+b1)))
+                continue
+            if _flatcoords(coords_a, epsilon):
+                # intersect the chord of a with b and project the
+                # intersection points back on a
+                intersections = normcurve_pt(*coords_b)._intersectline(normline_pt(*(coords_a[:2]+coords_a[6:])), epsilon)
+                if intersections is None:
+                    return None
+                for t_b, t_a in intersections:
+                    t_a = _projectparam(coords_a, t_a, *_splitcoords(coords_b, t_b)[1][:2])
+                    if swapped:
+                        result.append((b0 + (b1-b0)*t_b, a0 + (a1-a0)*t_a))
+                    else:
+                        result.append((a0 + (a1-a0)*t_a, b0 + (b1-b0)*t_b))
+                continue
+            clipped = _fatlineclip(coords_a, coords_b, epsilon)
+            if clipped is None:
+                # no overlap
+                continue
+            tmin, tmax = clipped
+            if tmax - tmin > 0.8:
+                # split the larger curve in halves
+                if size_a < size_b:
+                    coords_a, a0, a1, coords_b, b0, b1, swapped = coords_b, b0, b1, coords_a, a0, a1, not swapped
+                left, right = _splitcoords(coords_a, 0.5)
+                am = 0.5*(a0+a1)
+                stack.append((coords_b, b0, b1, left, a0, am, not swapped))
+                stack.append((coords_b, b0, b1, right, am, a1, not swapped))
+            else:
+                coords_a = _partcoords(coords_a, tmin, tmax)
+                a0, a1 = a0 + (a1-a0)*tmin, a0 + (a1-a0)*tmax
+                stack.append((coords_b, b0, b1, coords_a, a0, a1, not swapped))
+        # remove intersections found several times at the borders of the ranges
+        result.sort()
+        points_pt = []
+        for t_a, t_b in result[:]:
+            (x_pt, y_pt), = self.at_pt([t_a])
+            if points_pt and math.hypot(x_pt-points_pt[-1][0], y_pt-points_pt[-1][1]) < epsilon:
+                result.remove((t_a, t_b))
+            else:
+                points_pt.append((x_pt, y_pt))
+        return result
+
+    def _coords(self):
+        """return the control point coordinates as a tuple"""
+        return self.x0_pt, self.y0_pt, self.x1_pt, self.y1_pt, self.x2_pt, self.y2_pt, self.x3_pt, self.y3_pt
 
     def modifiedbegin_pt(self, x_pt, y_pt):
         return normcurve_pt(x_pt, y_pt,
@@ -672,16 +920,8 @@ class normcurve_pt(normsubpathitem):
         x3_pt, y3_pt = trafo.apply_pt(self.x3_pt, self.y3_pt)
         return normcurve_pt(x0_pt, y0_pt, x1_pt, y1_pt, x2_pt, y2_pt, x3_pt, y3_pt)
 
-    def outputPS(self, file, writer):
-        file.write("%g %g %g %g %g %g curveto\n" % (self.x1_pt, self.y1_pt, self.x2_pt, self.y2_pt, self.x3_pt, self.y3_pt))
-
-    def outputPDF(self, file, writer):
-        file.write("%f %f %f %f %f %f c\n" % (self.x1_pt, self.y1_pt, self.x2_pt, self.y2_pt, self.x3_pt, self.y3_pt))
-
-    def returnSVGdata(self, inverse_y):
-        if inverse_y:
-            return "C%g %g %g %g %g %g" % (self.x1_pt, -self.y1_pt, self.x2_pt, -self.y2_pt, self.x3_pt, -self.y3_pt)
-        return "C%g %g %g %g %g %g" % (self.x1_pt, self.y1_pt, self.x2_pt, self.y2_pt, self.x3_pt, self.y3_pt)
+    def _outputcoords(self):
+        return self.x1_pt, self.y1_pt, self.x2_pt, self.y2_pt, self.x3_pt, self.y3_pt
 
     def x_pt(self, t):
         return (((  self.x3_pt-3*self.x2_pt+3*self.x1_pt-self.x0_pt)*t +
@@ -780,6 +1020,175 @@ class _rightnormcurve_pt(normcurve_pt):
         return 0.5+0.5*param
 
 
+def _intersectsplit(item, other, epsilon):
+    """return the intersections of the normsubpathitems item and other by recursive subdivision
+
+    In contrast to the intersect methods, the subdivided curves are not passed
+    to the direct solutions again, as those already failed for the whole curve.
+    """
+    if isinstance(item, normline_pt):
+        if isinstance(other, normline_pt):
+            return item.intersect(other, epsilon)
+        return [(i_t, o_t) for o_t, i_t in _intersectsplit(other, item, epsilon)]
+    if not item.cbox().enlarged_pt(epsilon).intersects(other.cbox()):
+        return []
+    a, b = item._split(epsilon=epsilon, intersect=True)
+    # To improve the performance in the general case we alternate the
+    # splitting process between the two normsubpathitems
+    return ( [(a.subparamtoparam(a_t), o_t) for o_t, a_t in _intersectsplit(other, a, epsilon)] +
+             [(b.subparamtoparam(b_t), o_t) for o_t, b_t in _intersectsplit(other, b, epsilon)] )
+
+
+def _splitcoords(coords, t):
+    """return the control point coordinates of the two parts of a Bezier curve split at t
+
+    coords are the coordinates of the four control points of the curve."""
+    x0, y0, x1, y1, x2, y2, x3, y3 = coords
+    s = 1-t
+    x01, y01 = s*x0 + t*x1, s*y0 + t*y1
+    x12, y12 = s*x1 + t*x2, s*y1 + t*y2
+    x23, y23 = s*x2 + t*x3, s*y2 + t*y3
+    x012, y012 = s*x01 + t*x12, s*y01 + t*y12
+    x123, y123 = s*x12 + t*x23, s*y12 + t*y23
+    x, y = s*x012 + t*x123, s*y012 + t*y123
+    return (x0, y0, x01, y01, x012, y012, x, y), (x, y, x123, y123, x23, y23, x3, y3)
+
+
+def _partcoords(coords, t0, t1):
+    """return the control point coordinates of the part of a Bezier curve between t0 and t1"""
+    if t1 < 1:
+        coords = _splitcoords(coords, t1)[0]
+    if t0 > 0:
+        coords = _splitcoords(coords, t0/t1)[1]
+    return coords
+
+
+def _flatcoords(coords, epsilon):
+    """return whether a Bezier curve can be replaced by its chord within epsilon
+
+    The criterion is the one used by normcurve_pt._split in intersect mode."""
+    x0, y0, x1, y1, x2, y2, x3, y3 = coords
+    l0 = math.hypot(x3-x0, y3-y0)
+    if l0 < epsilon:
+        return False
+    if abs((x3-x0)*(y0-y1) - (x0-x1)*(y3-y0)) >= epsilon*l0 or abs((x0-x3)*(y3-y2) - (x3-x2)*(y0-y3)) >= epsilon*l0:
+        return False
+    # the control points must not go backwards along the chord
+    return ((x1-x0)*(x3-x0)+(y1-y0)*(y3-y0) >= 0 and
+            (x2-x1)*(x3-x0)+(y2-y1)*(y3-y0) >= 0 and
+            (x2-x3)*(x0-x3)+(y2-y3)*(y0-y3) >= 0)
+
+
+def _projectparam(coords, t, x, y):
+    """return the param of the point of a Bezier curve closest to (x, y) by Newton steps starting at t"""
+    x0, y0, x1, y1, x2, y2, x3, y3 = coords
+    for i in range(3):
+        s = 1-t
+        px = s*s*s*x0 + 3*s*s*t*x1 + 3*s*t*t*x2 + t*t*t*x3
+        py = s*s*s*y0 + 3*s*s*t*y1 + 3*s*t*t*y2 + t*t*t*y3
+        dx = 3*(s*s*(x1-x0) + 2*s*t*(x2-x1) + t*t*(x3-x2))
+        dy = 3*(s*s*(y1-y0) + 2*s*t*(y2-y1) + t*t*(y3-y2))
+        dd = dx*dx + dy*dy
+        if not dd:
+            break
+        t = min(1, max(0, t - ((px-x)*dx + (py-y)*dy)/dd))
+    return t
+
+
+def _coordssize_pt(coords):
+    """return the larger dimension of the control box of a Bezier curve"""
+    xs = coords[0::2]
+    ys = coords[1::2]
+    return max(max(xs)-min(xs), max(ys)-min(ys))
+
+
+def _fatlineclip(coords_a, coords_b, epsilon):
+    """return the parameter range of Bezier curve a overlapping with the fat line of Bezier curve b
+
+    The fat line is the band around the chord of b containing b, widened by
+    epsilon. The parameter range of a is calculated from the convex hull of
+    its control points in the distance space of the fat line. None is
+    returned when there is no overlap. For a short chord of b the whole
+    parameter range of a is returned.
+    """
+    x0, y0, x1, y1, x2, y2, x3, y3 = coords_b
+    l = math.hypot(x3-x0, y3-y0)
+    if l < epsilon:
+        return 0, 1
+    nx = (y0-y3)/l
+    ny = (x3-x0)/l
+    c = -nx*x0 - ny*y0
+    d1 = nx*x1 + ny*y1 + c
+    d2 = nx*x2 + ny*y2 + c
+    factor = 0.75 if d1*d2 > 0 else 4/9
+    dmin = factor*min(0, d1, d2) - epsilon
+    dmax = factor*max(0, d1, d2) + epsilon
+    # the distance of the control points of a from the chord of b at params 0, 1/3, 2/3, 1
+    ds = [nx*coords_a[2*i] + ny*coords_a[2*i+1] + c for i in range(4)]
+    tmin = 1
+    tmax = 0
+    for i, d in enumerate(ds):
+        if dmin <= d <= dmax:
+            tmin = min(tmin, i/3)
+            tmax = max(tmax, i/3)
+    # crossings of the edges of the control polygon and its diagonals
+    # (containing the edges of the convex hull) with the fat line
+    for i in range(4):
+        for j in range(i+1, 4):
+            for bound in dmin, dmax:
+                if (ds[i]-bound)*(ds[j]-bound) < 0:
+                    t = (i + (j-i)*(bound-ds[i])/(ds[j]-ds[i]))/3
+                    tmin = min(tmin, t)
+                    tmax = max(tmax, t)
+    if tmin > tmax:
+        return None
+    return tmin, tmax
+
+
+def _arclenpieceparam(ls_pt, fraction):
+    """return the param within an arc length piece at a fraction of its arc length
+
+    ls_pt is None or the lengths of the segments of the control polygon of
+    the piece as returned by _arclenpieces_pt. The param and the fraction
+    are both given in the range 0 to 1 for the piece. For a curved piece
+    the param is calculated as in _leftnormline_pt.subparamtoparam."""
+    if ls_pt is None or not 0 <= fraction <= 1:
+        return fraction
+    l1_pt, l2_pt, l3_pt = ls_pt
+    params = mathutils.realpolyroots(l1_pt-2*l2_pt+l3_pt,
+                                     -3*l1_pt+3*l2_pt,
+                                     3*l1_pt,
+                                     -fraction*(l1_pt+l2_pt+l3_pt))
+    if not params:
+        return fraction
+    return min(params, key=lambda t: abs(t-0.5))
+
+
+def _arclenpiecefraction(ls_pt, param):
+    """return the fraction of the arc length of a piece at a param, i.e. the inverse of _arclenpieceparam"""
+    if ls_pt is None or not 0 <= param <= 1:
+        return param
+    l1_pt, l2_pt, l3_pt = ls_pt
+    if not l1_pt+l2_pt+l3_pt:
+        return param
+    return (((l1_pt-2*l2_pt+l3_pt)*param - 3*l1_pt+3*l2_pt)*param + 3*l1_pt)*param / (l1_pt+l2_pt+l3_pt)
+
+
+def _segmentdistance_pt(x_pt, y_pt, x0_pt, y0_pt, x1_pt, y1_pt):
+    """return the distance of the point (x_pt, y_pt) from the line segment from (x0_pt, y0_pt) to (x1_pt, y1_pt)"""
+    dx_pt = x1_pt - x0_pt
+    dy_pt = y1_pt - y0_pt
+    l2_pt = dx_pt*dx_pt + dy_pt*dy_pt
+    if not l2_pt:
+        return math.hypot(x_pt-x0_pt, y_pt-y0_pt)
+    t = ((x_pt-x0_pt)*dx_pt + (y_pt-y0_pt)*dy_pt) / l2_pt
+    if t < 0:
+        t = 0
+    elif t > 1:
+        t = 1
+    return math.hypot(x_pt-x0_pt-t*dx_pt, y_pt-y0_pt-t*dy_pt)
+
+
 ################################################################################
 # normsubpath
 ################################################################################
@@ -805,7 +1214,7 @@ class normsubpath:
       to be transformed to normpaths.
     """
 
-    __slots__ = "normsubpathitems", "closed", "epsilon", "skippedline"
+    __slots__ = "normsubpathitems", "closed", "epsilon", "skippedline", "_modcount", "_cache"
 
     def __init__(self, normsubpathitems=[], closed=0, epsilon=_marker):
         """construct a normsubpath"""
@@ -821,6 +1230,10 @@ class normsubpath:
         self.normsubpathitems = []
         self.closed = 0
 
+        # data derived from the normsubpathitems, see _cached
+        self._modcount = 0
+        self._cache = None
+
         # a test (might be temporary)
         for anormsubpathitem in normsubpathitems:
             assert isinstance(anormsubpathitem, normsubpathitem), "only list of normsubpathitem instances allowed"
@@ -834,6 +1247,11 @@ class normsubpath:
         """return normsubpathitem i"""
         return self.normsubpathitems[i]
 
+    def __setitem__(self, i, anormsubpathitem):
+        """replace normsubpathitem i by anormsubpathitem"""
+        self.normsubpathitems[i] = anormsubpathitem
+        self._modcount += 1
+
     def __len__(self):
         """return number of normsubpathitems"""
         return len(self.normsubpathitems)
@@ -845,6 +1263,42 @@ class normsubpath:
         else:
             return "normsubpath([%s])" % l
 
+    def _cached(self, name, calculate):
+        """return the cached result of calculate() stored under name
+
+        The cache is dropped as soon as the normsubpath is modified, which is
+        tracked by the modification counter _modcount. It is increased by all
+        methods altering the normsubpathitems, the closed flag, or the
+        skippedline.
+        """
+        if self._cache is None or self._cache[0] != self._modcount:
+            self._cache = self._modcount, {}
+        cache = self._cache[1]
+        try:
+            return cache[name]
+        except KeyError:
+            result = cache[name] = calculate()
+            return result
+
+    def packed(self):
+        """return the normsubpath as a packednormsubpath
+
+        The result is cached."""
+        def calculate():
+            types = array.array("B")
+            coords = array.array("d")
+            for item in self.normsubpathitems:
+                if isinstance(item, normcurve_pt):
+                    types.append(1)
+                    coords.extend((item.x0_pt, item.y0_pt, item.x1_pt, item.y1_pt,
+                                   item.x2_pt, item.y2_pt, item.x3_pt, item.y3_pt))
+                else:
+                    types.append(0)
+                    coords.extend((item.x0_pt, item.y0_pt, item.x0_pt, item.y0_pt,
+                                   item.x1_pt, item.y1_pt, item.x1_pt, item.y1_pt))
+            return packednormsubpath(types, coords, self.closed, self.epsilon, self.skippedline)
+        return self._cached("packed", calculate)
+
     def _distributeparams(self, params):
         """return a dictionary mapping normsubpathitemindices to a tuple
         of a paramindices and normsubpathitemparams.
@@ -873,6 +1327,7 @@ class normsubpath:
 
         Fails on closed normsubpath.
         """
+        self._modcount += 1
         if self.epsilon is None:
             self.normsubpathitems.append(anormsubpathitem)
         else:
@@ -981,26 +1436,52 @@ class normsubpath:
 
         When upper is set, the upper bound is calculated, otherwise the lower
         bound is returned."""
-        return sum([npitem.arclen_pt(self.epsilon, upper=upper) for npitem in self.normsubpathitems])
+        if upper:
+            return sum([npitem.arclen_pt(self.epsilon, upper=upper) for npitem in self.normsubpathitems])
+        return self._arclentable()[3]
+
+    def _arclentable(self):
+        """return the cumulative arc length table of the normsubpath
+
+        The normsubpathitems are divided into pieces by their
+        _arclenpieces_pt method. The result is a tuple of the arc lengths in
+        pts and the params at the beginning of the pieces, the pieces as
+        tuples (normsubpathitemindex, t0, t1, arclen_pt, ls_pt), and the
+        total arc length in pts. The table is cached, so that the arc length
+        conversions only need a bisection in the table instead of splitting
+        the normcurves again and again.
+        """
+        def calculate():
+            arclens_pt = []
+            params = []
+            pieces = []
+            totalarclen_pt = 0
+            for normsubpathitemindex, normsubpathitem in enumerate(self.normsubpathitems):
+                for t0, t1, arclen_pt, ls_pt in normsubpathitem._arclenpieces_pt(self.epsilon):
+                    arclens_pt.append(totalarclen_pt)
+                    params.append(normsubpathitemindex + t0)
+                    pieces.append((normsubpathitemindex, t0, t1, arclen_pt, ls_pt))
+                    totalarclen_pt += arclen_pt
+            return arclens_pt, params, pieces, totalarclen_pt
+        return self._cached("arclentable", calculate)
 
     def _arclentoparam_pt(self, lengths_pt):
         """return a tuple of params and the total length arc length in pts"""
-        # work on a copy which is counted down to negative values
-        lengths_pt = lengths_pt[:]
-        results = [None] * len(lengths_pt)
-
-        totalarclen = 0
-        for normsubpathindex, normsubpathitem in enumerate(self.normsubpathitems):
-            params, arclen = normsubpathitem._arclentoparam_pt(lengths_pt, self.epsilon)
-            for i in range(len(results)):
-                if results[i] is None:
-                    lengths_pt[i] -= arclen
-                    if lengths_pt[i] < 0 or normsubpathindex == len(self.normsubpathitems) - 1:
-                        # overwrite the results until the length has become negative
-                        results[i] = normsubpathindex + params[i]
-            totalarclen += arclen
-
-        return results, totalarclen
+        if not self.normsubpathitems:
+            return [None] * len(lengths_pt), 0
+        arclens_pt, params, pieces, totalarclen_pt = self._arclentable()
+        results = []
+        for length_pt in lengths_pt:
+            # lengths before the beginning and after the end are handled by the
+            # first and last piece, respectively
+            i = max(0, bisect.bisect_right(arclens_pt, length_pt) - 1)
+            normsubpathitemindex, t0, t1, arclen_pt, ls_pt = pieces[i]
+            if arclen_pt:
+                fraction = (length_pt - arclens_pt[i]) / arclen_pt
+            else:
+                fraction = 0
+            results.append(normsubpathitemindex + t0 + (t1-t0)*_arclenpieceparam(ls_pt, fraction))
+        return results, totalarclen_pt
 
     def arclentoparam_pt(self, lengths_pt):
         """return a tuple of params"""
@@ -1008,13 +1489,7 @@ class normsubpath:
 
     def at_pt(self, params):
         """return coordinates at params in pts"""
-        if not self.normsubpathitems and self.skippedline:
-            return [self.skippedline.atbegin_pt()]*len(params)
-        result = [None] * len(params)
-        for normsubpathitemindex, (indices, params) in list(self._distributeparams(params).items()):
-            for index, point_pt in zip(indices, self.normsubpathitems[normsubpathitemindex].at_pt(params)):
-                result[index] = point_pt
-        return result
+        return self.packed().at_pt(params)
 
     def atbegin_pt(self):
         """return coordinates of first point in pts"""
@@ -1030,13 +1505,7 @@ class normsubpath:
 
     def bbox(self):
         """return bounding box of normsubpath"""
-        if self.normsubpathitems:
-            abbox = self.normsubpathitems[0].bbox()
-            for anormpathitem in self.normsubpathitems[1:]:
-                abbox += anormpathitem.bbox()
-            return abbox
-        else:
-            return bboxmodule.empty()
+        return self.packed().bbox()
 
     def close(self):
         """close subnormpath
@@ -1056,6 +1525,7 @@ class normsubpath:
         self.append(normline_pt(xs_pt, ys_pt, xe_pt, ye_pt))
         self.flushskippedline()
         self.closed = 1
+        self._modcount += 1
 
     def copy(self):
         """return copy of normsubpath"""
@@ -1066,6 +1536,8 @@ class normsubpath:
         result = normsubpath(epsilon=self.epsilon)
         result.normsubpathitems = self.normsubpathitems[:]
         result.closed = self.closed
+        result._modcount = self._modcount
+        result._cache = self._cache
 
         # We can share the reference to skippedline, since it is a
         # normsubpathitem as well and thus not modified in place either.
@@ -1075,25 +1547,39 @@ class normsubpath:
 
     def curvature_pt(self, params):
         """return the curvature at params in 1/pts"""
-        result = [None] * len(params)
-        for normsubpathitemindex, (indices, params) in list(self._distributeparams(params).items()):
-            for index, curvature_pt in zip(indices, self.normsubpathitems[normsubpathitemindex].curvature_pt(params)):
-                result[index] = curvature_pt
-        return result
+        return self.packed().curvature_pt(params)
 
     def extend(self, normsubpathitems):
         """extend path by normsubpathitems
 
         Fails on closed normsubpath.
         """
+        self._modcount += 1
         for normsubpathitem in normsubpathitems:
             self.append(normsubpathitem)
 
+    def _extendlines_pt(self, x_pt, y_pt, coords_pt):
+        """append normlines starting at (x_pt, y_pt) and going through the points in coords_pt
+
+        coords_pt is a sequence containing the x and y coordinates of the
+        points in turn. Without epsilon, the normlines are created without
+        the checks done in append.
+        """
+        xs_pt = array.array("d", [x_pt]) + array.array("d", coords_pt[0::2])
+        ys_pt = array.array("d", [y_pt]) + array.array("d", coords_pt[1::2])
+        if self.epsilon is None:
+            self.normsubpathitems.extend(map(normline_pt, xs_pt[:-1], ys_pt[:-1], xs_pt[1:], ys_pt[1:]))
+            self._modcount += 1
+        else:
+            for anormline in map(normline_pt, xs_pt[:-1], ys_pt[:-1], xs_pt[1:], ys_pt[1:]):
+                self.append(anormline)
+
     def flushskippedline(self):
         """flush the skippedline, i.e. apply it to the normsubpath
 
         remove the skippedline by modifying the end point of the existing normsubpath
         """
+        self._modcount += 1
         while self.skippedline:
             try:
                 lastnormsubpathitem = self.normsubpathitems.pop()
@@ -1103,6 +1589,53 @@ class normsubpath:
             self.skippedline = None
             self.append(lastnormsubpathitem)
 
+    def _intersectindex(self):
+        """return the control boxes of the normsubpathitems sorted by their left side
+
+        The boxes are tuples (llx_pt, lly_pt, urx_pt, ury_pt, index), where
+        index is the index of the normsubpathitem. The result is cached.
+        """
+        def calculate():
+            boxes = []
+            for index, normsubpathitem in enumerate(self.normsubpathitems):
+                cbox = normsubpathitem.cbox()
+                boxes.append((cbox.llx_pt, cbox.lly_pt, cbox.urx_pt, cbox.ury_pt, index))
+            boxes.sort()
+            return boxes
+        return self._cached("intersectindex", calculate)
+
+    def _intersectcandidates(self, other, epsilon):
+        """return the sorted pairs of indices of the normsubpathitems of self and other
+        with control boxes overlapping within epsilon
+
+        The pairs are found by sweeping over the control boxes of both
+        normsubpaths sorted by their left side, keeping the boxes which
+        still reach the current position in active lists.
+        """
+        boxes_a = self._intersectindex()
+        boxes_b = other._intersectindex()
+        candidates = []
+        active_a = []
+        active_b = []
+        i = j = 0
+        while i < len(boxes_a) or j < len(boxes_b):
+            if j == len(boxes_b) or (i < len(boxes_a) and boxes_a[i][0] <= boxes_b[j][0]):
+                llx_pt, lly_pt, urx_pt, ury_pt, index = box = boxes_a[i]
+                i += 1
+                active_b = [obox for obox in active_b if obox[2] + epsilon >= llx_pt]
+                candidates.extend([(index, obox[4]) for obox in active_b
+                                   if obox[1] <= ury_pt + epsilon and lly_pt <= obox[3] + epsilon])
+                active_a.append(box)
+            else:
+                llx_pt, lly_pt, urx_pt, ury_pt, index = box = boxes_b[j]
+                j += 1
+                active_a = [obox for obox in active_a if obox[2] + epsilon >= llx_pt]
+                candidates.extend([(obox[4], index) for obox in active_a
+                                   if obox[1] <= ury_pt + epsilon and lly_pt <= obox[3] + epsilon])
+                active_b.append(box)
+        candidates.sort()
+        return candidates
+
     def intersect(self, other):
         """intersect self with other normsubpath
 
@@ -1112,13 +1645,13 @@ class normsubpath:
         intersections_a = []
         intersections_b = []
         epsilon = min(self.epsilon, other.epsilon)
-        # Intersect all subpaths of self with the subpaths of other, possibly including
-        # one intersection point several times
-        for t_a, pitem_a  in enumerate(self.normsubpathitems):
-            for t_b, pitem_b in enumerate(other.normsubpathitems):
-                for intersection_a, intersection_b in pitem_a.intersect(pitem_b, epsilon):
-                    intersections_a.append(intersection_a + t_a)
-                    intersections_b.append(intersection_b + t_b)
+        # Intersect the subpaths of self with the subpaths of other having
+        # overlapping control boxes, possibly including one intersection point
+        # several times
+        for t_a, t_b in self._intersectcandidates(other, epsilon):
+            for intersection_a, intersection_b in self.normsubpathitems[t_a].intersect(other.normsubpathitems[t_b], epsilon):
+                intersections_a.append(intersection_a + t_a)
+                intersections_b.append(intersection_b + t_b)
 
         # although intersectipns_a are sorted for the different normsubpathitems,
         # within a normsubpathitem, the ordering has to be ensured separately:
@@ -1246,18 +1779,13 @@ class normsubpath:
         """return a tuple of arc lengths and the total arc length in pts"""
         if not self.normsubpathitems:
             return [0] * len(params), 0
-        result = [None] * len(params)
-        totalarclen_pt = 0
-        distributeparams = self._distributeparams(params)
-        for normsubpathitemindex in range(len(self.normsubpathitems)):
-            if normsubpathitemindex in distributeparams:
-                indices, params = distributeparams[normsubpathitemindex]
-                arclens_pt, normsubpathitemarclen_pt = self.normsubpathitems[normsubpathitemindex]._paramtoarclen_pt(params, self.epsilon)
-                for index, arclen_pt in zip(indices, arclens_pt):
-                    result[index] = totalarclen_pt + arclen_pt
-                totalarclen_pt += normsubpathitemarclen_pt
-            else:
-                totalarclen_pt += self.normsubpathitems[normsubpathitemindex].arclen_pt(self.epsilon)
+        arclens_pt, pieceparams, pieces, totalarclen_pt = self._arclentable()
+        result = []
+        for param in params:
+            i = max(0, bisect.bisect_right(pieceparams, param) - 1)
+            normsubpathitemindex, t0, t1, arclen_pt, ls_pt = pieces[i]
+            result.append(arclens_pt[i] +
+                          arclen_pt*_arclenpiecefraction(ls_pt, (param - normsubpathitemindex - t0) / (t1-t0)))
         return result, totalarclen_pt
 
     def pathitems(self):
@@ -1290,11 +1818,7 @@ class normsubpath:
 
     def rotation(self, params):
         """return rotations at params"""
-        result = [None] * len(params)
-        for normsubpathitemindex, (indices, params) in list(self._distributeparams(params).items()):
-            for index, rotation in zip(indices, self.normsubpathitems[normsubpathitemindex].rotation(params)):
-                result[index] = rotation
-        return result
+        return self.packed().rotation(params)
 
     def segments(self, params):
         """return segments of the normsubpath
@@ -1383,6 +1907,131 @@ class normsubpath:
                 result[index] = trafo
         return result
 
+    def simplified_pt(self, tolerance_pt):
+        """return normsubpath with vertices between normlines removed within tolerance_pt
+
+        The vertices are removed in the order of the error their removal
+        causes, which is done in O(n log n) by means of a heap, as long as
+        the error stays below tolerance_pt. The error of a merged normline is
+        bound by the larger error of its two parts plus the distance of the
+        removed vertex from the merged normline. Normcurves are treated as
+        normlines when their control points are within tolerance_pt of their
+        chord. The begin and end points and the closedness are kept, and
+        closed normsubpaths keep at least three vertices.
+        """
+        if len(self.normsubpathitems) < 2:
+            return self.copy()
+        xs_pt = []
+        ys_pt = []
+        # errors of the lines starting at the vertices and the curves to be kept
+        errors = []
+        curves = []
+        for anormsubpathitem in self.normsubpathitems:
+            x0_pt, y0_pt = anormsubpathitem.atbegin_pt()
+            x1_pt, y1_pt = anormsubpathitem.atend_pt()
+            xs_pt.append(x0_pt)
+            ys_pt.append(y0_pt)
+            if isinstance(anormsubpathitem, normcurve_pt):
+                error = max(_segmentdistance_pt(anormsubpathitem.x1_pt, anormsubpathitem.y1_pt, x0_pt, y0_pt, x1_pt, y1_pt),
+                            _segmentdistance_pt(anormsubpathitem.x2_pt, anormsubpathitem.y2_pt, x0_pt, y0_pt, x1_pt, y1_pt))
+                if error > tolerance_pt:
+                    errors.append(None)
+                    curves.append(anormsubpathitem)
+                    continue
+            else:
+                error = 0
+            errors.append(error)
+            curves.append(None)
+        xs_pt.append(x1_pt)
+        ys_pt.append(y1_pt)
+        n = len(xs_pt)
+
+        # In a linear pass, we first remove the vertices closer than a
+        # quarter of the tolerance to the last vertex being kept. This
+        # reduces the number of vertices of densely sampled lines much
+        # faster than the heap based removal.
+        radius_pt = 0.25*tolerance_pt
+        kxs_pt = [xs_pt[0]]
+        kys_pt = [ys_pt[0]]
+        kerrors = []
+        kcurves = []
+        error = errors[0]
+        distance_pt = 0
+        for i in range(1, n):
+            if i < n-1 and curves[i-1] is None and curves[i] is None:
+                d_pt = math.hypot(xs_pt[i]-kxs_pt[-1], ys_pt[i]-kys_pt[-1])
+                if d_pt < radius_pt and max(error, errors[i]) + max(distance_pt, d_pt) <= tolerance_pt:
+                    error = max(error, errors[i])
+                    distance_pt = max(distance_pt, d_pt)
+                    continue
+            if curves[i-1] is not None:
+                kerrors.append(None)
+            else:
+                kerrors.append(error + distance_pt)
+            kcurves.append(curves[i-1])
+            kxs_pt.append(xs_pt[i])
+            kys_pt.append(ys_pt[i])
+            if i < n-1:
+                error = errors[i]
+            distance_pt = 0
+        if len(kxs_pt) >= (4 if self.closed else 2):
+            xs_pt, ys_pt, errors, curves = kxs_pt, kys_pt, kerrors, kcurves
+            n = len(xs_pt)
+
+        prev = list(range(-1, n-1))
+        next = list(range(1, n+1))
+
+        def removalerror(i):
+            p = prev[i]
+            q = next[i]
+            if curves[p] is not None or curves[i] is not None:
+                return None
+            error = max(errors[p], errors[i]) + _segmentdistance_pt(xs_pt[i], ys_pt[i], xs_pt[p], ys_pt[p], xs_pt[q], ys_pt[q])
+            if error > tolerance_pt:
+                return None
+            return error
+
+        # the current removal errors of the vertices (None when not removable)
+        removalerrors = [None] + [removalerror(i) for i in range(1, n-1)] + [None]
+        heap = [(error, i) for i, error in enumerate(removalerrors) if error is not None]
+        heapq.heapify(heap)
+        remaining = n
+        minimum = 4 if self.closed else 2
+        while heap and remaining > minimum:
+            error, i = heapq.heappop(heap)
+            if error != removalerrors[i]:
+                # outdated heap entry
+                continue
+            p = prev[i]
+            q = next[i]
+            next[p] = q
+            prev[q] = p
+            errors[p] = error
+            removalerrors[i] = None
+            remaining -= 1
+            for j in p, q:
+                if 0 < j < n-1:
+                    removalerrors[j] = removalerror(j)
+                    if removalerrors[j] is not None:
+                        heapq.heappush(heap, (removalerrors[j], j))
+
+        normsubpathitems = []
+        i = 0
+        while i < n-1:
+            q = next[i]
+            if curves[i] is not None:
+                normsubpathitems.append(curves[i])
+            else:
+                normsubpathitems.append(normline_pt(xs_pt[i], ys_pt[i], xs_pt[q], ys_pt[q]))
+            i = q
+        # As in normsubpath.copy, we do not pass the normsubpathitems to the
+        # constructor to not repeat the checks for the normsubpathitems.
+        result = normsubpath(epsilon=self.epsilon)
+        result.normsubpathitems = normsubpathitems
+        result.closed = self.closed
+        result.skippedline = self.skippedline
+        return result
+
     def transformed(self, trafo):
         """return transformed path"""
         nnormsubpath = normsubpath(epsilon=self.epsilon)
@@ -1394,39 +2043,16 @@ class normsubpath:
             nnormsubpath.append(self.skippedline.transformed(trafo))
         return nnormsubpath
 
-    def outputPS(self, file, writer):
-        # if the normsubpath is closed, we must not output a normline at
-        # the end
-        if not self.normsubpathitems:
-            return
-        if self.closed and isinstance(self.normsubpathitems[-1], normline_pt):
-            assert len(self.normsubpathitems) > 1, "a closed normsubpath should contain more than a single normline_pt"
-            normsubpathitems = self.normsubpathitems[:-1]
-        else:
-            normsubpathitems = self.normsubpathitems
-        file.write("%g %g moveto\n" % self.atbegin_pt())
-        for anormsubpathitem in normsubpathitems:
-            anormsubpathitem.outputPS(file, writer)
-        if self.closed:
-            file.write("closepath\n")
+    def _outputdata(self, kind, precision, inverse_y=False, relative=False):
+        """return path data of the given kind as a single string
 
-    def outputPDF(self, file, writer):
-        # if the normsubpath is closed, we must not output a normline at
-        # the end
-        if not self.normsubpathitems:
-            return
-        if self.closed and isinstance(self.normsubpathitems[-1], normline_pt):
-            assert len(self.normsubpathitems) > 1, "a closed normsubpath should contain more than a single normline_pt"
-            normsubpathitems = self.normsubpathitems[:-1]
-        else:
-            normsubpathitems = self.normsubpathitems
-        file.write("%f %f m\n" % self.atbegin_pt())
-        for anormsubpathitem in normsubpathitems:
-            anormsubpathitem.outputPDF(file, writer)
-        if self.closed:
-            file.write("h\n")
-
-    def returnSVGdata(self, inverse_y):
+        See _outputtemplates for the available kinds. When relative is set,
+        relative operators are used. They are calculated from the rounded
+        absolute coordinates when a precision is given and from the current
+        point as it is read back from the written data otherwise to prevent
+        the accumulation of rounding errors. The data is not yet cleaned up
+        by _stripzeros.
+        """
         # if the normsubpath is closed, we must not output a normline at
         # the end
         if not self.normsubpathitems:
@@ -1436,16 +2062,234 @@ class normsubpath:
             normsubpathitems = self.normsubpathitems[:-1]
         else:
             normsubpathitems = self.normsubpathitems
+        templates = _outputtemplates(kind, precision)
+        if relative:
+            lineto, curveto = templates[4:]
+        else:
+            lineto, curveto = templates[1:3]
+        ysign = -1 if inverse_y else 1
         x_pt, y_pt = self.atbegin_pt()
-        if inverse_y:
-            y_pt = -y_pt
-        data = ["M%g %g" % (x_pt, y_pt)]
+        if relative:
+            if precision is not None:
+                x_pt = round(x_pt, precision)
+                y_pt = round(y_pt, precision)
+            else:
+                numberformat = _outputnumberformats[kind]
+                x_pt = float(numberformat % x_pt)
+                y_pt = float(numberformat % y_pt)
+        data = [templates[0] % (x_pt, ysign*y_pt)]
         for anormsubpathitem in normsubpathitems:
-            data.append(anormsubpathitem.returnSVGdata(inverse_y))
+            coords = anormsubpathitem._outputcoords()
+            if not coords:
+                continue
+            if relative:
+                if precision is not None:
+                    coords = [round(coord, precision) for coord in coords]
+                    if len(coords) == 2:
+                        x1_pt, y1_pt = coords
+                        data.append(lineto % (x1_pt-x_pt, ysign*(y1_pt-y_pt)))
+                        x_pt, y_pt = x1_pt, y1_pt
+                    else:
+                        x1_pt, y1_pt, x2_pt, y2_pt, x3_pt, y3_pt = coords
+                        data.append(curveto % (x1_pt-x_pt, ysign*(y1_pt-y_pt),
+                                               x2_pt-x_pt, ysign*(y2_pt-y_pt),
+                                               x3_pt-x_pt, ysign*(y3_pt-y_pt)))
+                        x_pt, y_pt = x3_pt, y3_pt
+                else:
+                    # round the differences as written to follow the current point of the reader
+                    deltas = [float(numberformat % (coord-current_pt))
+                              for coord, current_pt in zip(coords, (x_pt, y_pt)*3)]
+                    if len(deltas) == 2:
+                        data.append(lineto % (deltas[0], ysign*deltas[1]))
+                    else:
+                        data.append(curveto % (deltas[0], ysign*deltas[1],
+                                               deltas[2], ysign*deltas[3],
+                                               deltas[4], ysign*deltas[5]))
+                    x_pt += deltas[-2]
+                    y_pt += deltas[-1]
+            elif len(coords) == 2:
+                if inverse_y:
+                    data.append(lineto % (coords[0], -coords[1]))
+                else:
+                    data.append(lineto % coords)
+            else:
+                if inverse_y:
+                    data.append(curveto % (coords[0], -coords[1], coords[2], -coords[3], coords[4], -coords[5]))
+                else:
+                    data.append(curveto % coords)
         if self.closed:
-            data.append("Z")
+            data.append(templates[3])
         return "".join(data)
 
+    def outputPS(self, file, writer):
+        kind = "PScompact" if writer.compact else "PS"
+        file.write(_stripzeros(self._outputdata(kind, writer.precision, relative=writer.relative), writer.precision))
+
+    def outputPDF(self, file, writer):
+        file.write(_stripzeros(self._outputdata("PDF", writer.precision), writer.precision))
+
+    def returnSVGdata(self, inverse_y, precision=None, compact=False):
+        if compact:
+            return _compactsvgdata(_stripzeros(self._outputdata("SVG", precision, inverse_y, relative=True), precision))
+        return _stripzeros(self._outputdata("SVG", precision, inverse_y), precision)
+
+
+class packednormsubpath:
+
+    """normsubpath stored in arrays
+
+    Instead of a list of normsubpathitem instances, the normsubpathitems
+    are stored in two arrays: types contains 0 for a normline_pt and 1 for
+    a normcurve_pt, and coords contains eight coordinates in pts for each
+    normsubpathitem, namely the x and y coordinates of its four control
+    points. For lines, the first and the last point are repeated. The
+    methods evaluating the normsubpath at params handle all params in a
+    single loop using the polynomial coefficients of the
+    normsubpathitems, which are calculated once.
+
+    A packednormsubpath is constructed by normsubpath.packed() and
+    converted back by its normsubpath method.
+    """
+
+    __slots__ = "types", "coords", "closed", "epsilon", "skippedline", "_coefficients", "_bbox"
+
+    def __init__(self, types, coords, closed=0, epsilon=_marker, skippedline=None):
+        if epsilon is _marker:
+            epsilon = _epsilon
+        if len(coords) != 8*len(types):
+            raise ValueError("eight coordinates per normsubpathitem expected")
+        self.types = array.array("B", types)
+        self.coords = array.array("d", coords)
+        self.closed = closed
+        self.epsilon = epsilon
+        self.skippedline = skippedline
+        self._coefficients = None
+        self._bbox = None
+
+    def __len__(self):
+        """return number of normsubpathitems"""
+        return len(self.types)
+
+    def coefficients(self):
+        """return the polynomial coefficients of the normsubpathitems
+
+        For each normsubpathitem a tuple (ax, bx, cx, dx, ay, by, cy, dy) is
+        returned, where x(t) = ax*t**3 + bx*t**2 + cx*t + dx and y(t)
+        accordingly. The result is cached.
+        """
+        if self._coefficients is None:
+            coords = self.coords
+            result = []
+            for i, type in enumerate(self.types):
+                x0, y0, x1, y1, x2, y2, x3, y3 = coords[8*i:8*i+8]
+                if type:
+                    result.append((x3-x0+3*(x1-x2), 3*(x0-2*x1+x2), 3*(x1-x0), x0,
+                                   y3-y0+3*(y1-y2), 3*(y0-2*y1+y2), 3*(y1-y0), y0))
+                else:
+                    result.append((0, 0, x3-x0, x0, 0, 0, y3-y0, y0))
+            self._coefficients = result
+        return self._coefficients
+
+    def _distributedparams(self, params):
+        """return a list of tuples of the coefficients and the normsubpathitemparam for params"""
+        coefficients = self.coefficients()
+        maxindex = len(coefficients) - 1
+        result = []
+        for param in params:
+            if param > 0:
+                index = int(param)
+                if index > maxindex:
+                    index = maxindex
+            else:
+                index = 0
+            result.append((coefficients[index], param - index))
+        return result
+
+    def at_pt(self, params):
+        """return coordinates at params in pts"""
+        if not self.types and self.skippedline:
+            return [self.skippedline.atbegin_pt()]*len(params)
+        return [(((ax*t + bx)*t + cx)*t + dx, ((ay*t + by)*t + cy)*t + dy)
+                for (ax, bx, cx, dx, ay, by, cy, dy), t in self._distributedparams(params)]
+
+    def rotation(self, params):
+        """return rotations at params"""
+        return [trafo.rotate(math.degrees(math.atan2((3*ay*t + 2*by)*t + cy, (3*ax*t + 2*bx)*t + cx)))
+                for (ax, bx, cx, dx, ay, by, cy, dy), t in self._distributedparams(params)]
+
+    def curvature_pt(self, params):
+        """return the curvature at params in 1/pts"""
+        result = []
+        for (ax, bx, cx, dx, ay, by, cy, dy), t in self._distributedparams(params):
+            xdot = (3*ax*t + 2*bx)*t + cx
+            ydot = (3*ay*t + 2*by)*t + cy
+            xddot = 6*ax*t + 2*bx
+            yddot = 6*ay*t + 2*by
+            result.append((xdot*yddot - ydot*xddot) / math.hypot(xdot, ydot)**3)
+        return result
+
+    def bbox(self):
+        """return bounding box of packednormsubpath
+
+        The bounding box is calculated once and a copy is returned."""
+        if self._bbox is not None:
+            return self._bbox.copy()
+        if not self.types:
+            return bboxmodule.empty()
+        coords = self.coords
+        # the first and last points of all normsubpathitems
+        xs = coords[0::8] + coords[6::8]
+        ys = coords[1::8] + coords[7::8]
+        result = bboxmodule.bbox_pt(min(xs), min(ys), max(xs), max(ys))
+        from . import path
+        for i, type in enumerate(self.types):
+            if type:
+                x0, y0, x1, y1, x2, y2, x3, y3 = coords[8*i:8*i+8]
+                if not (result.llx_pt <= x1 <= result.urx_pt and result.llx_pt <= x2 <= result.urx_pt):
+                    xmin_pt, xmax_pt = path._bezierpolyrange(x0, x1, x2, x3)
+                    result.llx_pt = min(result.llx_pt, xmin_pt)
+                    result.urx_pt = max(result.urx_pt, xmax_pt)
+                if not (result.lly_pt <= y1 <= result.ury_pt and result.lly_pt <= y2 <= result.ury_pt):
+                    ymin_pt, ymax_pt = path._bezierpolyrange(y0, y1, y2, y3)
+                    result.lly_pt = min(result.lly_pt, ymin_pt)
+                    result.ury_pt = max(result.ury_pt, ymax_pt)
+        self._bbox = result
+        return result.copy()
+
+    def transformed(self, trafo):
+        """return transformed packednormsubpath
+
+        In contrast to normsubpath.transformed, the normsubpathitems are kept
+        even when they become shorter than epsilon."""
+        (m11, m12), (m21, m22) = trafo.matrix
+        v1, v2 = trafo.vector
+        coords = array.array("d", self.coords)
+        xs = self.coords[0::2]
+        ys = self.coords[1::2]
+        coords[0::2] = array.array("d", [m11*x + m12*y + v1 for x, y in zip(xs, ys)])
+        coords[1::2] = array.array("d", [m21*x + m22*y + v2 for x, y in zip(xs, ys)])
+        skippedline = self.skippedline
+        if skippedline is not None:
+            skippedline = skippedline.transformed(trafo)
+        return packednormsubpath(self.types, coords, self.closed, self.epsilon, skippedline)
+
+    def normsubpath(self):
+        """return the packednormsubpath as a normsubpath"""
+        items = []
+        coords = self.coords
+        for i, type in enumerate(self.types):
+            if type:
+                items.append(normcurve_pt(*coords[8*i:8*i+8]))
+            else:
+                items.append(normline_pt(coords[8*i], coords[8*i+1], coords[8*i+6], coords[8*i+7]))
+        # As in normsubpath.copy, we do not pass the normsubpathitems to the
+        # constructor to not repeat the checks for the normsubpathitems.
+        result = normsubpath(epsilon=self.epsilon)
+        result.normsubpathitems = items
+        result.closed = self.closed
+        result.skippedline = self.skippedline
+        return result
+
 
 
 ################################################################################
@@ -1972,6 +2816,14 @@ class normpath:
                 result[index] = trafo
         return result
 
+    def simplified_pt(self, tolerance_pt):
+        """return normpath with vertices between normlines removed within tolerance_pt in pts"""
+        return normpath([normsubpath.simplified_pt(tolerance_pt) for normsubpath in self.normsubpaths])
+
+    def simplified(self, tolerance):
+        """return normpath with vertices between normlines removed within tolerance"""
+        return self.simplified_pt(unit.topt(tolerance))
+
     @_valueorlistmethod
     def trafo_pt(self, params):
         """return transformation at param(s) or arc length(s) in pts"""
@@ -1987,13 +2839,27 @@ class normpath:
         return normpath([normsubpath.transformed(trafo) for normsubpath in self.normsubpaths])
 
     def outputPS(self, file, writer):
-        for normsubpath in self.normsubpaths:
-            normsubpath.outputPS(file, writer)
+        normsubpaths = self.normsubpaths
+        if writer.simplify is not None:
+            normsubpaths = self.simplified_pt(writer.simplify).normsubpaths
+        kind = "PScompact" if writer.compact else "PS"
+        file.write(_stripzeros("".join([normsubpath._outputdata(kind, writer.precision, relative=writer.relative)
+                                        for normsubpath in normsubpaths]), writer.precision))
 
     def outputPDF(self, file, writer):
-        for normsubpath in self.normsubpaths:
-            normsubpath.outputPDF(file, writer)
-
-    def returnSVGdata(self, inverse_y=True):
-        return "".join(normsubpath.returnSVGdata(inverse_y) for normsubpath in self.normsubpaths)
+        normsubpaths = self.normsubpaths
+        if writer.simplify is not None:
+            normsubpaths = self.simplified_pt(writer.simplify).normsubpaths
+        file.write(_stripzeros("".join([normsubpath._outputdata("PDF", writer.precision)
+                                        for normsubpath in normsubpaths]), writer.precision))
+
+    def returnSVGdata(self, inverse_y=True, precision=None, compact=False, simplify=None):
+        normsubpaths = self.normsubpaths
+        if simplify is not None:
+            normsubpaths = self.simplified_pt(simplify).normsubpaths
+        data = _stripzeros("".join([normsubpath._outputdata("SVG", precision, inverse_y, relative=compact)
+                                    for normsubpath in normsubpaths]), precision)
+        if compact:
+            return _compactsvgdata(data)
+        return data
 
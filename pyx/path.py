@@ -21,10 +21,10 @@
 # along with PyX; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
 
-import math
+import array, math
 from math import cos, sin, tan, acos, pi, radians, degrees
 from . import trafo, unit
-from .normpath import NormpathException, normpath, normsubpath, normline_pt, normcurve_pt
+from .normpath import NormpathException, normpath, normsubpath, normline_pt, normcurve_pt, _outputtemplates, _stripzeros
 from . import bbox as bboxmodule
 
 # set is available as an external interface to the normpath.set method
@@ -325,6 +325,10 @@ class closepath(pathitem):
 
 class pdfmoveto_pt(normline_pt):
 
+    def _outputcoords(self):
+        # the moveto is already written by the normsubpath
+        return ()
+
     def outputPDF(self, file, writer):
         pass
 
@@ -993,42 +997,70 @@ class arct(arct_pt):
 
 class multilineto_pt(pathitem):
 
-    """Perform multiple linetos (coordinates in pts)"""
+    """Perform multiple linetos (coordinates in pts)
 
-    __slots__ = "points_pt"
+    The points are stored in the array coords_pt containing their x and y
+    coordinates in turn. Such an array("d") can also be passed instead of
+    the sequence of points, in which case it is used without a copy.
+    """
+
+    __slots__ = "coords_pt"
 
     def __init__(self, points_pt):
-        self.points_pt = points_pt
+        if isinstance(points_pt, array.array) and points_pt.typecode == "d":
+            self.coords_pt = points_pt
+        elif isinstance(points_pt, array.array):
+            self.coords_pt = array.array("d", points_pt)
+        else:
+            self.coords_pt = array.array("d", [coord_pt for point_pt in points_pt for coord_pt in point_pt])
+        if len(self.coords_pt) % 2:
+            raise ValueError("even number of coordinates expected")
+
+    @property
+    def points_pt(self):
+        """list of the points as (x_pt, y_pt) tuples"""
+        return list(zip(self.coords_pt[0::2], self.coords_pt[1::2]))
 
     def __str__(self):
-        result = []
-        for point_pt in self.points_pt:
-            result.append("(%g, %g)" % point_pt )
-        return "multilineto_pt([%s])" % (", ".join(result))
+        return "multilineto_pt([%s])" % ", ".join(["(%g, %g)"]*(len(self.coords_pt)//2)) % tuple(self.coords_pt)
 
     def updatebbox(self, bbox, context):
-        for point_pt in self.points_pt:
-            bbox.includepoint_pt(*point_pt)
-        if self.points_pt:
-            context.x_pt, context.y_pt = self.points_pt[-1]
+        if self.coords_pt:
+            xs_pt = self.coords_pt[0::2]
+            ys_pt = self.coords_pt[1::2]
+            bbox.includepoint_pt(min(xs_pt), min(ys_pt))
+            bbox.includepoint_pt(max(xs_pt), max(ys_pt))
+            context.x_pt, context.y_pt = self.coords_pt[-2:]
 
     def updatenormpath(self, normpath, context):
-        x0_pt, y0_pt = context.x_pt, context.y_pt
-        for point_pt in self.points_pt:
-            normpath.normsubpaths[-1].append(normline_pt(x0_pt, y0_pt, *point_pt))
-            x0_pt, y0_pt = point_pt
-        context.x_pt, context.y_pt = x0_pt, y0_pt
+        normpath.normsubpaths[-1]._extendlines_pt(context.x_pt, context.y_pt, self.coords_pt)
+        if self.coords_pt:
+            context.x_pt, context.y_pt = self.coords_pt[-2:]
+
+    def transformed(self, trafo):
+        """return transformed multilineto_pt"""
+        (m11, m12), (m21, m22) = trafo.matrix
+        v1, v2 = trafo.vector
+        xs_pt = self.coords_pt[0::2]
+        ys_pt = self.coords_pt[1::2]
+        coords_pt = array.array("d", self.coords_pt)
+        coords_pt[0::2] = array.array("d", [m11*x_pt + m12*y_pt + v1 for x_pt, y_pt in zip(xs_pt, ys_pt)])
+        coords_pt[1::2] = array.array("d", [m21*x_pt + m22*y_pt + v2 for x_pt, y_pt in zip(xs_pt, ys_pt)])
+        return multilineto_pt(coords_pt)
 
     def outputPS(self, file, writer):
-        for point_pt in self.points_pt:
-            file.write("%g %g lineto\n" % point_pt )
+        file.write(("%g %g lineto\n" * (len(self.coords_pt)//2)) % tuple(self.coords_pt))
 
     def returnSVGdata(self, inverse_y, first, context):
-        if self.points_pt:
-            context.x_pt, context.y_pt = self.points_pt[-1]
+        coords_pt = self.coords_pt
+        if coords_pt:
+            context.x_pt, context.y_pt = coords_pt[-2:]
         if inverse_y:
-            return "".join("L%g %g" % (x_pt, -y_pt) for x_pt, y_pt in self.points_pt)
-        return "".join("L%g %g" % point_pt for point_pt in self.points_pt)
+            # as the coordinates are stored as floats, we avoid writing -0
+            # for zero, which is written as 0 for integer points
+            coords_pt = array.array("d", coords_pt)
+            coords_pt[1::2] = array.array("d", [0.0 - y_pt for y_pt in coords_pt[1::2]])
+        return ("L%g %g" * (len(coords_pt)//2)) % tuple(coords_pt)
 
 
 class multicurveto_pt(pathitem):
@@ -1082,7 +1114,7 @@ class path:
 
     """PS style path"""
 
-    __slots__ = "pathitems", "_normpath"
+    __slots__ = "pathitems", "_normpath", "_bbox"
 
     def __init__(self, *pathitems):
         """construct a path from pathitems *args"""
@@ -1093,6 +1125,8 @@ class path:
         self.pathitems = list(pathitems)
         # normpath cache (when no epsilon is set)
         self._normpath = None
+        # bbox cache
+        self._bbox = None
 
     def __add__(self, other):
         """create new path out of self and other"""
@@ -1106,6 +1140,7 @@ class path:
         """
         self.pathitems += other.path().pathitems
         self._normpath = None
+        self._bbox = None
         return self
 
     def __getitem__(self, i):
@@ -1125,6 +1160,7 @@ class path:
         assert isinstance(apathitem, pathitem), "only pathitem instance allowed"
         self.pathitems.append(apathitem)
         self._normpath = None
+        self._bbox = None
 
     def arclen_pt(self):
         """return arc length in pts"""
@@ -1168,14 +1204,16 @@ class path:
 
     def bbox(self):
         """return bbox of path"""
-        if self.pathitems:
-            bbox = self.pathitems[0].createbbox()
-            context = self.pathitems[0].createcontext()
-            for pathitem in self.pathitems[1:]:
-                pathitem.updatebbox(bbox, context)
-            return bbox
-        else:
-            return bboxmodule.empty()
+        if self._bbox is None:
+            if self.pathitems:
+                self._bbox = self.pathitems[0].createbbox()
+                context = self.pathitems[0].createcontext()
+                for pathitem in self.pathitems[1:]:
+                    pathitem.updatebbox(self._bbox, context)
+            else:
+                self._bbox = bboxmodule.empty()
+        # the bbox is mutable, thus we return a copy of the cached bbox
+        return self._bbox.copy()
 
     def begin(self):
         """return param corresponding of the beginning of the path"""
@@ -1195,6 +1233,7 @@ class path:
             assert isinstance(apathitem, pathitem), "only pathitem instance allowed"
         self.pathitems.extend(pathitems)
         self._normpath = None
+        self._bbox = None
 
     def intersect(self, other):
         """intersect self with other path
@@ -1212,6 +1251,7 @@ class path:
         """
         self.pathitems = self.joined(other).path().pathitems
         self._normpath = None
+        self._bbox = None
         return self
 
     def joined(self, other):
@@ -1304,18 +1344,76 @@ class path:
 
     def outputPS(self, file, writer):
         """write PS code to file"""
+        if writer.precision is not None or writer.compact or writer.relative or writer.simplify is not None:
+            # the batched normpath output supports the precision, compact, relative, and simplify settings
+            self.normpath(epsilon=None).outputPS(file, writer)
+            return
         for pitem in self.pathitems:
             pitem.outputPS(file, writer)
 
     def outputPDF(self, file, writer):
         """write PDF code to file"""
+        polylines = self._polylines_pt() if writer.simplify is None else None
+        if polylines is not None:
+            moveto, lineto, curveto, closepath = _outputtemplates("PDF", writer.precision)
+            for coords_pt, closed in polylines:
+                data = (moveto + lineto * (len(coords_pt)//2 - 1)) % tuple(coords_pt)
+                file.write(_stripzeros(data + closepath if closed else data, writer.precision))
+            return
         # PDF only supports normsubpathitems; we need to use a normpath
         # with epsilon equals None to prevent failure for paths shorter
         # than epsilon
         self.normpath(epsilon=None).outputPDF(file, writer)
 
-    def returnSVGdata(self, inverse_y=True):
-        """return SVG code"""
+    def _polylines_pt(self):
+        """return the subpaths of a path consisting of straight lines only
+
+        The result is a list of tuples (coords_pt, closed) for the
+        subpaths, where coords_pt is an array containing the x and y
+        coordinates of the points of the subpath in turn. As in the normpath
+        with epsilon None, subpaths without lines are skipped except for the
+        first one. None is returned when the path contains other pathitems
+        than moveto_pt, lineto_pt, multilineto_pt, and closepath or when the
+        path is not built as moveto_pt, lines, and an optional closepath per
+        subpath.
+        """
+        if not self.pathitems or not isinstance(self.pathitems[0], moveto_pt):
+            return None
+        result = []
+        coords_pt = closed = None
+        for pitem in self.pathitems:
+            if isinstance(pitem, moveto_pt):
+                if coords_pt is not None and (len(coords_pt) > 2 or not result):
+                    result.append((coords_pt, closed))
+                coords_pt = array.array("d", [pitem.x_pt, pitem.y_pt])
+                closed = 0
+            elif closed:
+                return None
+            elif isinstance(pitem, lineto_pt):
+                coords_pt.append(pitem.x_pt)
+                coords_pt.append(pitem.y_pt)
+            elif isinstance(pitem, multilineto_pt):
+                coords_pt.extend(pitem.coords_pt)
+            elif isinstance(pitem, closepath) and (len(coords_pt) > 2 or not result):
+                closed = 1
+            else:
+                return None
+        if len(coords_pt) > 2 or not result:
+            result.append((coords_pt, closed))
+        return result
+
+    def returnSVGdata(self, inverse_y=True, precision=None, compact=False, simplify=None):
+        """return SVG code
+
+        When precision is not None, the coordinates are written with the
+        given number of decimals (trailing zeros being removed). When compact
+        is set, relative commands are used, repeated commands are omitted,
+        and separators are written only where needed. When simplify is not
+        None, vertices between straight lines are removed as long as the path
+        deviates less than simplify in pts (see normpath.simplified_pt).
+        """
+        if precision is not None or compact or simplify is not None:
+            return self.normpath(epsilon=None).returnSVGdata(inverse_y, precision, compact, simplify)
         if not self.pathitems:
             return ""
         context = self.pathitems[0].createcontext()
@@ -21,7 +21,7 @@
 # along with PyX; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
 
-import io, copy, logging, time
+import io, copy, logging, re, time
 logger = logging.getLogger("pyx")
 try:
     import zlib
@@ -63,29 +63,55 @@ class PDFregistry:
             self.add(object)
         registry.merged = self
 
-    def write(self, file, writer, catalog):
+    def write(self, file, writer, catalog, previous=None):
         # first we set all refnos
-        refno = 1
+        # when appending to a previous document, the catalog and the pages tree
+        # replace the objects of the previous document, the document info is kept
+        # unless new document information is given
+        objects = []
+        if previous is None:
+            refno = 1
+        else:
+            refno = previous.size
+        newinfo = writer.title or writer.author or writer.subject or writer.keywords
         for object in self.objects:
-            object.refno = refno
-            refno += 1
+            if previous is not None and object is catalog:
+                object.refno = previous.catalogrefno
+            elif previous is not None and object is catalog.PDFpages:
+                object.refno = previous.pagesrefno
+            elif previous is not None and object is catalog.PDFinfo and not newinfo:
+                object.refno = previous.inforefno
+                continue
+            else:
+                object.refno = refno
+                refno += 1
+            objects.append(object)
 
         # second, all objects are written, keeping the positions in the output file
-        fileposes = []
-        for object in self.objects:
-            fileposes.append(file.tell())
+        fileposes = {}
+        for object in objects:
+            fileposes[object.refno] = file.tell()
             file.write("%i 0 obj\n" % object.refno)
             object.write(file, writer, self)
             file.write("endobj\n")
 
-        # xref
+        # xref (split into subsections of consecutive refnos)
         xrefpos = file.tell()
-        file.write("xref\n"
-                   "0 %d\n"
-                   "0000000000 65535 f \n" % refno)
-
-        for filepos in fileposes:
-            file.write("%010i 00000 n \n" % filepos)
+        file.write("xref\n")
+        refnos = sorted(fileposes)
+        if previous is None:
+            refnos.insert(0, 0)
+        while refnos:
+            count = 1
+            while count < len(refnos) and refnos[count] == refnos[0] + count:
+                count += 1
+            file.write("%d %d\n" % (refnos[0], count))
+            for subrefno in refnos[:count]:
+                if subrefno:
+                    file.write("%010i 00000 n \n" % fileposes[subrefno])
+                else:
+                    file.write("0000000000 65535 f \n")
+            del refnos[:count]
 
         # trailer
         file.write("trailer\n"
@@ -93,11 +119,263 @@ class PDFregistry:
                    "/Size %i\n" % refno)
         file.write("/Root %i 0 R\n" % self.getrefno(catalog))
         file.write("/Info %i 0 R\n" % self.getrefno(catalog.PDFinfo))
+        if previous is not None:
+            file.write("/Prev %i\n" % previous.xrefpos)
         file.write(">>\n"
                    "startxref\n"
                    "%i\n" % xrefpos)
         file.write("%%EOF\n")
 
+    def writelinearized(self, file, awriter, catalog):
+        """write a linearized PDF file (optimized for the display of the first
+        page while loading the rest of the file)
+
+        The objects are ordered as follows: the linearization dictionary,
+        the first-page cross-reference section, the catalog, the primary
+        hint stream, the objects of the first page, the objects of the
+        remaining pages (each page followed by its private objects), the
+        objects shared among those pages, all other objects, and finally the
+        main cross-reference section.
+        """
+        pages = catalog.PDFpages.PDFpagelist
+        if not pages:
+            raise ValueError("cannot linearize a document without pages")
+
+        # collect the (merged) objects used by every page (empty annotations
+        # and forms are not referenced and thus not used by the page)
+        pageobjects = []
+        usage = {}
+        for page in pages:
+            objects = []
+            for object in page.pageregistry.objects:
+                object = self.types[object.type][object.id]
+                if isinstance(object, (PDFannotations, PDFform)) and object.empty():
+                    continue
+                if object not in objects:
+                    objects.append(object)
+                    usage[id(object)] = usage.get(id(object), 0) + 1
+            pageobjects.append(objects)
+
+        firstpageobjects = pageobjects[0]
+        assigned = set(map(id, firstpageobjects))
+        assigned.add(id(catalog))
+        privateobjects = []
+        sharedobjects = []
+        for objects in pageobjects[1:]:
+            private = []
+            for object in objects:
+                if id(object) not in assigned:
+                    if usage[id(object)] == 1:
+                        private.append(object)
+                        assigned.add(id(object))
+                    elif object not in sharedobjects:
+                        sharedobjects.append(object)
+            privateobjects.append(private)
+        assigned.update(map(id, sharedobjects))
+        otherobjects = [object for object in self.objects if id(object) not in assigned]
+
+        # set the refnos: the main cross-reference section contains the objects of the
+        # remaining pages, the shared and all other objects, the first-page
+        # cross-reference section the linearization dictionary, the catalog,
+        # the hint stream and the objects of the first page
+        refno = 1
+        for objects in privateobjects + [sharedobjects, otherobjects]:
+            for object in objects:
+                object.refno = refno
+                refno += 1
+        mainsize = refno
+        linearizedrefno = refno
+        catalog.refno = refno + 1
+        hintrefno = refno + 2
+        refno += 3
+        for object in firstpageobjects:
+            object.refno = refno
+            refno += 1
+        size = refno
+
+        # serialize all objects
+        def serialize(object):
+            objectfile = writer.writer(io.BytesIO())
+            objectfile.write("%i 0 obj\n" % object.refno)
+            object.write(objectfile, awriter, self)
+            objectfile.write("endobj\n")
+            return objectfile.file.getvalue()
+        data = {id(object): serialize(object) for object in self.objects}
+
+        # the layout of the objects following the hint stream (with offsets
+        # relative to the end of the hint stream)
+        layout = firstpageobjects + [object for objects in privateobjects for object in objects] + sharedobjects + otherobjects
+        offsets = {}
+        offset = 0
+        for object in layout:
+            offsets[id(object)] = offset
+            offset += len(data[id(object)])
+        afterhintlength = offset
+
+        header = b"%PDF-1.4\n%\xc3\xb6\xc3\xa9\n"
+
+        def linearized(filelength, hintpos, hintlength, endfirstpage, mainxrefentries):
+            # fixed width numbers to know the length in advance
+            return ("%i 0 obj\n"
+                    "<< /Linearized 1 /L %010i /H [ %010i %010i ] /O %i /E %010i /N %i /T %010i >>\n"
+                    "endobj\n" % (linearizedrefno, filelength, hintpos, hintlength,
+                                   self.getrefno(pages[0]), endfirstpage, len(pages), mainxrefentries))
+
+        def firstxref(fileposes, mainxrefpos):
+            return ("xref\n"
+                    "%i %i\n" % (linearizedrefno, len(fileposes)) +
+                    "".join(["%010i 00000 n \n" % filepos for filepos in fileposes]) +
+                    "trailer\n"
+                    "<<\n"
+                    "/Size %i\n"
+                    "/Root %i 0 R\n"
+                    "/Info %i 0 R\n"
+                    "/Prev %010i\n"
+                    ">>\n"
+                    "startxref\n"
+                    "0\n"
+                    "%%%%EOF\n" % (size, catalog.refno, self.getrefno(catalog.PDFinfo), mainxrefpos))
+
+        linearizedpos = len(header)
+        firstxrefpos = linearizedpos + len(linearized(0, 0, 0, 0, 0))
+        catalogpos = firstxrefpos + len(firstxref([0]*(size-linearizedrefno), 0))
+        hintpos = catalogpos + len(data[id(catalog)])
+
+        # the hint tables use offsets as if the hint stream is not present
+        def hintoffset(object):
+            return hintpos + offsets[id(object)]
+
+        def bits(value):
+            return value.bit_length()
+
+        def contentoffset(page):
+            return offsets[id(self.types[page.PDFcontent.type][page.PDFcontent.id])]
+
+        def contentlength(page):
+            return len(data[id(self.types[page.PDFcontent.type][page.PDFcontent.id])])
+
+        # page offset hint table
+        sharedindices = {id(object): i for i, object in enumerate(firstpageobjects + sharedobjects)}
+        # (the page object is the first object of every page)
+        pagenobjects = [len(objects) for objects in [firstpageobjects] + privateobjects]
+        pagestarts = [offsets[id(page)] for page in pages]
+        pagelengths = [sum(len(data[id(object)]) for object in objects) for objects in [firstpageobjects] + privateobjects]
+        pagecontentoffsets = [contentoffset(page) - start for page, start in zip(pages, pagestarts)]
+        pagecontentlengths = [contentlength(page) for page in pages]
+        pageshared = [[]] + [[sharedindices[id(object)] for object in objects if id(object) in sharedindices]
+                             for objects in pageobjects[1:]]
+        hint = _bitwriter()
+        hint.write(min(pagenobjects), 32)
+        hint.write(hintoffset(pages[0]), 32)
+        nobjectsbits = bits(max(pagenobjects) - min(pagenobjects))
+        hint.write(nobjectsbits, 16)
+        hint.write(min(pagelengths), 32)
+        lengthbits = bits(max(pagelengths) - min(pagelengths))
+        hint.write(lengthbits, 16)
+        hint.write(min(pagecontentoffsets), 32)
+        contentoffsetbits = bits(max(pagecontentoffsets) - min(pagecontentoffsets))
+        hint.write(contentoffsetbits, 16)
+        hint.write(min(pagecontentlengths), 32)
+        contentlengthbits = bits(max(pagecontentlengths) - min(pagecontentlengths))
+        hint.write(contentlengthbits, 16)
+        nsharedbits = bits(max(map(len, pageshared)))
+        hint.write(nsharedbits, 16)
+        sharedbits = bits(len(sharedindices) - 1)
+        hint.write(sharedbits, 16)
+        hint.write(0, 16) # no fractional positions of the shared objects
+        hint.write(1, 16)
+        for value in pagenobjects:
+            hint.write(value - min(pagenobjects), nobjectsbits)
+        hint.flush()
+        for value in pagelengths:
+            hint.write(value - min(pagelengths), lengthbits)
+        hint.flush()
+        for shared in pageshared:
+            hint.write(len(shared), nsharedbits)
+        hint.flush()
+        for shared in pageshared:
+            for index in shared:
+                hint.write(index, sharedbits)
+        hint.flush()
+        for value in pagecontentoffsets:
+            hint.write(value - min(pagecontentoffsets), contentoffsetbits)
+        hint.flush()
+        for value in pagecontentlengths:
+            hint.write(value - min(pagecontentlengths), contentlengthbits)
+        hint.flush()
+        sharedhintpos = len(hint.getvalue())
+
+        # shared object hint table (every object is a group of its own)
+        grouplengths = [len(data[id(object)]) for object in firstpageobjects + sharedobjects]
+        if sharedobjects:
+            hint.write(sharedobjects[0].refno, 32)
+            hint.write(hintoffset(sharedobjects[0]), 32)
+        else:
+            hint.write(0, 32)
+            hint.write(0, 32)
+        hint.write(len(firstpageobjects), 32)
+        hint.write(len(grouplengths), 32)
+        hint.write(0, 16)
+        hint.write(min(grouplengths), 32)
+        grouplengthbits = bits(max(grouplengths) - min(grouplengths))
+        hint.write(grouplengthbits, 16)
+        for value in grouplengths:
+            hint.write(value - min(grouplengths), grouplengthbits)
+        hint.flush()
+        for value in grouplengths:
+            hint.write(0, 1) # no MD5 signatures
+        hint.flush()
+
+        hintdata = hint.getvalue()
+        if awriter.compress:
+            hintdata = zlib.compress(hintdata, awriter.compresslevel)
+        hintfile = writer.writer(io.BytesIO())
+        hintfile.write("%i 0 obj\n"
+                       "<<\n"
+                       "/Length %i\n"
+                       "/S %i\n" % (hintrefno, len(hintdata), sharedhintpos))
+        if awriter.compress:
+            hintfile.write("/Filter /FlateDecode\n")
+        hintfile.write(">>\n"
+                       "stream\n")
+        hintfile.write_bytes(hintdata)
+        hintfile.write("endstream\n"
+                       "endobj\n")
+        hintobject = hintfile.file.getvalue()
+
+        # now we know all positions
+        objectspos = hintpos + len(hintobject)
+        endfirstpage = objectspos + pagelengths[0]
+        mainxrefpos = objectspos + afterhintlength
+        mainxref = ["xref\n"
+                    "0 %i\n"
+                    "0000000000 65535 f \n" % mainsize]
+        for object in layout:
+            if object.refno < mainsize:
+                mainxref.append((object.refno, "%010i 00000 n \n" % (objectspos + offsets[id(object)])))
+        mainxref[1:] = [entry for refno, entry in sorted(mainxref[1:])]
+        mainxref.append("trailer\n"
+                        "<<\n"
+                        "/Size %i\n"
+                        ">>\n"
+                        "startxref\n"
+                        "%i\n"
+                        "%%%%EOF\n" % (mainsize, firstxrefpos))
+        mainxref = "".join(mainxref)
+        filelength = mainxrefpos + len(mainxref)
+
+        file.write_bytes(header)
+        file.write(linearized(filelength, hintpos, len(hintobject), endfirstpage,
+                              mainxrefpos + len("xref\n0 %i" % mainsize)))
+        file.write(firstxref([linearizedpos, catalogpos, hintpos] +
+                             [objectspos + offsets[id(object)] for object in firstpageobjects],
+                             mainxrefpos))
+        file.write_bytes(data[id(catalog)])
+        file.write_bytes(hintobject)
+        for object in layout:
+            file.write_bytes(data[id(object)])
+        file.write(mainxref)
+
     def addresource(self, resourcetype, resourcename, object, procset=None):
         self.resources.setdefault(resourcetype, {})[resourcename] = object
         if procset:
@@ -113,6 +391,184 @@ class PDFregistry:
         file.write(">>\n")
 
 
+class _bitwriter:
+
+    """writes integers of given bit lengths (most significant bit first) as used in hint tables"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.value = 0
+        self.bits = 0
+
+    def write(self, value, bits):
+        assert 0 <= value < 1 << bits or not value, "value does not fit into the given number of bits"
+        self.value = (self.value << bits) | value
+        self.bits += bits
+        while self.bits >= 8:
+            self.bits -= 8
+            self.data.append((self.value >> self.bits) & 0xff)
+        self.value &= (1 << self.bits) - 1
+
+    def flush(self):
+        """pad to the next byte boundary"""
+        if self.bits:
+            self.write(0, 8 - self.bits)
+
+    def getvalue(self):
+        assert not self.bits, "flush missing"
+        return bytes(self.data)
+
+
+class PDFreader:
+
+    """reader for the objects of an existing PDF file
+
+    Only PDF files containing cross-reference tables (like those written
+    by PyX) are supported, but no cross-reference streams.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        file.seek(0, io.SEEK_END)
+        self.filesize = file.tell()
+        file.seek(max(0, self.filesize-1024))
+        tail = file.read()
+        startxrefs = re.findall(br"startxref\s+(\d+)", tail)
+        if not startxrefs:
+            raise ValueError("startxref not found at the end of the PDF file")
+        self.xrefpos = int(startxrefs[-1])
+        # the cross-reference sections, latest first
+        self.xrefs = []
+        xrefpos = self.xrefpos
+        self.trailer = None
+        while xrefpos is not None:
+            xref, atrailer = self.readxref(xrefpos)
+            self.xrefs.append(xref)
+            if self.trailer is None:
+                self.trailer = atrailer
+            prev = re.search(br"/Prev\s+(\d+)", atrailer)
+            xrefpos = int(prev.group(1)) if prev else None
+
+    def readxref(self, xrefpos):
+        """return the entries of the cross-reference section at xrefpos and the following trailer"""
+        self.file.seek(xrefpos)
+        if self.file.readline().strip() != b"xref":
+            raise ValueError("cross-reference table expected at position %i (cross-reference streams are not supported)" % xrefpos)
+        xref = {}
+        while True:
+            line = self.file.readline()
+            if not line:
+                raise ValueError("unexpected end of cross-reference table")
+            if line.strip() == b"trailer":
+                break
+            start, count = [int(x) for x in line.split()]
+            for refno in range(start, start+count):
+                entry = self.file.readline().split()
+                if entry[2] == b"n":
+                    xref[refno] = int(entry[0])
+        trailer = []
+        while True:
+            line = self.file.readline()
+            if not line or line.strip() == b"startxref":
+                break
+            trailer.append(line)
+        return xref, b"".join(trailer)
+
+    def getint(self, data, name):
+        return int(re.search(br"/" + name + br"\s+(\d+)", data).group(1))
+
+    def getref(self, data, name):
+        return int(re.search(br"/" + name + br"\s+(\d+)\s+0\s+R", data).group(1))
+
+    def getvalue(self, data, name):
+        """return the value of the entry name in the dictionary data
+
+        Only references, arrays, dictionaries and simple values are
+        handled. Strings containing brackets are not taken into account.
+        """
+        m = re.search(br"/" + name + br"(?![^\s/<\[(])\s*", data)
+        if not m:
+            return None
+        pos = m.end()
+        ref = re.match(br"\d+\s+\d+\s+R", data[pos:])
+        if ref:
+            return ref.group(0)
+        if data.startswith(b"<<", pos) or data.startswith(b"[", pos):
+            level = 0
+            for token in re.finditer(br"<<|>>|\[|\]", data[pos:]):
+                if token.group(0) in (b"<<", b"["):
+                    level += 1
+                else:
+                    level -= 1
+                if not level:
+                    return data[pos:pos+token.end()]
+            raise ValueError("unbalanced value of /%s" % name.decode("ascii"))
+        return re.match(br"/?[^\s/<>\[\]()]*", data[pos:]).group(0)
+
+    def _offset(self, refno):
+        for xref in self.xrefs:
+            if refno in xref:
+                return xref[refno]
+        raise ValueError("object %i not found in the PDF file" % refno)
+
+    def readobject(self, refno):
+        """return the content of the object refno (without the stream data)"""
+        self.file.seek(self._offset(refno))
+        data = []
+        while True:
+            line = self.file.readline()
+            if not line or line.startswith(b"endobj") or line.startswith(b"stream"):
+                break
+            data.append(line)
+        return b"".join(data)
+
+    def readrawobject(self, refno):
+        """return the content of the object refno and its stream data
+
+        The content is returned without the object header. The stream data
+        is None for objects not being a stream."""
+        self.file.seek(self._offset(refno))
+        data = b""
+        while True:
+            block = self.file.read(65536)
+            data += block
+            m = re.search(br"(?<![A-Za-z/])(stream\r?\n|endobj)", data)
+            if m or not block:
+                break
+        if not m:
+            raise ValueError("end of object %i not found in the PDF file" % refno)
+        content = re.sub(br"^\s*\d+\s+\d+\s+obj", b"", data[:m.start()]).strip()
+        if m.group(1) == b"endobj":
+            return content, None
+        length = self.getvalue(content, b"Length")
+        if length.endswith(b"R"):
+            length = self.readrawobject(int(length.split()[0]))[0]
+        self.file.seek(self._offset(refno) + m.end())
+        return content, self.file.read(int(length))
+
+
+class PDFprevious(PDFreader):
+
+    """information about a previously written PDF file to be updated incrementally"""
+
+    def __init__(self, file):
+        PDFreader.__init__(self, file)
+        trailer = self.trailer
+        self.size = self.getint(trailer, b"Size")
+        self.catalogrefno = self.getref(trailer, b"Root")
+        self.inforefno = self.getref(trailer, b"Info")
+        catalog = self.readobject(self.catalogrefno)
+        self.pagesrefno = self.getref(catalog, b"Pages")
+        pages = self.readobject(self.pagesrefno)
+        kids = re.search(br"/Kids\s*\[([^\]]*)\]", pages)
+        self.pagerefnos = [int(refno) for refno in re.findall(br"(\d+)\s+0\s+R", kids.group(1))]
+        self.fieldrefnos = []
+        if re.search(br"/AcroForm\s", catalog):
+            fields = re.search(br"/Fields\s*\[([^\]]*)\]", self.readobject(self.getref(catalog, b"AcroForm")))
+            if fields:
+                self.fieldrefnos = [int(refno) for refno in re.findall(br"(\d+)\s+0\s+R", fields.group(1))]
+
+
 class PDFobject:
 
     def __init__(self, type, _id=None):
@@ -134,6 +590,53 @@ class PDFobject:
         raise NotImplementedError("write method has to be provided by PDFobject subclass")
 
 
+_importedrefpattern = re.compile(br"(\d+)\s+\d+\s+R\b")
+
+class PDFimportedobject(PDFobject):
+
+    """object copied verbatim from an existing PDF file
+
+    The objects of a file are identified by key. References to other
+    objects of the same file are rewritten to the corresponding imported
+    objects, which thus need to be added to the registry as well (see
+    importobjects)."""
+
+    def __init__(self, key, refno, content=None, stream=None):
+        PDFobject.__init__(self, "imported", (key, refno))
+        self.key = key
+        self.content = content
+        self.stream = stream
+
+    def write(self, file, writer, registry):
+        file.write_bytes(importedrefs(self.content, self.key, registry))
+        file.write("\n")
+        if self.stream is not None:
+            file.write("stream\n")
+            file.write_bytes(self.stream)
+            file.write("\nendstream\n")
+
+
+def importedrefs(data, key, registry):
+    """rewrite the references in data to the imported objects of the file identified by key"""
+    return _importedrefpattern.sub(lambda m: b"%i 0 R" % registry.getrefno(PDFimportedobject(key, int(m.group(1)))), data)
+
+
+def importobjects(reader, data, key):
+    """return the objects of reader referenced by data directly or indirectly as a list of PDFimportedobjects"""
+    objects = []
+    refnos = set()
+    pending = [int(refno) for refno in _importedrefpattern.findall(data)]
+    while pending:
+        refno = pending.pop()
+        if refno in refnos:
+            continue
+        refnos.add(refno)
+        content, stream = reader.readrawobject(refno)
+        objects.append(PDFimportedobject(key, refno, content, stream))
+        pending.extend(int(refno) for refno in _importedrefpattern.findall(content))
+    return objects
+
+
 class PDFcatalog(PDFobject):
 
     def __init__(self, document, writer, registry):
@@ -149,7 +652,7 @@ class PDFcatalog(PDFobject):
         file.write("<<\n"
                    "/Type /Catalog\n"
                    "/Pages %i 0 R\n" % registry.getrefno(self.PDFpages))
-        if not self.PDFform.empty():
+        if not self.PDFform.empty() or (writer.previous is not None and writer.previous.fieldrefnos):
             file.write("/AcroForm %i 0 R\n" % registry.getrefno(self.PDFform))
         if writer.fullscreen:
             file.write("/PageMode /FullScreen\n")
@@ -204,13 +707,16 @@ class PDFpages(PDFobject):
             self.PDFpagelist.append(page)
 
     def write(self, file, writer, registry):
+        if writer.previous is not None:
+            kids = ["%i 0 R" % refno for refno in writer.previous.pagerefnos]
+        else:
+            kids = []
+        kids.extend(["%i 0 R" % registry.getrefno(page) for page in self.PDFpagelist])
         file.write("<<\n"
                    "/Type /Pages\n"
                    "/Kids [%s]\n"
                    "/Count %i\n"
-                   ">>\n" % (" ".join(["%i 0 R" % registry.getrefno(page)
-                                       for page in self.PDFpagelist]),
-                             len(self.PDFpagelist)))
+                   ">>\n" % (" ".join(kids), len(kids)))
 
 
 class PDFpage(PDFobject):
@@ -288,7 +794,9 @@ class PDFwriter:
     def __init__(self, document, file,
                        title=None, author=None, subject=None, keywords=None,
                        fullscreen=False, writebbox=False, compress=True, compresslevel=6,
-                       strip_fonts=True, text_as_path=False, mesh_as_bitmap=False, mesh_as_bitmap_resolution=300):
+                       strip_fonts=True, text_as_path=False, mesh_as_bitmap=False, mesh_as_bitmap_resolution=300,
+                       eps_as_bitmap=True, max_image_dpi=None, image_resample="lanczos",
+                       precision=None, simplify=None, append=False, linearize=False):
         self._fontmap = None
 
         self.title = title
@@ -306,19 +814,47 @@ class PDFwriter:
         self.text_as_path = text_as_path
         self.mesh_as_bitmap = mesh_as_bitmap
         self.mesh_as_bitmap_resolution = mesh_as_bitmap_resolution
+        self.max_image_dpi = max_image_dpi
+        self.image_resample = image_resample
+        self.eps_as_bitmap = eps_as_bitmap
+        self.precision = precision
+        self.simplify = simplify
 
         # dictionary mapping font names to dictionaries mapping encoding names to encodings
         # encodings themselves are mappings from glyphnames to codepoints
         self.encodings = {}
 
+        # compressed data of the most recently used bitmaps and resampled images
+        self.imagedatacache = {}
+        self.resampledcache = {}
+
+        if append and linearize:
+            raise ValueError("cannot linearize an incremental update")
+
+        # when appending, the pages are added to the PDF file in file as an
+        # incremental update (the file needs to be readable and seekable)
+        if append:
+            self.previous = PDFprevious(file)
+        else:
+            self.previous = None
+
         # the PDFcatalog class automatically builds up the pdfobjects from a document
         registry = PDFregistry()
         catalog = PDFcatalog(document, self, registry)
         registry.add(catalog)
 
         file = writer.writer(file)
-        file.write_bytes(b"%PDF-1.4\n%\xc3\xb6\xc3\xa9\n")
-        registry.write(file, self, catalog)
+        if linearize:
+            registry.writelinearized(file, self, catalog)
+            return
+        if append:
+            file.file.seek(self.previous.filesize)
+            file.file.seek(-1, io.SEEK_CUR)
+            if file.file.read(1) != b"\n":
+                file.write("\n")
+        else:
+            file.write_bytes(b"%PDF-1.4\n%\xc3\xb6\xc3\xa9\n")
+        registry.write(file, self, catalog, self.previous)
 
     def getfontmap(self):
         if self._fontmap is None:
@@ -368,6 +904,9 @@ class PDFform(PDFobject):
         # XXX problem: This object will be written to the file even if it is useless (empty)
         file.write("<<")
         file.write("/Fields [")
+        if writer.previous is not None:
+            for refno in writer.previous.fieldrefnos:
+                file.write(" %d 0 R" % refno)
         for field in self.fields:
             file.write(" %d 0 R" % registry.getrefno(field))
         file.write(" ]\n")
@@ -20,7 +20,7 @@
 # along with PyX; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
 
-import io, copy, time, math
+import io, copy, time, math, shutil, tempfile
 from . import bbox, config, style, version, unit, trafo, writer
 
 
@@ -89,24 +89,57 @@ class PSdefinition(PSresource):
         file.write(" /%s exch def\n" % self.id)
         file.write("%%EndResource\n")
 
+class PScompactaliases(PSresource):
+
+    """ short aliases for frequently used PostScript operators included in the prolog """
+
+    # mapping of PostScript operators to their aliases
+    aliases = {"moveto": "m", "lineto": "l", "curveto": "c", "closepath": "h",
+               "rmoveto": "rm", "rlineto": "rl", "rcurveto": "rc",
+               "setgray": "g", "setrgbcolor": "rg", "setcmykcolor": "k",
+               "show": "s"}
+
+    def __init__(self):
+        self.type = "definition"
+        self.id = "compactaliases"
+
+    def output(self, file, writer, registry):
+        file.write("%%%%BeginResource: %s\n" % self.id)
+        for operator, alias in sorted(self.aliases.items(), key=lambda item: item[1]):
+            file.write("/%s /%s load def\n" % (alias, operator))
+        file.write("%%EndResource\n")
+
 #
 # Writers
 #
 
 class _PSwriter:
 
-    def __init__(self, title=None, strip_fonts=True, text_as_path=False, mesh_as_bitmap=False, mesh_as_bitmap_resolution=300):
+    def __init__(self, title=None, strip_fonts=True, text_as_path=False, mesh_as_bitmap=False, mesh_as_bitmap_resolution=300,
+                 max_image_dpi=None, image_resample="lanczos", precision=None,
+                 spool=False, compact=False, relative=False, simplify=None):
         self._fontmap = None
         self.title = title
         self.strip_fonts = strip_fonts
         self.text_as_path = text_as_path
         self.mesh_as_bitmap = mesh_as_bitmap
         self.mesh_as_bitmap_resolution = mesh_as_bitmap_resolution
+        self.max_image_dpi = max_image_dpi
+        self.image_resample = image_resample
+        self.precision = precision
+        self.spool = spool
+        self.compact = compact
+        self.relative = relative
+        self.simplify = simplify
 
         # dictionary mapping font names to dictionaries mapping encoding names to encodings
         # encodings themselves are mappings from glyphnames to codepoints
         self.encodings = {}
 
+        # compressed data of the most recently used bitmaps and resampled images
+        self.imagedatacache = {}
+        self.resampledcache = {}
+
     def writeinfo(self, file):
         file.write("%%%%Creator: PyX %s\n" % version.version)
         if self.title is not None:
@@ -114,6 +147,27 @@ class _PSwriter:
         file.write("%%%%CreationDate: %s\n" %
                    time.asctime(time.localtime(time.time())))
 
+    def operator(self, name):
+        """return the name or, in compact mode, the alias of a PostScript operator"""
+        if self.compact:
+            return PScompactaliases.aliases.get(name, name)
+        return name
+
+    def spoolfile(self):
+        """return a writer for intermediate output
+
+        The output is kept in memory unless spooling is enabled, in which
+        case a temporary file is used.
+        """
+        if self.spool:
+            return writer.writer(tempfile.TemporaryFile())
+        return writer.writer(io.BytesIO())
+
+    def copyspoolfile(self, spoolfile, file):
+        """copy the content of spoolfile to file"""
+        spoolfile.file.seek(0)
+        shutil.copyfileobj(spoolfile.file, file.file)
+
     def getfontmap(self):
         if self._fontmap is None:
             # late import due to cyclic dependency
@@ -134,8 +188,10 @@ class EPSwriter(_PSwriter):
         page = document.pages[0]
         canvas = page.canvas
 
-        pagefile = writer.writer(io.BytesIO())
+        pagefile = self.spoolfile()
         registry = PSregistry()
+        if self.compact:
+            registry.add(PScompactaliases())
         acontext = context()
         pagebbox = bbox.empty()
 
@@ -152,7 +208,8 @@ class EPSwriter(_PSwriter):
         registry.output(file, self)
         file.write("%%EndProlog\n")
 
-        file.write_bytes(pagefile.file.getvalue())
+        with pagefile:
+            self.copyspoolfile(pagefile, file)
 
         file.write("showpage\n")
         file.write("%%Trailer\n")
@@ -168,15 +225,17 @@ class PSwriter(_PSwriter):
         # We first have to process the content of the pages, writing them into the stream pagesfile
         # Doing so, we fill the registry and also calculate the page bounding boxes, which are
         # stored in page._bbox for every page
-        pagesfile = writer.writer(io.BytesIO())
+        pagesfile = self.spoolfile()
         registry = PSregistry()
+        if self.compact:
+            registry.add(PScompactaliases())
 
         # calculated bounding boxes of the whole document
         documentbbox = bbox.empty()
 
         for nr, page in enumerate(document.pages):
             # process contents of page
-            pagefile = writer.writer(io.BytesIO())
+            pagefile = self.spoolfile()
             acontext = context()
             pagebbox = bbox.empty()
             page.processPS(pagefile, self, acontext, registry, pagebbox)
@@ -195,7 +254,8 @@ class PSwriter(_PSwriter):
             pagesfile.write("/pgsave save def\n")
 
             pagesfile.write("%%EndPageSetup\n")
-            pagesfile.write_bytes(pagefile.file.getvalue())
+            with pagefile:
+                self.copyspoolfile(pagefile, pagesfile)
             pagesfile.write("pgsave restore\n")
             pagesfile.write("showpage\n")
             pagesfile.write("%%PageTrailer\n")
@@ -242,7 +302,8 @@ class PSwriter(_PSwriter):
         #file.write("%%BeginSetup\n")
         #file.write("%%EndSetup\n")
 
-        file.write_bytes(pagesfile.file.getvalue())
+        with pagesfile:
+            self.copyspoolfile(pagesfile, file)
 
         file.write("%%Trailer\n")
         file.write("%%EOF\n")
@@ -255,6 +316,7 @@ class context:
         self.colorspace = None
         self.selectedfont = None
         self.fillrule = 0
+        self.trafo = trafo.trafo()
 
     def __call__(self, **kwargs):
         newcontext = copy.copy(self)
@@ -20,7 +20,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
 
 
-import xml.sax, re, math, logging
+import xml.sax, re, math, logging, os, functools
 from . import baseclasses, bbox, canvas, path, trafo, deco, style, color, unit
 
 logger = logging.getLogger("pyx")
@@ -84,6 +84,7 @@ class svgValueError(ValueError): pass
 class _marker: pass
 
 _svgFloatPattern = re.compile("(?P<value>[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?)(?P<unit>(px|pt|pc|mm|cm|in|%)?)\s*,?\s*")
+_svgFloatsPattern = re.compile(r"([-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*,?\s*")
 _svgBoolPattern = re.compile("(?P<bool>[01])\s*,?\s*")
 _svgPathPattern = re.compile("(?P<cmd>[mlhvcsqtaz])\s*(?P<args>(([^mlhvcsqtaz]|pt|pc|mm|cm)*))", re.IGNORECASE)
 _svgColorAbsPattern = re.compile("rgb\(\s*(?P<red>[0-9]+)\s*,\s*(?P<green>[0-9]+)\s*,\s*(?P<blue>[0-9]+)\s*\)$", re.IGNORECASE)
@@ -123,9 +124,15 @@ class svgBaseHandler(xml.sax.ContentHandler):
         return value, arg[match.end():]
 
     def toFloats(self, args, units=True):
+        if not _svgFloatsPattern.sub("", args):
+            # fast path for plain numbers without units
+            scale = self.units[""] if units else 1
+            return [float(value)*scale for value in _svgFloatsPattern.findall(args)]
+        floats = []
         while args:
-            float, args = self.toFloat(args, units=units)
-            yield float
+            value, args = self.toFloat(args, units=units)
+            floats.append(value)
+        return floats
 
 
 class svgHandler(svgBaseHandler):
@@ -152,16 +159,14 @@ class svgHandler(svgBaseHandler):
                 if cmd not in "aA":
                     args = self.toFloats(args)
                 if cmd in "MmLl":
-                    first = True
-                    while args:
-                        x, y, *args = args
-                        if cmd in "Ll" or not first:
+                    for i in range(0, len(args), 2):
+                        x, y = args[i:i+2]
+                        if cmd in "Ll" or i:
                             p.append(path.lineto_pt(x, y) if cmd.isupper() else
                                      path.rlineto_pt(x, y))
                         else:
                             p.append(path.moveto_pt(x, y) if cmd.isupper() or not p else
                                      path.rmoveto_pt(x, y))
-                        first = False
                 elif cmd in "HhVv":
                     x, y = p.atend_pt() if cmd.isupper() else (0, 0)
                     for arg in args:
@@ -172,11 +177,12 @@ class svgHandler(svgBaseHandler):
                         p.append(path.lineto_pt(x, y) if cmd.isupper() else
                                  path.rlineto_pt(x, y))
                 elif cmd in "CcSs":
-                    while args:
+                    n = 6 if cmd in "Cc" else 4
+                    for i in range(0, len(args), n):
                         if cmd in "Cc":
-                            x1, y1, x2, y2, x3, y3, *args = args
+                            x1, y1, x2, y2, x3, y3 = args[i:i+6]
                         else:
-                            x2, y2, x3, y3, *args = args
+                            x2, y2, x3, y3 = args[i:i+4]
                             if isinstance(p[-1], path.curveto_pt):
                                 x1 = p[-1].x3_pt - p[-1].x2_pt
                                 y1 = p[-1].y3_pt - p[-1].y2_pt
@@ -192,17 +198,18 @@ class svgHandler(svgBaseHandler):
                         p.append(path.curveto_pt(x1, y1, x2, y2, x3, y3) if cmd.isupper() else
                                  path.rcurveto_pt(x1, y1, x2, y2, x3, y3))
                 elif cmd in "QqTt":
-                    while args:
+                    n = 4 if cmd in "Qq" else 2
+                    for i in range(0, len(args), n):
                         x0, y0 = p.atend_pt()
                         if cmd in "Qq":
-                            xq, yq, x3, y3, *args = args
+                            xq, yq, x3, y3 = args[i:i+4]
                             if cmd == "q":
                                 xq += x0
                                 yq += y0
                                 x3 += x0
                                 y3 += y0
                         else:
-                            x3, y3, *args = args
+                            x3, y3 = args[i:i+2]
                             if cmd == "t":
                                 x3 += x0
                                 y3 += y0
@@ -452,11 +459,11 @@ class svgHandler(svgBaseHandler):
                     else:
                         p = None
                 elif localname == "polyline" or localname == "polygon":
-                    x, y, *args = self.toFloats(attributes[None, "points"])
+                    points = self.toFloats(attributes[None, "points"])
+                    x, y = points[:2]
                     p = path.path(path.moveto_pt(x, y))
-                    while len(args) >= 2:
-                        x, y, *args = args
-                        p.append(path.lineto_pt(x, y))
+                    for i in range(2, len(points)-1, 2):
+                        p.append(path.lineto_pt(points[i], points[i+1]))
                     if localname == "polygon":
                         p.append(path.closepath())
                 else:
@@ -479,11 +486,43 @@ class svgHandler(svgBaseHandler):
             if localname == "g":
                 self.canvas, self.stroke, self.fill = self.stack.pop()
 
-class svgBboxDoneException(Exception): pass
-
 class svgBboxHandler(svgBaseHandler):
 
+    """determines the bbox and records the SAX events for the unparsed output"""
+
+    def __init__(self, resolution):
+        super().__init__(resolution)
+        self.bbox = None
+        self.events = []
+
+    def replay(self, handler):
+        for name, args in self.events:
+            getattr(handler, name)(*args)
+
+    def startPrefixMapping(self, *args):
+        self.events.append(("startPrefixMapping", args))
+
+    def endPrefixMapping(self, *args):
+        self.events.append(("endPrefixMapping", args))
+
     def startElementNS(self, name, qname, attributes):
+        if self.bbox is None:
+            self.startSVG(name, attributes)
+        self.events.append(("startElementNS", (name, qname, attributes)))
+
+    def endElementNS(self, *args):
+        self.events.append(("endElementNS", args))
+
+    def characters(self, *args):
+        self.events.append(("characters", args))
+
+    def ignorableWhitespace(self, *args):
+        self.events.append(("ignorableWhitespace", args))
+
+    def processingInstruction(self, *args):
+        self.events.append(("processingInstruction", args))
+
+    def startSVG(self, name, attributes):
         if name != ("http://www.w3.org/2000/svg", "svg"):
             raise ValueError("not an SVG file")
         if (None, "width") not in attributes or (None, "height") not in attributes:
@@ -500,7 +539,34 @@ class svgBboxHandler(svgBaseHandler):
             outer_height = self.toFloat(attributes.get((None, "height")), relative=inner_height, single=True)
             self.trafo = trafo.translate_pt(-0.5*outer_width, outer_height)
         self.bbox = bbox.bbox_pt(outer_x, -outer_y, outer_x+outer_width, -outer_y+outer_height)
-        raise svgBboxDoneException()
+
+
+@functools.lru_cache(maxsize=128)
+def _parse(filename, mtime, resolution, parsed):
+    """return the SAX handler after parsing filename
+
+    The result is cached, where filename is expected to be an absolute
+    path to be independent of the working directory and mtime is part of
+    the key to detect modifications of the file. The handler must not be
+    altered.
+    """
+    if parsed:
+        handler = svgHandler(resolution)
+    else:
+        handler = svgBboxHandler(resolution)
+    parser = xml.sax.make_parser()
+    parser.setContentHandler(handler)
+    parser.setFeature(xml.sax.handler.feature_namespaces, True)
+    parser.setFeature(xml.sax.handler.feature_external_ges, False)
+    parser.setFeature(xml.sax.handler.feature_external_pes, False)
+    with open(filename, "rb") as f:
+        parser.parse(f)
+    if not parsed and handler.bbox is None:
+        raise ValueError("no XML found")
+    if not handler.bbox:
+        # fallback for parsed svg without viewbox
+        handler.bbox = handler.canvas.bbox()
+    return handler
 
 
 class svgfile_pt(baseclasses.canvasitem):
@@ -510,30 +576,7 @@ class svgfile_pt(baseclasses.canvasitem):
         self.parsed = parsed
         self.resolution = resolution
 
-        if parsed:
-            self.svg = svgHandler(resolution)
-        else:
-            self.svg = svgBboxHandler(resolution)
-        parser = xml.sax.make_parser()
-        parser.setContentHandler(self.svg)
-        parser.setFeature(xml.sax.handler.feature_namespaces, True)
-        parser.setFeature(xml.sax.handler.feature_external_ges, False)
-        parser.setFeature(xml.sax.handler.feature_external_pes, False)
-        if parsed:
-            with open(filename, "rb") as f:
-                parser.parse(f)
-        else:
-            try:
-                with open(filename, "rb") as f:
-                    parser.parse(f)
-            except svgBboxDoneException:
-                pass
-            else:
-                raise ValueError("no XML found")
-
-        if not self.svg.bbox:
-            # fallback for parsed svg without viewbox
-            self.svg.bbox = self.svg.canvas.bbox()
+        self.svg = _parse(os.path.abspath(filename), os.stat(filename).st_mtime_ns, resolution, parsed)
 
         self.trafo = trafo.translate_pt(x_pt, y_pt)
 
@@ -585,14 +628,8 @@ class svgfile_pt(baseclasses.canvasitem):
             attrs = {"fill": "black"}
             t.processSVGattrs(attrs, writer, context, registry)
             svg.startSVGElement("g", attrs)
-            parser = xml.sax.make_parser()
-            parser.setContentHandler(svg)
-            parser.setFeature(xml.sax.handler.feature_namespaces, True)
-            parser.setFeature(xml.sax.handler.feature_external_ges, False)
-            parser.setFeature(xml.sax.handler.feature_external_pes, False)
             svg.passthrough = True
-            with open(self.filename, "rb") as f:
-                parser.parse(f)
+            self.svg.replay(svg)
             svg.passthrough = False
             svg.endSVGElement("g")
 
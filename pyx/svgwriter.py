@@ -88,23 +88,6 @@ class SVGGenerator(xml.sax.saxutils.XMLGenerator):
         self.xlink_enabled = xlink
         self.passthrough = False
 
-    def convertName(self, name):
-        split = name.split(":")
-        if len(split) == 1:
-            uri = svg_uri
-            name = split[0]
-        else:
-            short_uri, name = split
-            assert short_uri == "xlink"
-            if not self.xlink_enabled:
-                raise ValueError("xlink namespace found but not enabled")
-            self.xlink_used = True
-            uri = xlink_uri
-        return uri, name
-
-    def convertAttrs(self, attrs):
-        return {self.convertName(name): value for name, value in attrs.items()}
-
     def startDocument(self, *args, **kwargs):
         if not self.passthrough:
             raise NotImplemented("use startSVGDocument")
@@ -116,6 +99,7 @@ class SVGGenerator(xml.sax.saxutils.XMLGenerator):
     def startElementNS(self, *args, **kwargs):
         if not self.passthrough:
             raise NotImplemented("use startSVGElement")
+        self.finishStartElement()
         super().startElementNS(*args, **kwargs)
 
     def endElementNS(self, *args, **kwargs):
@@ -123,21 +107,67 @@ class SVGGenerator(xml.sax.saxutils.XMLGenerator):
             raise NotImplemented("use endSVGElement")
         super().endElementNS(*args, **kwargs)
 
+    # The SVG elements are written as strings directly to the output file,
+    # while the XMLGenerator is used for the XML declaration, character data
+    # and the passthrough of SAX events only. As for the XMLGenerator, the
+    # end of a start tag is written when its content starts, such that empty
+    # elements can be closed by "/>".
+
+    def characters(self, content):
+        if content:
+            self.finishStartElement()
+        super().characters(content)
+
+    def ignorableWhitespace(self, content):
+        if content:
+            self.finishStartElement()
+        super().ignorableWhitespace(content)
+
+    def processingInstruction(self, target, data):
+        self.finishStartElement()
+        super().processingInstruction(target, data)
+
+    def finishStartElement(self):
+        if self.pending_start_element:
+            self.svg.write(b">")
+            self.pending_start_element = False
+
     def startSVGDocument(self):
         super().startDocument()
-        super().startPrefixMapping(None, svg_uri)
-        if self.xlink_enabled:
-            super().startPrefixMapping("xlink", xlink_uri)
         self.indent = 0
         self.newline = True
         self.xlink_used = False
+        self.namespaces_declared = False
+        self.pending_start_element = False
+
+    def checkName(self, name):
+        if ":" in name:
+            assert name.split(":")[0] == "xlink"
+            if not self.xlink_enabled:
+                raise ValueError("xlink namespace found but not enabled")
+            self.xlink_used = True
 
     def startSVGElement(self, name, attrs):
+        data = []
+        if self.pending_start_element:
+            data.append(">")
         if name != "tspan":
             if not self.newline:
-                self.characters("\n")
-            self.characters(" "*self.indent)
-        super().startElementNS(self.convertName(name), None, self.convertAttrs(attrs))
+                data.append("\n")
+            data.append(" "*self.indent)
+        self.checkName(name)
+        data.append("<")
+        data.append(name)
+        if not self.namespaces_declared:
+            data.append(' xmlns="%s"' % svg_uri)
+            if self.xlink_enabled:
+                data.append(' xmlns:xlink="%s"' % xlink_uri)
+            self.namespaces_declared = True
+        for attrname, value in attrs.items():
+            self.checkName(attrname)
+            data.append(" %s=%s" % (attrname, xml.sax.saxutils.quoteattr(value)))
+        self.svg.write("".join(data).encode("utf-8"))
+        self.pending_start_element = True
         if name != "tspan":
             self.indent += 1
             self.last_was_end = False
@@ -149,13 +179,21 @@ class SVGGenerator(xml.sax.saxutils.XMLGenerator):
         return self.svg.tell()
 
     def endSVGElement(self, name):
+        data = ""
         if name != "tspan":
             self.indent -= 1
             if self.last_was_end:
                 if not self.newline:
-                    self.characters("\n")
-                self.characters(" "*self.indent)
-        super().endElementNS(self.convertName(name), None)
+                    data = "\n"
+                data += " "*self.indent
+        if self.pending_start_element and not data:
+            data = "/>"
+        else:
+            if self.pending_start_element:
+                data = ">" + data
+            data += "</%s>" % name
+        self.svg.write(data.encode("utf-8"))
+        self.pending_start_element = False
         if name != "tspan":
             self.last_was_end = True
             self.newline = False
@@ -163,9 +201,6 @@ class SVGGenerator(xml.sax.saxutils.XMLGenerator):
     def endSVGDocument(self):
         assert not self.indent
         self.characters("\n")
-        super().endPrefixMapping(None)
-        if self.xlink_enabled:
-            super().endPrefixMapping("xlink")
         super().endDocument()
 
 
@@ -175,15 +210,24 @@ class SVGGenerator(xml.sax.saxutils.XMLGenerator):
 
 class SVGwriter:
 
-    def __init__(self, document, file, text_as_path=True, mesh_as_bitmap_resolution=300):
+    def __init__(self, document, file, text_as_path=True, mesh_as_bitmap_resolution=300, precision=None, compact=False, simplify=None, glyph_symbols=True, max_image_dpi=None, image_resample="lanczos"):
         self._fontmap = None
         self.text_as_path = text_as_path
         self.mesh_as_bitmap_resolution = mesh_as_bitmap_resolution
+        self.precision = precision
+        self.compact = compact
+        self.simplify = simplify
+        self.glyph_symbols = glyph_symbols
+        self.max_image_dpi = max_image_dpi
+        self.image_resample = image_resample
 
         # dictionary mapping font names to dictionaries mapping encoding names to encodings
         # encodings themselves are mappings from glyphnames to codepoints
         self.encodings = {}
 
+        # most recently resampled images
+        self.resampledcache = {}
+
         if len(document.pages) != 1:
             raise ValueError("SVG file can be constructed out of a single page document only")
         page = document.pages[0]
@@ -247,6 +291,7 @@ class context:
         self.fillopacity = 1
         self.strokeopacity = 1
         self.indent = 1
+        self.trafo = trafo.trafo()
 
     def __call__(self, **kwargs):
         newcontext = copy.copy(self)
@@ -21,6 +21,10 @@ bitmap_rgb_storestring = bitmap.bitmap(2, 0, image_rgb, height=0.8, PSstoreimage
 bitmap_bw_storearray = bitmap.bitmap(4, 1, image_bw, height=0.8, PSstoreimage=1, PSmaxstrlen=2)
 bitmap_rgb_storearray = bitmap.bitmap(4, 0, image_rgb, height=0.8, PSstoreimage=1, PSmaxstrlen=2)
 
+# PNG images with and without an alpha channel
+bitmap_png_rgba = bitmap.bitmap(0, 2, bitmap.pngimage("../../www/valid-html401.png"), height=0.8)
+bitmap_png_palette = bitmap.bitmap(4, 2, bitmap.pngimage("../../www/vcss.png"), height=0.8, compressmode=None)
+
 c = canvas.canvas()
 c.insert(bitmap_bw_stream)
 c.insert(bitmap_rgb_stream)
@@ -28,6 +32,8 @@ c.insert(bitmap_bw_storestring)
 c.insert(bitmap_rgb_storestring)
 c.insert(bitmap_bw_storearray)
 c.insert(bitmap_rgb_storearray)
+c.insert(bitmap_png_rgba)
+c.insert(bitmap_png_palette)
 if paletteimage:
     c.insert(bitmap.bitmap(6, 0, paletteimage, height=1.8))
 c.writeEPSfile("test_bitmap", page_paperformat=document.paperformat.A4)
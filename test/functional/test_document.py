@@ -12,4 +12,8 @@ for nr in range(1, 10):
 
 d.writePSfile("test_document")
 d.writePDFfile("test_document")
+d.writePDFfile("test_document_linearized", linearize=True)
 
+c = canvas.canvas()
+c.text(0, 0, "appended page")
+document.document([document.page(c, paperformat=document.paperformat.A4)]).writePDFfile("test_document", append=True)
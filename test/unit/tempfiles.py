@@ -0,0 +1,21 @@
+import contextlib, os, tempfile
+
+
+@contextlib.contextmanager
+def samenamefiles(filename, contents):
+    """create files filename with the given contents in temporary directories
+
+    All files get the same modification time, so the files differ by their
+    directory only. The list of directories is returned and the working
+    directory is restored afterwards."""
+    cwd = os.getcwd()
+    with contextlib.ExitStack() as stack:
+        dirs = [stack.enter_context(tempfile.TemporaryDirectory()) for content in contents]
+        for dir, content in zip(dirs, contents):
+            with open(os.path.join(dir, filename), "w") as f:
+                f.write(content)
+            os.utime(os.path.join(dir, filename), ns=(0, 0))
+        try:
+            yield dirs
+        finally:
+            os.chdir(cwd)
@@ -0,0 +1,148 @@
+import sys
+if sys.path[0] != "../..":
+    sys.path.insert(0, "../..")
+
+import array, base64, binascii, io, struct, unittest, zlib
+
+from pyx import bitmap, canvas, document, trafo, writer
+
+
+def filterpng(pixels, rowlength, height, bpp):
+    """return the PNG image data of pixels, where the rows use all filter types in turn"""
+    data = []
+    previous = bytes(rowlength)
+    for y in range(height):
+        row = pixels[y*rowlength:(y+1)*rowlength]
+        filter = y % 5
+        filtered = bytearray([filter])
+        for i in range(rowlength):
+            a = row[i-bpp] if i >= bpp else 0
+            b = previous[i]
+            c = previous[i-bpp] if i >= bpp else 0
+            if filter == 0:
+                predictor = 0
+            elif filter == 1:
+                predictor = a
+            elif filter == 2:
+                predictor = b
+            elif filter == 3:
+                predictor = (a + b) // 2
+            else:
+                pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2*c)
+                predictor = a if pa <= pb and pa <= pc else b if pb <= pc else c
+            filtered.append((row[i] - predictor) & 255)
+        data.append(bytes(filtered))
+        previous = row
+    return b"".join(data)
+
+
+def pngfile(width, height, colortype, data):
+    chunk = lambda name, data: struct.pack("!I", len(data)) + name + data + struct.pack("!I", zlib.crc32(name + data))
+    return (b"\x89PNG\r\n\x1a\n" +
+            chunk(b"IHDR", struct.pack("!2I5B", width, height, 8, colortype, 0, 0, 0)) +
+            chunk(b"pHYs", struct.pack("!IIB", 2835, 2835, 1)) +
+            chunk(b"IDAT", zlib.compress(data)) +
+            chunk(b"IEND", b""))
+
+
+class BitmapTestCase(unittest.TestCase):
+
+    def testBuffer(self):
+        data = array.array("H", [0x0201, 0x0403, 0x0605])
+        image = bitmap.image(2, 1, "RGB", data)
+        self.assertEqual(image.tobytes(), bytes([1, 2, 3, 4, 5, 6]))
+        self.assertRaises(ValueError, bitmap.image, 2, 2, "RGB", data)
+
+    def testBands(self):
+        image = bitmap.image(2, 1, "RGBA", bytearray([1, 2, 3, 4, 5, 6, 7, 8]))
+        self.assertEqual(bytes(image.band(3)), bytes([4, 8]))
+        self.assertEqual([band.tobytes() for band in image.split()], [bytes([1, 5]), bytes([2, 6]), bytes([3, 7]), bytes([4, 8])])
+        self.assertEqual(bitmap.interleave([image.band(3), image.band(0)]), bytes([4, 1, 8, 5]))
+
+    def testImagedataAlpha(self):
+        image = bitmap.image(2, 1, "RGBA", bytes([1, 2, 3, 4, 5, 6, 7, 8]))
+        b = bitmap.bitmap_trafo(trafo.trafo(), image, compressmode=None)
+        self.assertEqual(b._imagedata(False), ("RGB", bytes([1, 2, 3, 5, 6, 7]), bytes([4, 8]), None, None))
+        self.assertEqual(b._imagedata(True), ("RGB", bytes([4, 1, 2, 3, 8, 5, 6, 7]), True, None, None))
+
+    def testASCII85(self):
+        for length in [0, 1, 3, 4, 59, 60, 61, 200]:
+            data = bytes(range(256))[:length] + bytes(length//2)
+            file = writer.writer(io.BytesIO())
+            encoder = bitmap.ascii85encoder(file)
+            # feed the encoder in chunks not aligned to the line length
+            for i in range(0, len(data), 7):
+                encoder.write(data[i:i+7])
+            encoder.close()
+            encoded = file.file.getvalue()
+            self.assertEqual(base64.a85decode(encoded), data)
+            self.assertNotIn(b"z", encoded)
+            if data:
+                self.assertEqual(encoded.count(b"\n") + 1, bitmap.ascii85lines(len(data)))
+
+    def testASCIIHex(self):
+        for length in [1, 31, 32, 33, 100]:
+            data = bytes(range(length))
+            file = writer.writer(io.BytesIO())
+            bitmap.asciihexstream(file, data)
+            encoded = file.file.getvalue()
+            self.assertEqual(binascii.a2b_hex(encoded.replace(b"\n", b"")), data)
+            self.assertEqual(encoded.count(b"\n"), bitmap.asciihexlines(len(data)))
+
+    def testDeduplication(self):
+        pages = []
+        for data in [b"\0\377\377\0", bytearray(b"\0\377\377\0")]:
+            c = canvas.canvas()
+            c.insert(bitmap.bitmap(0, 0, bitmap.image(2, 2, "L", data), height=1))
+            c.insert(bitmap.bitmap(2, 0, bitmap.image(2, 2, "L", data), height=1))
+            pages.append(document.page(c))
+        pdf = io.BytesIO()
+        document.document(pages).writePDFfile(pdf)
+        self.assertEqual(pdf.getvalue().count(b"/Subtype /Image"), 1)
+
+    def testImagedataCache(self):
+        b = bitmap.bitmap_trafo(trafo.trafo(), bitmap.image(2, 1, "LA", b"\1\2\3\4"))
+        self.assertIs(b.digest(), b.digest())
+        cache = {}
+        self.assertIs(b.imagedata(False, cache), b.imagedata(False, cache))
+        self.assertEqual(len(cache), 1)
+        for i in range(bitmap._imagedatacachesize + 1):
+            bitmap.bitmap_trafo(trafo.trafo(), bitmap.image(1, 1, "L", bytes([i]))).imagedata(False, cache)
+        self.assertEqual(len(cache), bitmap._imagedatacachesize)
+        self.assertNotIn((b.digest(), False), cache)
+
+    def testResampled(self):
+        image = bitmap.image(100, 100, "L", bytes(10000))
+        c = canvas.canvas()
+        # the bitmap is 1 inch wide, but scaled to half of it by the enclosing canvas
+        c.insert(canvas.canvas([trafo.scale(0.5)])).insert(bitmap.bitmap_pt(0, 0, image, width_pt=72))
+        for write in [document.document.writePDFfile, document.document.writeEPSfile]:
+            output = io.BytesIO()
+            write(document.document([document.page(c)]), output, max_image_dpi=50, image_resample="nearest")
+            self.assertIn(b"/Width 25\n", output.getvalue())
+        output = io.BytesIO()
+        document.document([document.page(c)]).writeSVGfile(output, max_image_dpi=50, image_resample="nearest")
+        png = base64.b64decode(output.getvalue().split(b"base64,")[1].split(b'"')[0])
+        self.assertEqual(png[16:24], bytes([0, 0, 0, 25, 0, 0, 0, 25]))
+
+    def testPNGunfilter(self):
+        pixels = bytes((7*i*i + 3*i) % 256 for i in range(4*7*10))
+        self.assertEqual(bitmap._unfilterpng(filterpng(pixels, 4*7, 10, 4), 4*7, 10, 4), pixels)
+
+    def testPNGimage(self):
+        pixels = bytes((7*i*i + 3*i) % 256 for i in range(4*7*10))
+        image = bitmap.pngimage(io.BytesIO(pngfile(7, 10, 6, filterpng(pixels, 4*7, 10, 4))))
+        self.assertEqual((image.size, image.mode, image.compressed), ((7, 10), "RGBA", None))
+        self.assertEqual(image.tobytes(), pixels)
+        self.assertAlmostEqual(image.info["dpi"][0], 72.009)
+        # without alpha channel the compressed data is used directly
+        data = filterpng(pixels[:3*7*10], 3*7, 10, 3)
+        image = bitmap.pngimage(io.BytesIO(pngfile(7, 10, 2, data)))
+        self.assertEqual((image.size, image.mode, image.compressed), ((7, 10), "RGB", "Flate"))
+        self.assertEqual(zlib.decompress(image.data), data)
+        self.assertIn("/Predictor 15 /Colors 3", image.decodeparms)
+        self.assertRaises(ValueError, bitmap.pngimage, io.BytesIO(b"GIF89a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import sys
+if sys.path[0] != "../..":
+    sys.path.insert(0, "../..")
+
+import io, unittest
+
+from pyx import canvas, path, trafo
+
+
+class CanvasTestCase(unittest.TestCase):
+
+    def testbbox(self):
+        c = canvas.canvas()
+        p = path.line_pt(0, 0, 1, 1)
+        c.stroke(p)
+        sc = c.insert(canvas.canvas([trafo.translate_pt(10, 0)]))
+        layer = c.layer("top")
+        self.assertEqual(c.bbox().highrestuple_pt(), (0, 0, 1, 1))
+        sc.stroke(path.line_pt(0, 0, 1, 2))
+        self.assertEqual(c.bbox().highrestuple_pt(), (0, 0, 11, 2))
+        layer.fill(path.rect_pt(0, 0, 3, -3))
+        self.assertEqual(c.bbox().highrestuple_pt(), (0, -3, 11, 2))
+        # modifications of items already inserted into the canvas are taken into account
+        p.append(path.lineto_pt(20, 5))
+        self.assertEqual(c.bbox().highrestuple_pt(), (0, -3, 20, 5))
+        eps = io.BytesIO()
+        c.writeEPSfile(eps)
+        self.assertIn(b"%%HiResBoundingBox: -1 -4 21 6\n", eps.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import sys
+if sys.path[0] != "../..":
+    sys.path.insert(0, "../..")
+
+import io, os, re, tempfile, unittest, zlib
+
+from pyx import canvas, config, epsfile, pdfwriter
+from tempfiles import samenamefiles
+
+
+def pdffile(objects):
+    """return a PDF file containing the objects, the first being the catalog"""
+    data = [b"%PDF-1.4\n"]
+    offsets = []
+    for refno, object in enumerate(objects, 1):
+        offsets.append(sum(map(len, data)))
+        data.append(b"%i 0 obj\n%s\nendobj\n" % (refno, object))
+    xrefpos = sum(map(len, data))
+    data.append(b"xref\n0 %i\n0000000000 65535 f \n" % (len(objects) + 1))
+    data.extend(b"%010i 00000 n \n" % offset for offset in offsets)
+    data.append(b"trailer\n<< /Size %i /Root 1 0 R >>\nstartxref\n%i\n%%%%EOF\n" % (len(objects) + 1, xrefpos))
+    return b"".join(data)
+
+
+class EPSfileTestCase(unittest.TestCase):
+
+    def testBboxHeader(self):
+        eps = io.BytesIO(b"%!PS-Adobe-3.0 EPSF-3.0\n"
+                         b"%%BoundingBox: 1 2 3 4\n"
+                         b"%%EndComments\n"
+                         b"newpath\n")
+        self.assertEqual(epsfile._readbbox(eps).highrestuple_pt(), (1, 2, 3, 4))
+
+    def testBboxAtend(self):
+        body = b"0 0 moveto 1 1 lineto stroke\n" * 10000
+        eps = io.BytesIO(b"%!PS-Adobe-3.0 EPSF-3.0\r\n"
+                         b"%%BoundingBox: (atend)\r\n"
+                         b"%%EndComments\r\n" + body +
+                         b"%%BeginDocument: nested.eps\r\n"
+                         b"%%Trailer\r\n"
+                         b"%%BoundingBox: 9 9 9 9\r\n"
+                         b"%%EndDocument\r\n" + body +
+                         b"%%Trailer\r\n"
+                         b"%%BoundingBox: 0 0 1 1\r\n"
+                         b"%%BoundingBox: 1 2 3 4\r\n"
+                         b"%%EOF\r\n")
+        self.assertEqual(epsfile._readbbox(eps).highrestuple_pt(), (1, 2, 3, 4))
+
+    def testBboxMissing(self):
+        eps = io.BytesIO(b"%!PS-Adobe-3.0 EPSF-3.0\n"
+                         b"%%BoundingBox: (atend)\n"
+                         b"%%EndComments\n"
+                         b"newpath\n")
+        self.assertRaises(IOError, epsfile._readbbox, eps)
+
+    def testBboxCacheRelativeFilename(self):
+        eps = "%%!PS-Adobe-3.0 EPSF-3.0\n%%%%BoundingBox: 0 0 %d %d\n"
+        with samenamefiles("test.eps", [eps % (10, 10), eps % (20, 20)]) as (dir1, dir2):
+            epsfile._cachedbbox.cache_clear()
+            os.chdir(dir1)
+            self.assertEqual(epsfile._filebbox("test.eps").highrestuple_pt(), (0, 0, 10, 10))
+            os.chdir(dir2)
+            self.assertEqual(epsfile._filebbox("test.eps").highrestuple_pt(), (0, 0, 20, 20))
+            # a cache hit gives the bbox of a fresh read
+            self.assertEqual(epsfile._filebbox(os.path.join(dir1, "test.eps")).highrestuple_pt(), (0, 0, 10, 10))
+            self.assertEqual(epsfile._cachedbbox.cache_info().hits, 1)
+            self.assertEqual(epsfile._cachedbbox.cache_info().misses, 2)
+
+    @unittest.skipUnless(os.name == "posix", "POSIX permissions required")
+    def testCachedir(self):
+        if not config.config.has_section("epsfile"):
+            config.config.add_section("epsfile")
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                cachedir = os.path.join(tmpdir, "epscache")
+                config.config.set("epsfile", "cachedir", cachedir)
+                self.assertEqual(epsfile._cachedir(), cachedir)
+                self.assertEqual(os.stat(cachedir).st_mode & 0o777, 0o700)
+                os.chmod(cachedir, 0o777)
+                self.assertEqual(epsfile._cachedir(), None)
+        finally:
+            config.config.remove_option("epsfile", "cachedir")
+
+    def testReadconvertedPDF(self):
+        content = b"0 0 m 10 20 l S /G0 gs BT /F0 12 Tf (A) Tj ET"
+        stream = zlib.compress(content)
+        pdf = pdffile([b"<< /Type /Catalog /Pages 2 0 R >>",
+                       # resources and media box inherited from the pages tree
+                       b"<< /Type /Pages /Kids [3 0 R] /Count 1 /MediaBox [0 0 10 20]\n"
+                       b"/Resources << /ExtGState << /G0 4 0 R >> /Font << /F0 5 0 R >> >> >>",
+                       b"<< /Type /Page /Parent 2 0 R /Contents 6 0 R >>",
+                       b"<< /Type /ExtGState /CA 0.5 >>",
+                       b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Widths 7 0 R >>",
+                       b"<< /Length %i /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(stream), stream),
+                       b"[500 500]"])
+        converted = []
+        def convertPDF(filename):
+            # replaces the conversion by Ghostscript
+            converted.append(filename)
+            with open(filename, "wb") as f:
+                f.write(pdf)
+
+        if not config.config.has_section("epsfile"):
+            config.config.add_section("epsfile")
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                config.config.set("epsfile", "cachedir", os.path.join(tmpdir, "epscache"))
+                filename = os.path.join(tmpdir, "test.eps")
+                with open(filename, "w") as f:
+                    f.write("%!PS-Adobe-3.0 EPSF-3.0\n%%BoundingBox: 5 5 15 25\n0 0 moveto 10 20 lineto stroke\n")
+                e = epsfile.epsfile(0, 0, filename)
+                e.convertPDF = convertPDF
+                form, objects = e.readconvertedPDF()
+                self.assertEqual(len(converted), 1)
+                self.assertEqual(os.path.dirname(converted[0]), os.path.join(tmpdir, "epscache"))
+                self.assertEqual((form.mediabox, form.llx_pt, form.lly_pt), ((0, 0, 10, 20), 5, 5))
+                self.assertEqual(form.content, content)
+                self.assertEqual(sorted(object.id[1] for object in objects), [4, 5, 7])
+
+                # the form XObject refers to the imported resources
+                c = canvas.canvas()
+                c.insert(e)
+                output = io.BytesIO()
+                c.writePDFfile(output, write_compress=False, write_eps_as_bitmap=False)
+                reader = pdfwriter.PDFreader(output)
+                refno, = [refno for refno in reader.xrefs[0] if b"/Subtype /Form" in reader.readobject(refno)]
+                dict, stream = reader.readrawobject(refno)
+                self.assertIn(b"/BBox [0 0 10 20]", dict)
+                self.assertIn(b"/Matrix [1 0 0 1 5 5]", dict)
+                self.assertEqual(stream, content)
+                resources = reader.getvalue(dict, b"Resources")
+                gsrefno = int(re.search(br"/G0 (\d+) 0 R", resources).group(1))
+                fontrefno = int(re.search(br"/F0 (\d+) 0 R", resources).group(1))
+                self.assertEqual(reader.readrawobject(gsrefno), (b"<< /Type /ExtGState /CA 0.5 >>", None))
+                font = reader.readobject(fontrefno)
+                self.assertIn(b"/BaseFont /Helvetica", font)
+                self.assertEqual(reader.readrawobject(reader.getref(font, b"Widths")), (b"[500 500]", None))
+                self.assertIn(b"/EPS%s Do\n" % form.key[:16].encode("ascii"), output.getvalue())
+
+                # the converted file is reused from the cache directory
+                epsfile._readconvertedPDF.cache_clear()
+                e = epsfile.epsfile(0, 0, filename)
+                e.convertPDF = convertPDF
+                cachedform, cachedobjects = e.readconvertedPDF()
+                self.assertEqual(len(converted), 1)
+                self.assertEqual((cachedform.key, cachedform.mediabox, cachedform.content), (form.key, form.mediabox, form.content))
+                self.assertEqual([object.id for object in cachedobjects], [object.id for object in objects])
+        finally:
+            config.config.remove_option("epsfile", "cachedir")
+            epsfile._readconvertedPDF.cache_clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import sys
+if sys.path[0] != "../..":
+    sys.path.insert(0, "../..")
+
+import array, unittest
+
+from pyx import bbox, color, mesh
+
+
+class MeshTestCase(unittest.TestCase):
+
+    def testPacknodes(self):
+        xs_pt, ys_pt, colors = [0, 1, 0.25], [0, 2, 1], bytes([10, 20, 30, 40, 50, 60])
+        b = bbox.bbox_pt(0, 0, 1, 2)
+        expected = b"".join([b"\0" + mesh.coords24bit_pt(xs_pt[i], 0, 1) + mesh.coords24bit_pt(ys_pt[i], 0, 2) + colors[2*i:2*i+2]
+                             for i in range(3)])
+        self.assertEqual(mesh.packnodes(xs_pt, ys_pt, colors, 2, b), expected)
+        self.assertEqual(mesh.packnodes(xs_pt, ys_pt, colors, 2, b, flag=False),
+                         b"".join([expected[i+1:i+9] for i in range(0, len(expected), 9)]))
+
+    def testArraymesh(self):
+        coords_pt = [0, 0, 10, 0, 0, 10, 10, 10]
+        values = [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1]
+        triangles = [0, 1, 2, 3, 2, 1]
+        nodes = [mesh.node_pt(coords_pt[2*i:2*i+2], color.rgb(*values[3*i:3*i+3])) for i in range(4)]
+        m1 = mesh.mesh([mesh.element([nodes[i] for i in triangles[j:j+3]]) for j in range(0, 6, 3)])
+        m2 = mesh.arraymesh(array.array("d", coords_pt), values, array.array("i", triangles))
+        self.assertEqual(m2.bbox().highrestuple_pt(), m1.bbox().highrestuple_pt())
+        self.assertEqual(m2.shadingdict(m2.bbox()), m1.shadingdict(m1.bbox()))
+        self.assertEqual(m2.data(m2.bbox()), m1.data(m1.bbox()))
+        # the cached bbox is not modified by the caller
+        m2.bbox().enlarge_pt(1)
+        self.assertEqual(m2.bbox().highrestuple_pt(), (0, 0, 10, 10))
+        self.assertRaises(ValueError, mesh.arraymesh, coords_pt, values, [0, 1])
+        self.assertRaises(ValueError, mesh.arraymesh, coords_pt, values[:-1], triangles)
+        self.assertRaises(ValueError, mesh.arraymesh, coords_pt, values, [0, 1, 4])
+
+    def testStriprecords(self):
+        a, b, c, d, e = [bytes([0, i]) for i in range(5)]
+        # the second triangle shares the edge b, c, the third one the edge b, d
+        self.assertEqual(mesh.striprecords([a, b, c, c, b, d, b, e, d, a, e, c]),
+                         a + b + c + b"\001\003" + b"\002\004" + a + e + c)
+        # degenerate triangles having two identical nodes
+        self.assertEqual(mesh.striprecords([a, b, b, b, d, e]), a + b + b + b + d + e)
+        self.assertEqual(mesh.striprecords([a, b, b, a, b, d]), a + b + b + b"\002\003")
+        self.assertEqual(mesh.striprecords([a, b, c, b, c, c, c, b, d]), a + b + c + b + c + c + b"\002\003")
+        nodes = [mesh.node_pt(coords_pt, color.grey(0)) for coords_pt in [(0, 0), (10, 0), (10, 0), (10, 0), (20, 10), (0, 10)]]
+        m = mesh.mesh([mesh.element(nodes[:3]), mesh.element(nodes[3:])])
+        self.assertEqual(len(m.data(m.bbox())), 6*8)
+
+    def testLatticemesh(self):
+        m = mesh.latticemesh([0, 0, 10, 0, 20, 0, 0, 10, 10, 10, 20, 10], [0.2, 0.4, 0.6, 0.8, 1, 0], 3, colorclass=color.gray)
+        self.assertIn("/ShadingType 5\n", m.shadingdict(m.bbox()))
+        self.assertIn("/VerticesPerRow 3\n", m.shadingdict(m.bbox()))
+        # each node once, without flag
+        self.assertEqual(len(m.data(m.bbox())), 6*7)
+        self.assertEqual(list(m.nodearrays()[3]), [0, 1, 3, 1, 4, 3, 1, 2, 4, 2, 5, 4])
+        self.assertRaises(ValueError, mesh.latticemesh, [0, 0, 10, 0, 20, 0], [0, 0, 0], 3, colorclass=color.gray)
+        self.assertRaises(ValueError, mesh.latticemesh, [0, 0, 10, 0, 20, 0, 0, 10], [0, 0, 0, 0], 3, colorclass=color.gray)
+
+    def testRasterize(self):
+        image = mesh.rasterize([0, 72, 0], [0, 0, 72], bytes([0, 255, 0]), 1, [0, 1, 2],
+                               bbox.bbox_pt(0, 0, 72, 72), 4)
+        self.assertEqual(image.size, (4, 4))
+        self.assertEqual(image.mode, "LA")
+        self.assertEqual(image.tobytes(), bytes([0, 0, 0, 0, 0, 0, 0, 0,
+                                                 32, 255, 0, 0, 0, 0, 0, 0,
+                                                 32, 255, 96, 255, 0, 0, 0, 0,
+                                                 32, 255, 96, 255, 159, 255, 0, 0]))
+
+    def testRasterizeCommonEdges(self):
+        # each pixel is painted by a single triangle only
+        xs_pt = [0, 10, 0, 10, 5]
+        ys_pt = [0, 0, 10, 10, 5]
+        triangles = [0, 1, 4, 1, 3, 4, 3, 2, 4, 2, 0, 4]
+        painted = 0
+        for i in range(0, len(triangles), 3):
+            image = mesh.rasterize(xs_pt, ys_pt, bytes(5), 1, triangles[i:i+3], bbox.bbox_pt(0, 0, 10, 10), 72)
+            painted += image.tobytes()[1::2].count(255)
+        self.assertEqual(painted, 100)
+
+    def testLatticeBitmap(self):
+        m = mesh.latticemesh([0, 0, 10, 0, 0, 10, 10, 10], [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1], 2)
+        b = m.tobitmap(72)
+        self.assertEqual(b.image.size, (10, 10))
+        self.assertEqual(b.image.mode, "RGBA")
+        self.assertEqual(b.image.tobytes()[3::4], b"\377"*100)
+        self.assertEqual(b.bbox().highrestuple_pt(), (0, 0, 10, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
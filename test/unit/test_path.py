@@ -5,9 +5,10 @@ if sys.path[0] != "../..":
 import unittest
 
 from pyx import *
+from pyx import writer
 from pyx.path import *
-from pyx.normpath import normpathparam
-import math
+from pyx.normpath import normpathparam, _intersectsplit
+import array, io, math, re
 set(epsilon=1e-7)
 
 class NormpathTestCase(unittest.TestCase):
@@ -135,6 +136,25 @@ class NormpathTestCase(unittest.TestCase):
         for arclen, arclen2 in zip(arclens, p.paramtoarclen(p.arclentoparam(arclens))):
             self.assertAlmostEqual(unit.tom(arclen), unit.tom(arclen2), 4)
 
+    def testarclentable(self):
+        nsp = normsubpath([normline_pt(0, 0, 10, 0), normcurve_pt(10, 0, 20, 0, 20, 10, 20, 20)])
+        curve = nsp[1]
+        curvelen_pt = curve.arclen_pt(nsp.epsilon)
+        self.assertAlmostEqual(nsp.arclen_pt(), 10 + curvelen_pt)
+        lengths_pt = [-5, 0, 5, 12, 10 + 0.5*curvelen_pt, 30, 50]
+        params = nsp.arclentoparam_pt(lengths_pt)
+        self.assertAlmostEqual(params[0], -0.5)
+        self.assertAlmostEqual(params[1], 0)
+        self.assertAlmostEqual(params[2], 0.5)
+        for param, length_pt in zip(params[3:], lengths_pt[3:]):
+            self.assertAlmostEqual(param, 1 + curve.arclentoparam_pt([length_pt-10], nsp.epsilon)[0])
+        for arclen_pt, length_pt in zip(nsp._paramtoarclen_pt(params)[0], lengths_pt):
+            self.assertAlmostEqual(arclen_pt, length_pt)
+        # the cached table is updated
+        nsp.append(normline_pt(20, 20, 20, 30))
+        self.assertAlmostEqual(nsp.arclen_pt(), 20 + curvelen_pt)
+        self.assertAlmostEqual(nsp.arclentoparam_pt([15 + curvelen_pt])[0], 2.5)
+
     def testsplit(self):
         p = normline_pt(0, 0, 10, 0)
         self.assertRaises(ValueError, p.segments, [])
@@ -378,6 +398,188 @@ class NormpathTestCase(unittest.TestCase):
         self.assertAlmostEqual(intersect[0][2], 2.9)
         self.assertAlmostEqual(intersect[0][3], 3.5)
 
+    def testintersectmanyitems(self):
+        p1 = normsubpath([normline_pt(i, 0, i+1, 0) for i in range(100)])
+        p2 = normsubpath([normline_pt(i+0.5, 1-2*(i%2), i+1.5, 1-2*((i+1)%2)) for i in range(101)])
+        intersect = p1.intersect(p2)
+        self.assertEqual(len(intersect[0]), 100)
+        for i, (a, b) in enumerate(zip(*intersect)):
+            self.assertAlmostEqual(a, i+1)
+            self.assertAlmostEqual(b, i+0.5)
+        # the cached index of the normsubpathitems is updated
+        p1.append(normline_pt(100, 0, 101, 0))
+        self.assertEqual(len(p1.intersect(p2)[0]), 101)
+
+    def testintersectcurve(self):
+        c = normcurve_pt(0, 0, 1, 2, 2, 2, 3, 0)
+        # crossing, touching, and through the end point
+        for line, expected in [(normline_pt(-1, 1, 4, 1), [(0.2113249, 0.3267949), (0.7886751, 0.6732051)]),
+                               (normline_pt(-1, 1.5, 4, 1.5), [(0.5, 0.5)]),
+                               (normline_pt(3, 0, 3, 5), [(1, 0)]),
+                               (normline_pt(-1, 1.6, 4, 1.6), [])]:
+            intersections = c.intersect(line, 1e-5)
+            self.assertEqual(len(intersections), len(expected))
+            for (t1, u1), (t2, u2) in zip(intersections, expected):
+                self.assertAlmostEqual(t1, t2)
+                self.assertAlmostEqual(u1, u2)
+            self.assertEqual([(u, t) for t, u in intersections], line.intersect(c, 1e-5))
+        # tangential at the end point of the line, and closer than epsilon at
+        # the begin of the curve while crossing its extension only
+        self.assertEqual(normcurve_pt(2.3, 4.4, 2.8, 3.7, 2, 3.2, 6.7, 2.1).intersect(normline_pt(1.8, 5.1, 2.3, 4.4), 1e-5), [(0, 1)])
+        c = normcurve_pt(0, 0, 1, 0, 2, 1, 3, 3)
+        self.assertEqual(c.intersect(normline_pt(-1, 0.002995, 1, -0.003005), 1e-5), [])
+        c = normcurve_pt(0, 0, 1, 2, 2, 2, 3, 0)
+        intersections = c.intersect(normcurve_pt(0, 2, 1, 0, 2, 0, 3, 2), 1e-5)
+        self.assertEqual(len(intersections), 2)
+        for (t1, t2), t in zip(intersections, [0.2113249, 0.7886751]):
+            self.assertAlmostEqual(t1, t)
+            self.assertAlmostEqual(t2, t)
+        # the subdivision fallback for a line on top of a curve
+        self.assertEqual(len(normcurve_pt(0, 0, 1, 0, 2, 0, 3, 0).intersect(normline_pt(1, 0, 5, 0), 1e-5)), 2)
+        # overlapping curves are subdivided without Bezier clipping of the parts
+        a = normcurve_pt(0, 0, 1, 2, 2, 2, 3, 0)._split(0.6)[0]
+        b = normcurve_pt(0, 0, 1, 2, 2, 2, 3, 0)._split(0.4)[1]
+        calls = []
+        intersectcurve = normcurve_pt._intersectcurve
+        normcurve_pt._intersectcurve = lambda *args: calls.append(args) or intersectcurve(*args)
+        try:
+            intersections = a.intersect(b, 1e-5)
+        finally:
+            normcurve_pt._intersectcurve = intersectcurve
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(intersections, _intersectsplit(a, b, 1e-5))
+
+    def testintersectparallel(self):
+        # the parallel deformer depends on the intersections close to the
+        # joints of the parallel curves (at the default epsilon)
+        for d, r in [(0.1, 0.9), (-0.3, 1.3), (0.6, 0.4)]:
+            np = deformer.parallel(d).deform(circle(0, 0, 1).normpath(epsilon=1e-5))
+            self.assertEqual(len(np), 1)
+            self.assertTrue(np[0].closed)
+            for x_pt, y_pt in np.at_pt([i*len(np[0])/20 for i in range(20)]):
+                self.assertAlmostEqual(unit.topt(r)/math.hypot(x_pt, y_pt), 1, 4)
+
+    def testpacked(self):
+        nsp = normsubpath([normline_pt(0, 0, 1, 0),
+                           normcurve_pt(1, 0, 2, 0, 2, 1, 2, 2),
+                           normline_pt(2, 2, 0, 0)])
+        packed = nsp.packed()
+        self.assertEqual(list(packed.types), [0, 1, 0])
+        ats = packed.at_pt([-0.5, 0.3, 1.25, 2.5, 3.5])
+        for (x1, y1), (x2, y2) in zip(ats, [(-0.5, 0), (0.3, 0), nsp[1].at_pt([0.25])[0], (1, 1), (-1, -1)]):
+            self.assertAlmostEqual(x1, x2)
+            self.assertAlmostEqual(y1, y2)
+        self.assertAlmostEqual(packed.curvature_pt([1.5])[0], nsp[1].curvature_pt([0.5])[0])
+        self.assertAlmostEqual(packed.rotation([1.5])[0].matrix[0][0], nsp[1].rotation([0.5])[0].matrix[0][0])
+        self.assertEqual(packed.bbox().highrestuple_pt(), (0, 0, 2, 2))
+        transformed = packed.transformed(trafo.translate_pt(1, 2)).normsubpath()
+        self.assertAlmostEqualNormsubpath(transformed, nsp.transformed(trafo.translate_pt(1, 2)))
+        # the cached packed form follows the skippedline and the closed flag
+        nsp = normsubpath(epsilon=1e-5)
+        nsp.bbox()
+        nsp.append(normline_pt(0, 0, 1e-7, 0))
+        self.assertEqual(nsp.at_pt([0]), [(0, 0)])
+        nsp = normsubpath([normline_pt(0, 0, 1, 0), normline_pt(1, 0, 0, 0)])
+        self.assertFalse(nsp.packed().closed)
+        nsp.close()
+        self.assertTrue(nsp.packed().closed)
+        # the cache is kept until the normsubpath is modified
+        nsp = normsubpath([normline_pt(0, 0, 1, 0), normline_pt(1, 0, 2, 0)])
+        packed = nsp.packed()
+        self.assertIs(nsp.packed(), packed)
+        nsp[-1] = nsp[-1].modifiedend_pt(2, 1)
+        self.assertEqual(nsp.at_pt([2]), [(2, 1)])
+        copy = nsp.copy()
+        copy.extend([normline_pt(2, 1, 3, 1)])
+        self.assertEqual(copy.at_pt([3]), [(3, 1)])
+        self.assertEqual(len(nsp.packed().types), 2)
+        nsp.flushskippedline()
+        self.assertIsNot(nsp.packed(), packed)
+
+    def testoutputprecision(self):
+        class dummywriter:
+            def __init__(self, precision, compact=False, relative=False):
+                self.precision = precision
+                self.compact = compact
+                self.relative = relative
+                self.simplify = None
+        p = normpath([normsubpath([normline_pt(0, 0, 1.25, 100),
+                                   normcurve_pt(1.25, 100, 2.0004, -0.5, 3.1416, 2, 10, 0.1)], closed=1)])
+        f = writer.writer(io.BytesIO())
+        p.outputPDF(f, dummywriter(3))
+        self.assertEqual(f.file.getvalue(), b"0 0 m\n1.25 100 l\n2 -0.5 3.142 2 10 0.1 c\nh\n")
+        f = writer.writer(io.BytesIO())
+        p.outputPS(f, dummywriter(None))
+        self.assertEqual(f.file.getvalue(), b"0 0 moveto\n1.25 100 lineto\n2.0004 -0.5 3.1416 2 10 0.1 curveto\nclosepath\n")
+        self.assertEqual(p.returnSVGdata(precision=1), "M0 0L1.2 -100C2 0.5 3.1 -2 10 -0.1Z")
+        f = writer.writer(io.BytesIO())
+        p.outputPS(f, dummywriter(1, compact=True, relative=True))
+        self.assertEqual(f.file.getvalue(), b"0 0 m\n1.2 100 rl\n0.8 -100.5 1.9 -98 8.8 -99.9 rc\nh\n")
+        self.assertEqual(p.returnSVGdata(precision=1, compact=True), "M0 0l1.2-100c.8 100.5 1.9 98 8.8 99.9Z")
+        # relative output without precision must not accumulate rounding errors
+        p = normpath([normsubpath([normline_pt(0.1234567*i, 0.1234567*i, 0.1234567*(i+1), 0.1234567*(i+1))
+                                   for i in range(1000)])])
+        f = writer.writer(io.BytesIO())
+        p.outputPS(f, dummywriter(None, relative=True))
+        numbers = [float(number) for number in f.file.getvalue().split() if number not in [b"moveto", b"rlineto"]]
+        self.assertAlmostEqual(sum(numbers[0::2]), 123.4567, places=4)
+        self.assertAlmostEqual(sum(numbers[1::2]), 123.4567, places=4)
+        numbers = [float(number) for number in re.findall(r"-?[0-9]*\.?[0-9]+", p.returnSVGdata(compact=True))]
+        self.assertAlmostEqual(sum(numbers[0::2]), 123.4567, places=4)
+        self.assertAlmostEqual(sum(numbers[1::2]), -123.4567, places=4)
+
+    def testmultilineto(self):
+        class dummywriter:
+            precision = None
+            simplify = None
+        points = [(1, 0), (1, 2), (0.5, -1)]
+        ml = multilineto_pt(array.array("d", [1, 0, 1, 2, 0.5, -1]))
+        self.assertEqual(ml.points_pt, points)
+        self.assertEqual(multilineto_pt(points).coords_pt, ml.coords_pt)
+        p = path(moveto_pt(0, 0), ml, closepath(), moveto_pt(5, 5), moveto_pt(3, 3), lineto_pt(4, 4))
+        self.assertEqual(p.bbox().highrestuple_pt(), (0, -1, 5, 5))
+        self.assertEqual(len(p.normpath(epsilon=None)[0]), 5)
+        self.assertEqual(p.returnSVGdata(), "M0 0L1 0L1 -2L0.5 1ZM5 -5M3 -3L4 -4")
+        self.assertEqual(p.returnSVGdata(), path(moveto_pt(0, 0), *[lineto_pt(*point) for point in points], closepath(),
+                                                 moveto_pt(5, 5), moveto_pt(3, 3), lineto_pt(4, 4)).returnSVGdata())
+        f = writer.writer(io.BytesIO())
+        p.outputPDF(f, dummywriter())
+        self.assertEqual(f.file.getvalue(), b"0.000000 0.000000 m\n1.000000 0.000000 l\n1.000000 2.000000 l\n0.500000 -1.000000 l\nh\n"
+                                            b"3.000000 3.000000 m\n4.000000 4.000000 l\n")
+        self.assertEqual(ml.transformed(trafo.translate_pt(1, 2)).points_pt, [(2, 2), (2, 4), (1.5, 1)])
+
+    def testbboxcache(self):
+        p = path(moveto_pt(0, 0), lineto_pt(1, 2))
+        self.assertEqual(p.bbox().highrestuple_pt(), (0, 0, 1, 2))
+        p.bbox().enlarge_pt(1)
+        self.assertEqual(p.bbox().highrestuple_pt(), (0, 0, 1, 2))
+        p.append(lineto_pt(3, -1))
+        self.assertEqual(p.bbox().highrestuple_pt(), (0, -1, 3, 2))
+        p.extend([lineto_pt(4, 0)])
+        self.assertEqual(p.bbox().highrestuple_pt(), (0, -1, 4, 2))
+        p += line_pt(0, 0, 0, 5)
+        self.assertEqual(p.bbox().highrestuple_pt(), (0, -1, 4, 5))
+        nsp = p.normpath()[0]
+        nsp.bbox().enlarge_pt(1)
+        self.assertEqual(nsp.bbox().highrestuple_pt(), (0, -1, 4, 2))
+
+    def testsimplified(self):
+        points = [(0.01*i, 0.001*(i % 2)) for i in range(1, 1001)] + [(10, 5), (10.001, 10)]
+        p = path(moveto_pt(0, 0), multilineto_pt(points), curveto_pt(10, 12, 12, 12, 12, 10), lineto_pt(11, 5), closepath())
+        np = p.normpath().simplified_pt(0.01)
+        self.assertAlmostEqualNormpath(np, normpath([normsubpath([normline_pt(0, 0, 10, 0),
+                                                                  normline_pt(10, 0, 10.001, 10),
+                                                                  normcurve_pt(10.001, 10, 10, 12, 12, 12, 12, 10),
+                                                                  normline_pt(12, 10, 11, 5),
+                                                                  normline_pt(11, 5, 0, 0)], closed=1)]))
+        self.assertIs(np[0][2], p.normpath()[0][1002])
+        self.assertAlmostEqualNormpath(deformer.simplified(0.01*unit.t_pt).deform(p), np)
+        np = normpath([normsubpath([normline_pt(0, 0, 1, 0), normline_pt(1, 0, 1, 0.001), normline_pt(1, 0.001, 0, 0)], closed=1)])
+        self.assertEqual(len(np.simplified_pt(1)[0]), 3)
+        np = normpath([normsubpath([normcurve_pt(0, 0, 1, 0.001, 2, 0, 3, 0), normline_pt(3, 0, 4, 0)])])
+        self.assertAlmostEqualNormpath(np.simplified_pt(0.01), normpath([normsubpath([normline_pt(0, 0, 4, 0)])]))
+        self.assertEqual(p.returnSVGdata(simplify=0.01), "M0 0L10 -0L10.001 -10C10 -12 12 -12 12 -10L11 -5Z")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,148 @@
+import sys
+if sys.path[0] != "../..":
+    sys.path.insert(0, "../..")
+
+import io, re, struct, unittest
+
+from pyx import bitmap, canvas, document, path, pdfwriter
+
+
+def pdfdocument(*lines):
+    pages = []
+    for x in lines:
+        c = canvas.canvas()
+        c.stroke(path.line(0, 0, x, 1))
+        pages.append(document.page(c))
+    return document.document(pages)
+
+
+class PDFwriterTestCase(unittest.TestCase):
+
+    def testAppend(self):
+        file = io.BytesIO()
+        pdfdocument(1, 2).writePDFfile(file, compress=False)
+        original = file.getvalue()
+        previous = pdfwriter.PDFprevious(io.BytesIO(original))
+        self.assertEqual(len(previous.pagerefnos), 2)
+
+        pdfdocument(3).writePDFfile(file, compress=False, append=True)
+        updated = file.getvalue()
+        # the previous file including its cross-reference section is kept
+        self.assertEqual(updated[:len(original)], original)
+        reader = pdfwriter.PDFprevious(io.BytesIO(updated))
+        self.assertEqual(len(reader.xrefs), 2)
+        self.assertEqual(reader.xrefs[1], previous.xrefs[0])
+        self.assertEqual(reader.getint(reader.trailer, b"Prev"), previous.xrefpos)
+        self.assertGreater(reader.xrefpos, len(original))
+        # the page, its contents and resources are added as new objects
+        self.assertEqual(sorted(reader.xrefs[0]),
+                         sorted([previous.catalogrefno, previous.pagesrefno] + list(range(previous.size, reader.size))))
+        self.assertGreater(reader.size, previous.size + 1)
+        self.assertEqual((reader.catalogrefno, reader.pagesrefno), (previous.catalogrefno, previous.pagesrefno))
+        self.assertEqual(reader.pagerefnos[:2], previous.pagerefnos)
+        self.assertEqual(len(reader.pagerefnos), 3)
+        self.assertIn(b"/Count 3", reader.readobject(reader.pagesrefno))
+        # without new document information the previous one is kept
+        self.assertEqual(reader.inforefno, previous.inforefno)
+        for refno, offset in reader.xrefs[0].items():
+            self.assertTrue(updated.startswith(b"%i 0 obj\n" % refno, offset))
+
+    def testAppendInfo(self):
+        file = io.BytesIO()
+        pdfdocument(1).writePDFfile(file, title="first")
+        previous = pdfwriter.PDFprevious(io.BytesIO(file.getvalue()))
+        pdfdocument(2).writePDFfile(file, title="second", author="someone", append=True)
+        reader = pdfwriter.PDFprevious(io.BytesIO(file.getvalue()))
+        self.assertEqual(reader.inforefno, reader.size - 1)
+        self.assertNotEqual(reader.inforefno, previous.inforefno)
+        info = reader.readobject(reader.inforefno)
+        self.assertIn(b"/Title (second)", info)
+        self.assertIn(b"/Author (someone)", info)
+        self.assertIn(b"/Title (first)", reader.readobject(previous.inforefno))
+
+    def testAppendErrors(self):
+        self.assertRaises(ValueError, pdfdocument(1).writePDFfile, io.BytesIO(), append=True, linearize=True)
+        self.assertRaises(ValueError, pdfdocument(1).writePDFfile, io.BytesIO(b"%PDF-1.4\n"), append=True)
+
+    def testLinearized(self):
+        image = bitmap.image(2, 2, "L", b"\0\1\2\3")
+        pages = []
+        for x in range(3):
+            c = canvas.canvas()
+            c.stroke(path.line(0, 0, x+1, 1))
+            if x:
+                # an image shared by the second and third page
+                c.insert(bitmap.bitmap(0, 0, image, height=1))
+            pages.append(document.page(c))
+        file = io.BytesIO()
+        document.document(pages).writePDFfile(file, compress=False, linearize=True)
+        data = file.getvalue()
+
+        linearized = re.match(br"%PDF-1.4\n%[^\n]*\n(\d+) 0 obj\n<< /Linearized 1 /L (\d+) /H \[ (\d+) (\d+) \] "
+                              br"/O (\d+) /E (\d+) /N (\d+) /T (\d+) >>\nendobj\n", data)
+        linearizedrefno, L, H0, H1, O, E, N, T = map(int, linearized.groups())
+        self.assertEqual(L, len(data))
+        self.assertEqual(N, 3)
+
+        # the first-page cross-reference section follows the linearization
+        # dictionary and its trailer refers to the main cross-reference section
+        reader = pdfwriter.PDFprevious(io.BytesIO(data))
+        self.assertEqual(reader.xrefpos, linearized.end())
+        firstxref, mainxref = reader.xrefs
+        self.assertEqual(min(firstxref), linearizedrefno)
+        self.assertEqual(max(firstxref), reader.size - 1)
+        # /T is the end of the first line of the main cross-reference section
+        mainxrefpos = reader.getint(reader.trailer, b"Prev")
+        subsection = b"xref\n0 %i" % (len(mainxref) + 1)
+        self.assertTrue(data.startswith(subsection + b"\n0000000000 65535 f ", mainxrefpos))
+        self.assertEqual(T, mainxrefpos + len(subsection))
+        for xref in firstxref, mainxref:
+            for refno, offset in xref.items():
+                self.assertTrue(data.startswith(b"%i 0 obj\n" % refno, offset))
+
+        # /O is the first page, which is part of the first-page section
+        self.assertEqual(O, reader.pagerefnos[0])
+        self.assertIn(O, firstxref)
+        self.assertEqual(set(reader.pagerefnos[1:]) & set(firstxref), set())
+        # the catalog, the hint stream, and the first-page objects come before /E
+        self.assertEqual(reader.catalogrefno, linearizedrefno + 1)
+        self.assertEqual(firstxref[linearizedrefno + 2], H0)
+        self.assertTrue(data.startswith(b"%i 0 obj\n" % (linearizedrefno + 2), H0))
+        self.assertTrue(data.endswith(b"endobj\n", 0, H0 + H1))
+        self.assertLess(max(firstxref.values()), E)
+        self.assertEqual(min(mainxref.values()), E)
+        # the objects of the remaining pages come in the order of the pages,
+        # followed by the shared image
+        pageoffsets = [mainxref[refno] for refno in reader.pagerefnos[1:]]
+        self.assertEqual(pageoffsets, sorted(pageoffsets))
+        imageoffset = max(offset for offset in mainxref.values() if offset < data.index(b"/Subtype /Image"))
+        self.assertGreater(imageoffset, max(pageoffsets))
+
+        # page offset hint table: the least number of objects per page and
+        # the offset of the first page object (as if the hint stream is absent)
+        hint = reader.readrawobject(linearizedrefno + 2)
+        self.assertEqual(len(hint[1]), reader.getint(hint[0], b"Length"))
+        self.assertLess(reader.getint(hint[0], b"S"), len(hint[1]))
+        nobjects, firstpageoffset = struct.unpack(">II", hint[1][:8])
+        bounds = pageoffsets + [imageoffset]
+        pagenobjects = [len([offset for offset in mainxref.values() if start <= offset < end])
+                        for start, end in zip(bounds[:-1], bounds[1:])]
+        self.assertEqual(nobjects, min([len(firstxref) - 3] + pagenobjects))
+        self.assertEqual(firstpageoffset, firstxref[O] - H1)
+
+    def testBitwriter(self):
+        writer = pdfwriter._bitwriter()
+        writer.write(5, 3)
+        writer.write(1, 1)
+        writer.write(0x3ff, 10)
+        self.assertRaises(AssertionError, writer.getvalue)
+        writer.flush()
+        self.assertEqual(writer.getvalue(), bytes([0b10111111, 0b11111100]))
+        writer.write(0x12345678, 32)
+        writer.write(0, 0)
+        self.assertEqual(writer.getvalue(), bytes([0b10111111, 0b11111100, 0x12, 0x34, 0x56, 0x78]))
+        self.assertRaises(AssertionError, writer.write, 4, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
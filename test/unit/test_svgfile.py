@@ -0,0 +1,53 @@
+import sys
+if sys.path[0] != "../..":
+    sys.path.insert(0, "../..")
+
+import io, os, unittest
+
+from pyx import canvas, svgfile
+from tempfiles import samenamefiles
+
+
+svg = ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="%d" height="%d">'
+       '<rect width="5" height="5" fill="red"/><path id="p" d="M0 0L5 5" stroke="blue"/><use xlink:href="#p" x="2"/>'
+       '</svg>')
+
+
+def output(filename, parsed):
+    c = canvas.canvas()
+    c.insert(svgfile.svgfile_pt(0, 0, filename, parsed=parsed))
+    svgoutput = io.BytesIO()
+    c.writeSVGfile(svgoutput)
+    if not parsed:
+        return svgoutput.getvalue()
+    epsoutput = io.BytesIO()
+    c.writeEPSfile(epsoutput)
+    return svgoutput.getvalue(), epsoutput.getvalue()
+
+
+class SVGfileTestCase(unittest.TestCase):
+
+    def testCacheRelativeFilename(self):
+        with samenamefiles("test.svg", [svg % (10, 10), svg % (20, 20)]) as (dir1, dir2):
+            os.chdir(dir1)
+            self.assertAlmostEqual(svgfile.svgfile_pt(0, 0, "test.svg").bbox().width_pt(), 7.5)
+            os.chdir(dir2)
+            self.assertAlmostEqual(svgfile.svgfile_pt(0, 0, "test.svg").bbox().width_pt(), 15)
+
+    def testCacheHit(self):
+        with samenamefiles("test.svg", [svg % (10, 10)]) as (dir,):
+            os.chdir(dir)
+            for parsed in [False, True]:
+                svgfile._parse.cache_clear()
+                fresh = output("test.svg", parsed)
+                # the SAX events recorded for an unparsed file are replayed
+                # and the parsed canvas is reused, respectively
+                cached = output(os.path.join(dir, "test.svg"), parsed)
+                self.assertEqual(svgfile._parse.cache_info().hits, 1)
+                self.assertEqual(svgfile._parse.cache_info().misses, 1)
+                self.assertEqual(cached, fresh)
+            self.assertIn(b'<rect width="5" height="5" fill="red"/>', output("test.svg", False))
+
+
+if __name__ == "__main__":
+    unittest.main()
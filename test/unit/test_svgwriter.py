@@ -0,0 +1,54 @@
+import sys
+if sys.path[0] != "../..":
+    sys.path.insert(0, "../..")
+
+import io, unittest
+
+from pyx import svgwriter
+
+
+class SVGGeneratorTestCase(unittest.TestCase):
+
+    def testElements(self):
+        file = io.BytesIO()
+        g = svgwriter.SVGGenerator(file)
+        g.startSVGDocument()
+        g.startSVGElement("svg", {"version": "1.1"})
+        g.startSVGElement("g", {"fill": "none"})
+        g.startSVGElement("path", {"d": "M0 0", "title": "<\"a\" & 'b'>"})
+        g.endSVGElement("path")
+        g.startSVGElement("use", {"xlink:href": "#p"})
+        g.endSVGElement("use")
+        g.endSVGElement("g")
+        g.startSVGElement("text", {})
+        g.startSVGElement("tspan", {"x": "1"})
+        g.characters("x<y")
+        g.endSVGElement("tspan")
+        g.endSVGElement("text")
+        g.startSVGElement("g", {})
+        g.newline_and_tell()
+        g.endSVGElement("g")
+        g.endSVGElement("svg")
+        g.endSVGDocument()
+        self.assertTrue(g.xlink_used)
+        self.assertEqual(file.getvalue().decode("utf-8"),
+                         '<?xml version="1.0" encoding="utf-8"?>\n'
+                         '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1">\n'
+                         ' <g fill="none">\n'
+                         '  <path d="M0 0" title="&lt;&quot;a&quot; &amp; \'b\'&gt;"/>\n'
+                         '  <use xlink:href="#p"/>\n'
+                         ' </g>\n'
+                         ' <text><tspan x="1">x&lt;y</tspan></text>\n'
+                         ' <g>\n'
+                         '</g>\n'
+                         '</svg>\n')
+
+    def testXlinkDisabled(self):
+        g = svgwriter.SVGGenerator(io.BytesIO(), xlink=False)
+        g.startSVGDocument()
+        g.startSVGElement("svg", {})
+        self.assertRaises(ValueError, g.startSVGElement, "use", {"xlink:href": "#p"})
+
+
+if __name__ == "__main__":
+    unittest.main()